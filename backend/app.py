@@ -1,17 +1,56 @@
-from llm_services.bot import tutor, quiz, ask_chatbot
-from llm_services.outline import create_outline, merge_outlines
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+import logging
+import os
+
+# Configure logging before the service modules log their import-time setup
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
+
+from llm_services.bot import tutor, quiz, quiz_batch, ask_chatbot
+from llm_services.outline import create_outline, merge_outlines, init_agent
+from llm_services.cluster_outline import cluster_outline
+from llm_services.pregen import pregenerator, lesson_key
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from typing import List, Optional
 import tempfile
-import os
 import shutil
 import asyncio
 import json
-import re
+import time
 from loaders.multiple_file import load_directory
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import StreamingResponse, Response
+from starlette.routing import Match
+from tools.metrics import current_endpoint, REQUEST_SECONDS, record_payload, register_stats, render_latest
+from tools.image_pipeline import pipeline_stats
+from loaders import youtube_transcripts
+from tools.single_flight import SingleFlight, normalize_text
+from tools.vector_store import corpus_version
+from tools import vector_store, source_registry, image_store, subtopic_index, course_store, profiling
+from tools.course_store import CourseVersionConflict
+from tools.outline_tool import DocumentOutline
+from tools.model import route_metrics
+from tools.deadline import DISCONNECT, RequestDeadlineMiddleware, load_deadlines, request_budget
+from contextlib import asynccontextmanager
+from tools.llm_scheduler import BULK, INTERACTIVE, chat_scheduler, embedding_scheduler, llm_priority, set_llm_user
+
+logger = logging.getLogger(__name__)
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients are created per worker process after it starts (uvicorn --workers N),
+    # never inherited across a fork; shared state lives in the local database
+    await asyncio.to_thread(vector_store.connect)
+    init_agent()
+    yield
+    await pregenerator.stop()
+    vector_store.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration - must be added before routes
 app.add_middleware(
@@ -23,51 +62,98 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Compress JSON bodies above GZIP_MIN_BYTES (lessons, outlines, quiz batches); images are
+# already compressed and are skipped. Added before the middlewares below, so response
+# sizes are recorded as sent
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=int(os.getenv("GZIP_MIN_BYTES", "1024")),
+    compresslevel=int(os.getenv("GZIP_LEVEL", "6")),
+)
+
+# Image IDs are content hashes: a URL's bytes never change
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Requests a student is waiting on; background pre-generation yields to these
+INTERACTIVE_PATHS = ("/tutor", "/quizes", "/chatbot")
+
+
+@app.middleware("http")
+async def track_interactive_requests(request: Request, call_next):
+    if request.url.path in INTERACTIVE_PATHS:
+        llm_priority.set(INTERACTIVE)
+        with pregenerator.interactive():
+            return await call_next(request)
+    llm_priority.set(BULK)
+    return await call_next(request)
+
+
+def _route_label(scope) -> str:
+    """Route template (e.g. "/tutor") so metric labels stay low-cardinality."""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    endpoint = _route_label(request.scope)
+    token = current_endpoint.set(endpoint)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if response.headers.get("content-length"):
+            record_payload("response", int(response.headers["content-length"]))
+        return response
+    finally:
+        budget = request_budget.get()
+        if budget is not None and budget.reason is not None:
+            # 499: the client went away (nginx's convention); 504: past the deadline
+            status = 499 if budget.reason == DISCONNECT else 504
+        elapsed = time.perf_counter() - start
+        REQUEST_SECONDS.labels(endpoint, str(status)).observe(elapsed)
+        logger.info("request endpoint=%s status=%s seconds=%.3f", endpoint, status, elapsed)
+        current_endpoint.reset(token)
+
+
+# Every request gets a deadline and is cancelled when its client disconnects
+app.add_middleware(RequestDeadlineMiddleware, deadlines=load_deadlines(), label=_route_label)
+
+# Outermost: on-demand request profiling, only installed when PROFILE_TOKEN or PROFILE_SAMPLE_RATE is set
+if profiling.PROFILING_ENABLED:
+    app.add_middleware(profiling.RequestProfilerMiddleware, label=_route_label)
+
+
+# Identical in-flight /tutor and /quizes requests (e.g. a class opening the same
+# course, or client retries) share one generation
+tutor_flight = SingleFlight("tutor")
+quiz_flight = SingleFlight("quiz")
+
+register_stats("pregen", pregenerator.report)
+register_stats("tutor_single_flight", tutor_flight.report)
+register_stats("quiz_single_flight", quiz_flight.report)
+register_stats("image_pipeline", lambda: pipeline_stats)
+register_stats("youtube_transcripts", youtube_transcripts.report)
+register_stats("llm_scheduler", chat_scheduler.report)
+register_stats("embedding_scheduler", embedding_scheduler.report)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint."""
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
 # query ="""topic: Algebra of Complex Numbers ,subtopic : Multiplication"""
 # tutor(query)
 # # create_outline()
 # from loaders.multiple_file import save_directory
 # save_directory('./documents')
 
-import json
-
-def clean_and_parse_json(ai_response_text):
-    """Parse JSON from AI response with robust error handling."""
-    if not ai_response_text:
-        print("JSON Error: Empty response from AI")
-        return None
-    
-    # 1. Remove the "```json" from the start
-    clean_text = ai_response_text.replace("```json", "")
-    
-    # 2. Remove the "```" from the end
-    clean_text = clean_text.replace("```", "")
-    
-    # 3. Strip leading/trailing whitespace
-    clean_text = clean_text.strip()
-    
-    # 4. Try to extract JSON if wrapped in other text
-    if not clean_text.startswith('{') and not clean_text.startswith('['):
-        # Try to find JSON object or array in the text
-        json_match = re.search(r'(\{[\s\S]*\}|\[[\s\S]*\])', clean_text)
-        if json_match:
-            clean_text = json_match.group(1)
-    
-    # 5. Escape all backslashes to handle LaTeX and other escapes
-    clean_text = clean_text.replace('\\', '\\\\')
-    
-    # 6. Parse
-    try:
-        return json.loads(clean_text)
-    except json.JSONDecodeError as e:
-        print(f"JSON Error: {e}")
-        print(f"Problematic text (first 500 chars): {clean_text[:500]}")
-        return None
-
-# usage:
-# raw_ai_response = client.chat.completions.create(...)
-# lesson_data = clean_and_parse_json(raw_ai_response)
-
 @app.get("/")
 def read_root():
     return {"message": "Hello from FastAPI!"}
@@ -82,62 +168,149 @@ class Query(BaseModel):
 class QueryB(BaseModel):
     text: str
     user_id: str
+    session_id: Optional[str] = None  # Keeps conversation history server-side
 
 class QuizQuery(BaseModel):
     text: str
     user_id: str
     question_count: int = 5  # Default to 5 questions
 
+class BatchQuizQuery(BaseModel):
+    user_id: str
+    topics: Optional[List[str]] = None  # Ready-made topic texts
+    outline: Optional[dict] = None  # Or a full outline ({"topics": [...]}) to expand
+    question_count: int = 5
+
+
+def outline_to_quiz_topics(outline: dict) -> List[str]:
+    """Expand an outline into the same topic texts the course page sends to /quizes."""
+    return subtopic_index.outline_queries(outline)
+
 
 
 @app.post("/quizes")
 async def quizes(payload: QuizQuery):
+    set_llm_user(payload.user_id)
     try:
-        cards = await quiz(payload.text, payload.user_id, payload.question_count)
+        version = await asyncio.to_thread(corpus_version, payload.user_id)
+        key = (payload.user_id, version, normalize_text(payload.text), payload.question_count)
+        cards = await quiz_flight.run(key, lambda: quiz(payload.text, payload.user_id, payload.question_count))
     except ValueError as e:
         # Handle missing documents or empty content
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Quiz generation error: {e}")
+        logger.error("Quiz generation error: %s", e)
         raise HTTPException(status_code=500, detail="An error occurred while generating the quiz. Please try again.")
     
-    result = clean_and_parse_json(cards)
-    if result is None:
+    if cards is None:
         raise HTTPException(status_code=500, detail="Failed to parse quiz content. The AI response was not valid JSON.")
     
-    # Validate quiz structure
-    if not isinstance(result, dict) or 'flashcards' not in result:
-        raise HTTPException(status_code=500, detail="Invalid quiz format received from AI.")
-    
-    if len(result.get('flashcards', [])) == 0:
+    if len(cards.get('flashcards', [])) == 0:
         raise HTTPException(status_code=500, detail="No quiz questions were generated. Please try again.")
     
-    return result
+    return cards
+
+
+@app.post("/quizes/batch")
+async def quizes_batch(payload: BatchQuizQuery):
+    """
+    Generate quizzes for a whole course in one job.
+    Streams newline-delimited JSON, one line per topic as soon as it finishes.
+    """
+    set_llm_user(payload.user_id)
+    topics = list(payload.topics or [])
+    if payload.outline:
+        topics.extend(outline_to_quiz_topics(payload.outline))
+    if not topics:
+        raise HTTPException(status_code=400, detail="Provide topics or an outline.")
+
+    async def stream():
+        async for index, topic, result in quiz_batch(topics, payload.user_id, payload.question_count):
+            if isinstance(result, Exception):
+                logger.error("Batch quiz error for '%s': %s", topic, result)
+                status = 400 if isinstance(result, ValueError) else 500
+                line = {"index": index, "topic": topic, "status": status, "detail": str(result) if status == 400 else "Quiz generation failed."}
+            elif not result or not result.get("flashcards"):
+                line = {"index": index, "topic": topic, "status": 500, "detail": "No quiz questions were generated."}
+            else:
+                line = {"index": index, "topic": topic, "status": 200, "quiz": result}
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 @app.post("/tutor")
 async def tutor_endpoint(payload: Query):
-    data = await tutor(payload.text, payload.adapt, payload.analogy, payload.user_id)
-    print(payload)
-    result = clean_and_parse_json(data)
+    cached = await asyncio.to_thread(pregenerator.lookup, payload.user_id, payload.text, payload.adapt, payload.analogy)
+    if cached is not None:
+        return cached
+    set_llm_user(payload.user_id)
+    start = time.perf_counter()
+    version = await asyncio.to_thread(corpus_version, payload.user_id)
+    key = (payload.user_id, version, lesson_key(payload.text, payload.adapt, payload.analogy))
+    result = await tutor_flight.run(key, lambda: tutor(payload.text, payload.adapt, payload.analogy, payload.user_id))
+    await asyncio.to_thread(pregenerator.record_miss, time.perf_counter() - start)
     if result is None:
         raise HTTPException(status_code=500, detail="Failed to generate lesson content")
     return result
 
+@app.get("/images/{image_id}")
+def get_image(image_id: str, request: Request):
+    """Lesson image by ID; revalidates with If-None-Match and is otherwise cached indefinitely."""
+    etag = f'"{image_id}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    image = image_store.get_image(image_id)
+    if image is None:
+        raise HTTPException(status_code=404, detail=f"Unknown image '{image_id}'")
+    mime, data = image
+    return Response(content=data, media_type=mime, headers=headers)
+
+
 @app.post('/chatbot')    
 async def chatbot(payload: QueryB):
-    data = await ask_chatbot(payload.text, payload.user_id)
-    print(data)
+    set_llm_user(payload.user_id)
+    data = await ask_chatbot(payload.text, payload.user_id, payload.session_id)
     return data
     
 
 
+# "map_reduce": the LLM reads the (pre-summarized) sources; "cluster": embedding
+# clusters of the stored chunks, named by the LLM (llm_services/cluster_outline.py)
+OUTLINE_MODE = os.getenv("OUTLINE_MODE", "map_reduce")
+OUTLINE_MODES = ("map_reduce", "cluster")
+
+
+def _course_response(course: Optional[dict]):
+    """An outline as /upload_pdfs and /update_outline return it, with its course ID and version."""
+    if course is None:
+        return None
+    return {**course["outline"], "course_id": course["course_id"], "version": course["version"]}
+
+
+async def _outline_and_load(temp_dir: str, youtube_urls: List[str], user_id: str, mode: str):
+    """
+    Build the outline and ingest the sources; cluster mode needs the chunks
+    stored first. Returns the outline and the registry IDs of the sources.
+    """
+    if mode == "cluster":
+        loaded = await load_directory(temp_dir, youtube_urls, user_id)
+        return await cluster_outline(user_id, loaded["source_ids"]), loaded["source_ids"]
+    data = await create_outline(temp_dir, youtube_urls, user_id)
+    loaded = await load_directory(temp_dir, youtube_urls, user_id)
+    return data, loaded["source_ids"]
+
+
 @app.post("/upload_pdfs")
 async def upload_pdfs(
     files: List[UploadFile] = File(None), 
     urls: str = Form(None),
-    user_id: str = Form(...)
+    user_id: str = Form(...),
+    analogy: str = Form(None),
+    outline_mode: str = Form(None)
 ):
+    set_llm_user(user_id)
     youtube_urls = []
     if urls:
         # Assume URLs are comma-separated; split and strip whitespace
@@ -146,9 +319,12 @@ async def upload_pdfs(
     if not files and not youtube_urls:
         raise HTTPException(status_code=400, detail="No files or URLs provided.")
 
+    mode = outline_mode or OUTLINE_MODE
+    if mode not in OUTLINE_MODES:
+        raise HTTPException(status_code=400, detail=f"outline_mode must be one of {', '.join(OUTLINE_MODES)}.")
+
     # Create a temporary directory only if files are uploaded
     temp_dir = None
-    saved_files = []
 
     if files:
         temp_dir = tempfile.mkdtemp(prefix="uploaded_pdfs_")
@@ -163,11 +339,9 @@ async def upload_pdfs(
                 file_path = os.path.join(temp_dir, file.filename)
                 with open(file_path, "wb") as f:
                     f.write(contents)
-                saved_files.append(file.filename)
 
             # Pass the temp_dir and user_id to processing functions
-            data = await create_outline(temp_dir, youtube_urls, user_id)
-            result = await load_directory(temp_dir, youtube_urls, user_id)
+            data, source_ids = await _outline_and_load(temp_dir, youtube_urls, user_id, mode)
             
         finally:
             # Clean up temp directory after processing
@@ -177,13 +351,38 @@ async def upload_pdfs(
         # Only YouTube URLs provided
         temp_dir = tempfile.mkdtemp(prefix="youtube_only_")
         try:
-            data = await create_outline(temp_dir, youtube_urls, user_id)
-            result = await load_directory(temp_dir, youtube_urls, user_id)
+            data, source_ids = await _outline_and_load(temp_dir, youtube_urls, user_id, mode)
         finally:
             if temp_dir:
                 shutil.rmtree(temp_dir, ignore_errors=True)
     
-    return data
+    if data is None:
+        return None
+    # Kept server-side: later merges and edits refer to the course by ID
+    course = await asyncio.to_thread(course_store.create_course, user_id, data, source_ids)
+    # Lessons and quizzes for the outline's subtopics fetch their chunks by ID
+    await asyncio.to_thread(subtopic_index.build, user_id, course["course_id"], data)
+    # Warm the lesson store for the new outline in reading order (if enabled)
+    pregenerator.schedule_outline(user_id, data, analogy=analogy or "")
+    return _course_response(course)
+
+
+@app.get("/scheduler/stats")
+def scheduler_stats():
+    """Admission counts, queueing delay per priority class and 429 backoff state."""
+    return {"chat": chat_scheduler.report(), "embeddings": embedding_scheduler.report()}
+
+
+@app.get("/models/routes")
+def model_routes():
+    """Each workload route's model settings with its calls, errors, latency and estimated cost so far."""
+    return route_metrics.report()
+
+
+@app.get("/pregen/stats")
+def pregen_stats():
+    """Pre-generation hit rate and the cold-start latency it avoided."""
+    return pregenerator.report()
 
 
 @app.post("/update_outline")
@@ -191,12 +390,20 @@ async def update_outline(
     files: List[UploadFile] = File(None), 
     urls: str = Form(None),
     user_id: str = Form(...),
-    existing_outline: str = Form(...)
+    existing_outline: str = Form(None),
+    analogy: str = Form(None),
+    course_id: str = Form(None),
+    base_version: int = Form(None)
 ):
     """
     Update an existing outline with new files/URLs.
     Uses LLM-assisted merging to intelligently combine content.
+    With `course_id` the merge starts from the course's stored latest version
+    (`base_version`, when given, must still be the latest) and is saved as
+    its next version. `existing_outline` is only needed for outlines the
+    server does not hold; their merge result is saved as a new course.
     """
+    set_llm_user(user_id)
     youtube_urls = []
     if urls:
         youtube_urls = [url.strip() for url in urls.split(",") if url.strip()]
@@ -204,14 +411,26 @@ async def update_outline(
     if not files and not youtube_urls:
         raise HTTPException(status_code=400, detail="No new files or URLs provided.")
 
-    # Parse existing outline
-    try:
-        existing_outline_data = json.loads(existing_outline)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid existing_outline JSON.")
+    course = None
+    if course_id:
+        course = await asyncio.to_thread(course_store.get_course, course_id, user_id)
+        if course is None:
+            raise HTTPException(status_code=404, detail=f"Course '{course_id}' not found.")
+        if base_version is not None and base_version != course["version"]:
+            raise HTTPException(
+                status_code=409, detail=f"Course '{course_id}' is at version {course['version']}, not {base_version}."
+            )
+        existing_outline_data = course["outline"]
+    elif existing_outline:
+        # Parse existing outline
+        try:
+            existing_outline_data = json.loads(existing_outline)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Invalid existing_outline JSON.")
+    else:
+        raise HTTPException(status_code=400, detail="Provide course_id or existing_outline.")
 
     temp_dir = None
-    saved_files = []
 
     if files:
         temp_dir = tempfile.mkdtemp(prefix="update_pdfs_")
@@ -226,7 +445,6 @@ async def update_outline(
                 file_path = os.path.join(temp_dir, file.filename)
                 with open(file_path, "wb") as f:
                     f.write(contents)
-                saved_files.append(file.filename)
 
             # Merge outlines and add new documents
             merged_outline = await merge_outlines(temp_dir, youtube_urls, existing_outline_data, user_id)
@@ -245,4 +463,152 @@ async def update_outline(
             if temp_dir:
                 shutil.rmtree(temp_dir, ignore_errors=True)
     
-    return merged_outline
\ No newline at end of file
+    if merged_outline is None:
+        return None
+    sources = result["source_ids"]
+    try:
+        if course is None:
+            course = await asyncio.to_thread(course_store.create_course, user_id, merged_outline, sources, "merge")
+        else:
+            course = await asyncio.to_thread(
+                course_store.add_version, course_id, user_id, merged_outline,
+                course["source_ids"] + sources, "merge", course["version"],
+            )
+    except CourseVersionConflict as e:
+        # Another merge or edit won; the new sources are ingested, so a retry skips re-embedding them
+        raise HTTPException(status_code=409, detail=f"Course '{course_id}' changed during the merge (now version {e.latest}).")
+    except KeyError:
+        # Deleted during the merge
+        raise HTTPException(status_code=404, detail=f"Course '{course_id}' not found.")
+    await asyncio.to_thread(subtopic_index.build, user_id, course["course_id"], merged_outline)
+    pregenerator.schedule_outline(user_id, merged_outline, analogy=analogy or "")
+    return _course_response(course)
+
+
+class CourseEdit(BaseModel):
+    user_id: str
+    outline: dict
+    base_version: int  # The version the edit was made on; it must still be the latest
+
+
+@app.get("/courses")
+async def list_courses(user_id: str):
+    """The user's courses, most recently changed first."""
+    return await asyncio.to_thread(course_store.list_courses, user_id)
+
+
+@app.get("/courses/{course_id}")
+async def get_course(course_id: str, user_id: str, version: Optional[int] = None):
+    """A course's outline and source set at `version` (default: latest)."""
+    course = await asyncio.to_thread(course_store.get_course, course_id, user_id, version)
+    if course is None:
+        raise HTTPException(status_code=404, detail=f"Course '{course_id}' or its version {version} not found.")
+    return course
+
+
+@app.get("/courses/{course_id}/versions")
+async def course_versions(course_id: str, user_id: str):
+    """The course's kept versions: what changed them, when, and their topic and source counts."""
+    versions = await asyncio.to_thread(course_store.list_versions, course_id, user_id)
+    if versions is None:
+        raise HTTPException(status_code=404, detail=f"Course '{course_id}' not found.")
+    return versions
+
+
+@app.get("/courses/{course_id}/diff")
+async def course_diff(course_id: str, user_id: str, from_version: Optional[int] = None, to_version: Optional[int] = None):
+    """Topics and sources added, removed or changed between two versions (default: the latest and the one before)."""
+    new = await asyncio.to_thread(course_store.get_course, course_id, user_id, to_version)
+    if new is None:
+        raise HTTPException(status_code=404, detail=f"Course '{course_id}' or its version {to_version} not found.")
+    if from_version is None:
+        if new["version"] == 1:
+            raise HTTPException(
+                status_code=400, detail=f"Course '{course_id}' has no version before version 1 to compare."
+            )
+        from_version = new["version"] - 1
+    old = await asyncio.to_thread(course_store.get_course, course_id, user_id, from_version)
+    if old is None:
+        raise HTTPException(status_code=404, detail=f"Course '{course_id}' has no version {from_version} to compare.")
+    return course_store.diff_versions(old, new)
+
+
+@app.put("/courses/{course_id}")
+async def edit_course(course_id: str, payload: CourseEdit):
+    """Save a client-side edit of the outline (renamed or reordered topics) as the course's next version."""
+    try:
+        outline = DocumentOutline(**payload.outline)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid outline: {e}")
+    course = await asyncio.to_thread(course_store.get_course, course_id, payload.user_id)
+    if course is None:
+        raise HTTPException(status_code=404, detail=f"Course '{course_id}' not found.")
+    try:
+        course = await asyncio.to_thread(
+            course_store.add_version, course_id, payload.user_id, outline,
+            course["source_ids"], "edit", payload.base_version,
+        )
+    except CourseVersionConflict as e:
+        raise HTTPException(status_code=409, detail=f"Course '{course_id}' is at version {e.latest}, not {e.expected}.")
+    except KeyError:
+        # Deleted since the check above
+        raise HTTPException(status_code=404, detail=f"Course '{course_id}' not found.")
+    # Same sources: only new subtopics need indexing and lessons
+    await asyncio.to_thread(subtopic_index.build, payload.user_id, course_id, outline)
+    pregenerator.schedule_outline(payload.user_id, outline)
+    return course
+
+
+@app.delete("/courses/{course_id}")
+async def delete_course(course_id: str, user_id: str):
+    """Forget a course's outline versions; its sources stay indexed (remove them with DELETE /sources/{source_id})."""
+    if not await asyncio.to_thread(course_store.delete_course, course_id, user_id):
+        raise HTTPException(status_code=404, detail=f"Course '{course_id}' not found.")
+    await asyncio.to_thread(subtopic_index.forget, user_id, course_id)
+    return {"course_id": course_id, "deleted": True}
+
+@app.get("/sources")
+def list_sources(user_id: str):
+    """Sources indexed for a user: content hash, chunk count and embedding model of each."""
+    return source_registry.list_sources(user_id)
+
+
+@app.delete("/sources/{source_id}")
+async def remove_source(source_id: str, user_id: str):
+    """Remove one source's chunks from the user's index; the rest of the course is untouched."""
+    if source_registry.get_source(user_id, source_id) is None:
+        raise HTTPException(status_code=404, detail=f"Source '{source_id}' not found.")
+    removed = await asyncio.to_thread(vector_store.delete_source_documents, user_id, source_id)
+    await asyncio.to_thread(subtopic_index.refresh, user_id)
+    return {"source_id": source_id, "removed_chunks": removed}
+
+
+@app.put("/sources/{source_id}")
+async def replace_source(
+    source_id: str,
+    file: UploadFile = File(...),
+    user_id: str = Form(...),
+):
+    """
+    Replace one indexed PDF with a new version. Only chunks that changed are
+    embedded and upserted, and only chunks that disappeared are deleted; the
+    outline is not regenerated (use /update_outline for that).
+    """
+    set_llm_user(user_id)
+    source = source_registry.get_source(user_id, source_id)
+    if source is None:
+        raise HTTPException(status_code=404, detail=f"Source '{source_id}' not found.")
+    if source["kind"] != "file" or file.content_type != "application/pdf":
+        raise HTTPException(status_code=400, detail=f"Source '{source_id}' can only be replaced by a PDF.")
+
+    temp_dir = tempfile.mkdtemp(prefix="replace_pdf_")
+    try:
+        filename = os.path.basename(source_registry.source_name(source_id))
+        with open(os.path.join(temp_dir, filename), "wb") as f:
+            f.write(await file.read())
+        # Diffed against the indexed version of this source
+        result = await load_directory(temp_dir, [], user_id, replace={filename: source_id})
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    await asyncio.to_thread(subtopic_index.refresh, user_id)
+    return {"source_id": source_id, **result}
@@ -1,46 +1,71 @@
-import json
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import os
 import re
-from tools.model import model, vision_model
-from tools.vector_store import search_for_user
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from tools.model import chat_model, use_route
+from tools.structured import generate_structured
+from tools.vector_store import search_for_user, search_batch_for_user
+from tools import subtopic_index
+from tools.lesson_schema import Lesson, FlashcardSet
+from tools.image_pipeline import select_images
+from tools.image_store import image_url, store_data_url
+from tools.metrics import timed, record_tokens, record_payload
+from tools.deadline import request_budget
+from llm_services.chat_memory import prepare_history, condense_question, history_messages, save_turn, summarize_old_turns
 from langchain_core.messages import HumanMessage, SystemMessage
 
+logger = logging.getLogger(__name__)
 
-def _extract_images_from_docs(retrieved_docs):
-    """Extract base64 image data URLs from retrieved documents."""
-    images = []
-    for d in retrieved_docs or []:
-        if hasattr(d, "metadata") and isinstance(d.metadata, dict):
-            images_val = d.metadata.get("images")
-            if images_val:
-                if isinstance(images_val, str):
-                    try:
-                        parsed_images = json.loads(images_val)
-                        if isinstance(parsed_images, list):
-                            images.extend(parsed_images)
-                    except json.JSONDecodeError:
-                        pass
-                elif isinstance(images_val, list):
-                    images.extend(images_val)
-    # Deduplicate while preserving order
-    return list(dict.fromkeys(images))
-
-
-def _extract_image_data_urls(retrieved_docs):
-    """Extract base64 image data URLs from document text content."""
-    data_urls = []
-    pattern = re.compile(r"(data:image/[^;]+;base64,[A-Za-z0-9+/=]+)")
-    for d in retrieved_docs or []:
-        if hasattr(d, "page_content") and d.page_content:
-            data_urls.extend(pattern.findall(d.page_content))
-    return list(dict.fromkeys(data_urls))  # dedupe, preserve order
-
-
-async def ask_chatbot(query: str, user_id: str):
-    """Chat with the AI using user-scoped context."""
-    print(f"Chatbot query for user {user_id}: {query}")
+# Max quiz generations in flight for one /quizes/batch job
+QUIZ_BATCH_CONCURRENCY = int(os.getenv("QUIZ_BATCH_CONCURRENCY", "4"))
+# Quizzes with more questions than QUIZ_PART_QUESTIONS are generated as parallel
+# sub-quizzes over different subtopics; retrieval grows with the question count
+QUIZ_PART_QUESTIONS = int(os.getenv("QUIZ_PART_QUESTIONS", "10"))
+QUIZ_PART_WORKERS = int(os.getenv("QUIZ_PART_WORKERS", "16"))
+QUIZ_CHUNKS_PER_QUESTION = float(os.getenv("QUIZ_CHUNKS_PER_QUESTION", "1.5"))
+QUIZ_MAX_CHUNKS = int(os.getenv("QUIZ_MAX_CHUNKS", "64"))
+# Questions sharing at least this share of their words are near-duplicates
+QUIZ_DUPLICATE_SIMILARITY = 0.8
+
+# Own pool so sub-quizzes run side by side instead of queueing in the small default executor
+_quiz_part_executor = ThreadPoolExecutor(max_workers=max(1, QUIZ_PART_WORKERS), thread_name_prefix="quiz-part")
+
+# Phases the lesson prompt asks for; fewer means the answer was cut short
+LESSON_PHASES = 5
+
+# Fire-and-forget work (chat summarization) kept referenced until it finishes
+_background_tasks = set()
+
+
+def lesson_complete(lesson) -> bool:
+    return len(lesson.lesson_phases) >= LESSON_PHASES
+
+
+async def _summarize_in_background(user_id: str, session_id: str):
+    # Outlives the request: not bound by its deadline or its client
+    request_budget.set(None)
+    await asyncio.to_thread(summarize_old_turns, user_id, session_id)
+
+
+async def ask_chatbot(query: str, user_id: str, session_id: Optional[str] = None):
+    """Chat with the AI using user-scoped context.
+
+    With a session_id the conversation is kept server-side: the prompt carries a
+    rolling summary plus a token-capped window of recent turns, and retrieval
+    runs on the follow-up rewritten as a standalone question, so per-turn cost
+    does not grow with the length of the session.
+    """
+    logger.debug("chatbot query user=%s session=%s chars=%d", user_id, session_id, len(query))
+    summary, turns = await asyncio.to_thread(prepare_history, user_id, session_id)
+    search_query = await asyncio.to_thread(condense_question, query, summary, turns)
     
     # Get user-scoped documents
-    retrieved_docs = search_for_user(query, user_id)
+    retrieved_docs = await asyncio.to_thread(search_for_user, search_query[:2000], user_id)
     docs_content = "\n\n".join(d.page_content for d in retrieved_docs)
     
     system_message = (
@@ -52,14 +77,34 @@ async def ask_chatbot(query: str, user_id: str):
         r"- Use proper LaTeX syntax for fractions, sums, integrals, etc.\n"
         r"- Common symbols: \pi, \theta, \alpha, \beta, \infty, \sum, \int, \frac, \sqrt"
     )
+    if summary:
+        system_message += f"\n\nSummary of the earlier conversation:\n{summary}"
+    messages = [SystemMessage(content=system_message), *history_messages(turns), HumanMessage(content=query)]
+    
+    record_payload("prompt", sum(len(m.text) for m in messages))
+    with use_route("chat"), timed("llm_chat"):
+        response = await asyncio.to_thread(chat_model("chat").invoke, messages)
+    record_tokens("llm_chat", response)
     
-    response = model.invoke([
-        SystemMessage(content=system_message),
-        HumanMessage(content=query)
-    ])
+    if session_id:
+        needs_summary = await asyncio.to_thread(save_turn, user_id, session_id, query, response.text)
+        if needs_summary:
+            # Fold old turns into the summary off the request path
+            task = asyncio.create_task(_summarize_in_background(user_id, session_id))
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
     return response.content
 
 
+def _retrieve(query: str, user_id: str, k: int):
+    """
+    Chunks for a request: by ID from the subtopic index for outline subtopics,
+    else a vector search for the same text the index embeds.
+    """
+    docs = subtopic_index.lookup(user_id, query, k)
+    return docs if docs is not None else search_for_user(query[:2000], user_id, k)  # Truncate for embedding
+
+
 async def tutor(query: str, adapt: str, analogy: str, user_id: str):
     """Get tutor content using user-scoped context with images sent to vision model."""
     query_text = (
@@ -69,34 +114,28 @@ async def tutor(query: str, adapt: str, analogy: str, user_id: str):
     )
     
     # Get user-scoped documents directly
-    retrieved_docs = search_for_user(query_text[:2000], user_id)  # Truncate for embedding
+    retrieved_docs = await asyncio.to_thread(_retrieve, query, user_id, 4)
     docs_content = "\n\n".join(d.page_content for d in retrieved_docs)
     
-    # Extract images from documents
-    images = _extract_images_from_docs(retrieved_docs) or _extract_image_data_urls(retrieved_docs)
-    print(f"Retrieved {len(retrieved_docs)} docs with {len(images)} images for user: {user_id}")
+    # Rank, filter, downscale and budget the images attached to the retrieved chunks
+    with timed("image_select"):
+        images, image_report = await asyncio.to_thread(select_images, retrieved_docs)
+    record_payload("vision_images", image_report["sent_bytes"])
+    logger.info(
+        "tutor retrieved docs=%d images=%d/%d image_bytes=%d original_image_bytes=%d user=%s",
+        len(retrieved_docs), len(images), image_report["candidates"],
+        image_report["sent_bytes"], image_report["original_bytes"], user_id,
+    )
     
     # Build the lesson prompt
     system_prompt = '''Convert the user's notes into a lesson.
-Output ONLY valid JSON matching the structure below.
-
-### STRUCTURE:
-{
-  "topic_title": "Topic Name",
-  "lesson_phases": [
-    {
-      "phase_name": "one for each of these: 1. Concept (Analogy), 2. Toolkit (Formulas), 3. Simple Example, 4. Complex Example, 5. Summary",
-      "steps": [
-        {"narration": "Conversational, explaining the 'why'", "board": "Academic content. Use LaTeX inside $$"}
-      ],
-      "source":"add the exact pages and source info was gotten from"
-    }
-  ]
-}
+Create one phase for each of these, in order: 1. Concept (Analogy), 2. Toolkit (Formulas), 3. Simple Example, 4. Complex Example, 5. Summary.
+Each phase has steps with a conversational "narration" explaining the 'why' and a "board" with the academic content.
+In "source", add the exact pages and source the info was gotten from.
 
 ### CRITICAL MATH FORMATTING RULES:
 1. ALL math expressions MUST be wrapped in $$ for display math or $ for inline math
-2. ALWAYS double-escape backslashes in JSON: \\frac, \\sqrt, \\sum, etc.
+2. Write LaTeX commands with a single backslash: \\frac, \\sqrt, \\sum, etc.
 3. Use proper LaTeX syntax: \\frac{numerator}{denominator}, \\sqrt{expression}
 4. For superscripts: x^{2} or x^2 (curly braces for multi-char)
 5. For subscripts: x_{1} or x_1
@@ -109,49 +148,180 @@ Output ONLY valid JSON matching the structure below.
 '''
     
     full_prompt = f"{system_prompt}\n\nContext:\n{docs_content}\n\nUser Query: {query_text}"
+    record_payload("prompt", len(full_prompt))
     
-    # If we have images, use vision model
+    text_lesson = functools.partial(
+        generate_structured, "lesson", [HumanMessage(content=full_prompt)], Lesson, "llm_lesson", lesson_complete
+    )
+    # If we have images, use vision model, raced against a text-only lesson when it is slow or fails
     if images:
-        print(f"📷 Sending {len(images)} images to vision model")
         content_parts = [{"type": "text", "text": full_prompt}]
-        # Limit to first 5 images to avoid context overflow
-        for img_url in images[:5]:
-            if img_url.startswith("data:"):
-                content_parts.append({
-                    "type": "image_url",
-                    "image_url": {"url": img_url}
-                })
+        for img_url in images:
+            content_parts.append({
+                "type": "image_url",
+                "image_url": {"url": img_url}
+            })
         
-        try:
-            response = vision_model.invoke([HumanMessage(content=content_parts)])
-            raw = response.content
-        except Exception as e:
-            print(f"Vision model error: {e}, falling back to text model")
-            response = model.invoke([HumanMessage(content=full_prompt)])
-            raw = response.content
+        lesson = await asyncio.to_thread(generate_structured, "lesson_vision", [HumanMessage(content=content_parts)], Lesson, "llm_lesson_vision", lesson_complete, text_lesson)
     else:
-        response = model.invoke([HumanMessage(content=full_prompt)])
-        raw = response.content
+        lesson = await asyncio.to_thread(text_lesson)
     
-    # Try to inject images into the response
-    try:
-        cleaned = raw.replace("```json", "").replace("```", "").strip()
-        payload = json.loads(cleaned)
-        if isinstance(payload, dict) and "lesson_phases" in payload:
-            for phase in payload.get("lesson_phases", []):
-                if isinstance(phase, dict):
-                    phase["images"] = images
-            return json.dumps(payload)
-    except Exception:
-        pass  # fallback to original content on parse issues
-    return raw
+    if lesson is None or not lesson.lesson_phases:
+        return None
+    
+    # Images travel once, by ID: phases refer to them and clients load them from /images/{id}
+    image_ids = [i for i in await asyncio.to_thread(lambda: [store_data_url(url) for url in images]) if i]
+    payload = lesson.model_dump()
+    payload["images"] = {image_id: image_url(image_id) for image_id in image_ids}
+    for phase in payload["lesson_phases"]:
+        phase["image_ids"] = image_ids
+    return payload
+
+
+def quiz_retrieval_k(question_count: int) -> int:
+    """Chunks to retrieve for a quiz: 8 for small quizzes, ~1.5 per question for large ones."""
+    return max(8, min(QUIZ_MAX_CHUNKS, math.ceil(question_count * QUIZ_CHUNKS_PER_QUESTION)))
 
 
 async def quiz(query: str, user_id: str, question_count: int = 5):
     """Generate quiz using user-scoped context with configurable question count."""
     # Get user-scoped documents
-    retrieved_docs = search_for_user(query, user_id, k=8)  # Get more docs for larger quizzes
-    
+    retrieved_docs = await asyncio.to_thread(_retrieve, query, user_id, quiz_retrieval_k(question_count))
+    return await _quiz_from_retrieved(query, retrieved_docs, user_id, question_count)
+
+
+async def quiz_batch(queries: List[str], user_id: str, question_count: int = 5, concurrency: int = QUIZ_BATCH_CONCURRENCY):
+    """
+    Generate quizzes for many topics in one job.
+
+    Retrieval for all topics is a single batched search; generation fans out
+    with at most `concurrency` model calls in flight. Yields
+    (index, query, quiz_dict | Exception) as each topic finishes.
+    """
+    k = quiz_retrieval_k(question_count)
+    retrieved = await asyncio.to_thread(lambda: [subtopic_index.lookup(user_id, q, k) for q in queries])
+    # Topics that are not indexed subtopics share one batched search
+    missing = [i for i, docs in enumerate(retrieved) if docs is None]
+    if missing:
+        found = await asyncio.to_thread(search_batch_for_user, [queries[i] for i in missing], user_id, k)
+        for i, docs in zip(missing, found):
+            retrieved[i] = docs
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _one(index, query, docs):
+        async with semaphore:
+            try:
+                result = await _quiz_from_retrieved(query, docs, user_id, question_count)
+            except Exception as e:
+                result = e
+        return index, query, result
+
+    tasks = [asyncio.create_task(_one(i, q, docs)) for i, (q, docs) in enumerate(zip(queries, retrieved))]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away or the consumer stopped early: don't keep generating
+        for task in tasks:
+            task.cancel()
+
+
+def _subtopic_key(doc) -> str:
+    """Section path of a chunk, or its source and 5-page window for chunks without one."""
+    metadata = doc.metadata or {}
+    if metadata.get("section"):
+        return metadata["section"]
+    return f"{metadata.get('source_id') or metadata.get('source')}:{int(metadata.get('page') or 0) // 5}"
+
+
+def partition_by_subtopic(docs, parts: int) -> List[List]:
+    """Group chunks by subtopic and pack the groups into at most `parts` partitions of similar size."""
+    groups: Dict[str, List] = {}
+    for doc in docs:
+        groups.setdefault(_subtopic_key(doc), []).append(doc)
+    ordered = sorted(groups.values(), key=len, reverse=True)
+    # Fewer subtopics than partitions: split the largest ones
+    while len(ordered) < parts and len(ordered[0]) > 1:
+        largest = ordered.pop(0)
+        half = len(largest) // 2
+        ordered = sorted(ordered + [largest[:half], largest[half:]], key=len, reverse=True)
+    bins = [[] for _ in range(min(parts, len(ordered)))]
+    for group in ordered:
+        min(bins, key=len).extend(group)
+    return bins
+
+
+def _allocate_questions(total: int, weights: List[int]) -> List[int]:
+    """Split `total` questions proportionally to `weights` (largest remainder), at least one each."""
+    shares = [total * w / sum(weights) for w in weights]
+    counts = [max(1, int(share)) for share in shares]
+    while sum(counts) < total:
+        counts[max(range(len(counts)), key=lambda i: shares[i] - counts[i])] += 1
+    while sum(counts) > total:
+        counts[max((i for i in range(len(counts)) if counts[i] > 1), key=lambda i: counts[i] - shares[i])] -= 1
+    return counts
+
+
+def _question_words(question: str) -> set:
+    return set(re.findall(r"[a-z0-9]+", question.lower()))
+
+
+def dedupe_flashcards(flashcards: List[dict]) -> List[dict]:
+    """Drop questions whose wording (Jaccard over words) nearly repeats an earlier question."""
+    kept, seen = [], []
+    for card in flashcards:
+        words = _question_words(card.get("question", ""))
+        if any(len(words & other) / max(1, len(words | other)) >= QUIZ_DUPLICATE_SIMILARITY for other in seen):
+            continue
+        kept.append(card)
+        seen.append(words)
+    return kept
+
+
+async def _quiz_from_retrieved(query: str, retrieved_docs, user_id: str, question_count: int):
+    """One generation for small quizzes; parallel per-subtopic sub-quizzes, merged and de-duplicated, for large ones."""
+    if question_count <= QUIZ_PART_QUESTIONS or len(retrieved_docs) < 2:
+        cards = await asyncio.to_thread(_quiz_from_docs, query, retrieved_docs, user_id, question_count)
+        if cards:
+            cards["flashcards"] = dedupe_flashcards(cards["flashcards"])
+        return cards
+
+    partitions = partition_by_subtopic(retrieved_docs, math.ceil(question_count / QUIZ_PART_QUESTIONS))
+    counts = _allocate_questions(question_count, [len(p) for p in partitions])
+    loop = asyncio.get_running_loop()
+
+    def _part(docs, count):
+        sections = sorted({d.metadata["section"] for d in docs if (d.metadata or {}).get("section")})
+        focus = f"{query}\nFocus on: {'; '.join(sections)}" if sections else query
+        # Ask for a few extra questions so near-duplicate removal still leaves enough
+        generate = functools.partial(_quiz_from_docs, focus, docs, user_id, count + max(1, count // 5))
+        # Copy the context so the scheduler still sees the request's priority and user
+        return loop.run_in_executor(_quiz_part_executor, contextvars.copy_context().run, generate)
+
+    results = await asyncio.gather(*(_part(p, n) for p, n in zip(partitions, counts)), return_exceptions=True)
+    parts = [r for r in results if isinstance(r, dict)]
+    if not parts:
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            raise errors[0]
+        return None
+
+    # Each partition contributes its share first, its extra questions only to fill gaps
+    merged, extras = [], []
+    for part, count in zip((r if isinstance(r, dict) else None for r in results), counts):
+        if part:
+            merged.extend(part["flashcards"][:count])
+            extras.extend(part["flashcards"][count:])
+    flashcards = dedupe_flashcards(merged + extras)[:question_count]
+    logger.info(
+        "quiz parts=%d failed=%d questions=%d/%d chunks=%d user=%s",
+        len(partitions), len(results) - len(parts), len(flashcards), question_count, len(retrieved_docs), user_id,
+    )
+    return {"topic_title": parts[0].get("topic_title", ""), "flashcards": flashcards}
+
+
+def _quiz_from_docs(query: str, retrieved_docs, user_id: str, question_count: int = 5):
+    """Build the quiz prompt from already-retrieved documents and generate the flashcards."""
     if not retrieved_docs or len(retrieved_docs) == 0:
         raise ValueError(f"No study materials found for topic '{query}'. Please upload relevant documents first.")
     
@@ -160,26 +330,14 @@ async def quiz(query: str, user_id: str, question_count: int = 5):
     if not docs_content.strip():
         raise ValueError("Retrieved documents have no content. Please upload documents with readable text.")
     
-    print(f"Retrieved {len(retrieved_docs)} docs for quiz ({question_count} questions), user: {user_id}")
+    logger.info("quiz retrieved docs=%d questions=%d user=%s", len(retrieved_docs), question_count, user_id)
     
     system_prompt = f'''Convert the user's notes into a set of quizzes.
-Output ONLY valid JSON matching the structure below.
-
-### STRUCTURE:
-{{
-  "topic_title": "Topic Name",
-  "flashcards": [
-    {{
-      "question": "Question text",
-      "options": ["Option A", "Option B", "Option C", "Option D"],
-      "answer": "Correct option letter"
-    }}
-  ]
-}}
+Each flashcard has a question, 4 options and the correct option letter as the answer.
 
 ### CRITICAL MATH FORMATTING RULES:
 1. ALL math expressions MUST be wrapped in $$ for display or $ for inline
-2. ALWAYS double-escape backslashes: \\frac, \\sqrt, \\sum, etc.
+2. Write LaTeX commands with a single backslash: \\frac, \\sqrt, \\sum, etc.
 3. Example: "What is $$\\frac{{1}}{{2}} + \\frac{{1}}{{3}}$$?"
 4. Example inline: "If $x = 2$, what is $x^{{2}}$?"
 5. Use proper LaTeX for fractions, roots, powers, Greek letters
@@ -194,6 +352,12 @@ Output ONLY valid JSON matching the structure below.
     
     full_prompt = f"{system_prompt}\n\nContext:\n{docs_content}\n\nTopic: {query}"
     
-    response = model.invoke([HumanMessage(content=full_prompt)])
-    return response.content
-
+    record_payload("prompt", len(full_prompt))
+    cards = generate_structured(
+        "quiz", [HumanMessage(content=full_prompt)], FlashcardSet, "llm_quiz",
+        lambda parsed: len(parsed.flashcards) >= question_count,
+    )
+    if cards is None:
+        return None
+    cards.flashcards = cards.flashcards[:question_count]
+    return cards.model_dump()
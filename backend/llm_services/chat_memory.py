@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage
+from tools.local_db import get_connection, init_schema
+from tools.metrics import timed, record_tokens
+from tools.model import chat_model, use_route
+from tools.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Recent turns are kept verbatim up to this many tokens; older turns are folded
+# into a rolling summary capped at CHAT_SUMMARY_TOKENS
+HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "1500"))
+SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "400"))
+# Sessions untouched for this long are deleted
+SESSION_TTL_SECONDS = int(os.getenv("CHAT_SESSION_TTL_SECONDS", str(24 * 3600)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    turns TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, session_id)
+);
+"""
+_schema_ready = False
+# Sessions whose old turns are being summarized right now (one summarizer per session)
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+
+def _db():
+    global _schema_ready
+    if not _schema_ready:
+        init_schema(_SCHEMA)
+        _schema_ready = True
+    return get_connection()
+
+
+def _turn_tokens(turn: Dict) -> int:
+    return estimate_tokens(turn["user"]) + estimate_tokens(turn["assistant"])
+
+
+def load_session(user_id: str, session_id: str) -> Tuple[str, List[Dict]]:
+    """Return (summary, turns) for a session; empty for unknown or expired sessions."""
+    row = _db().execute(
+        "SELECT summary, turns, updated_at FROM chat_sessions WHERE user_id = ? AND session_id = ?",
+        (user_id, session_id),
+    ).fetchone()
+    if row is None or time.time() - row[2] > SESSION_TTL_SECONDS:
+        return "", []
+    return row[0], json.loads(row[1])
+
+
+def recent_window(turns: List[Dict], budget: int = HISTORY_TOKENS) -> List[Dict]:
+    """Newest turns that fit in the token budget (always at least the last turn)."""
+    window, used = [], 0
+    for turn in reversed(turns):
+        used += _turn_tokens(turn)
+        if window and used > budget:
+            break
+        window.append(turn)
+    return window[::-1]
+
+
+def history_messages(turns: List[Dict]) -> List:
+    messages = []
+    for turn in turns:
+        messages.append(HumanMessage(content=turn["user"]))
+        messages.append(AIMessage(content=turn["assistant"]))
+    return messages
+
+
+def condense_question(question: str, summary: str, turns: List[Dict]) -> str:
+    """Rewrite a follow-up ("what about the second one?") as a standalone question for retrieval."""
+    if not summary and not turns:
+        return question
+    transcript = "\n".join(f"Student: {t['user']}\nAssistant: {t['assistant']}" for t in turns[-3:])
+    prompt = (
+        "Rewrite the student's last message as a single standalone question that can be understood "
+        "without the conversation. Reply with the question only.\n\n"
+        f"Earlier conversation summary:\n{summary or '(none)'}\n\n"
+        f"Recent turns:\n{transcript}\n\n"
+        f"Last message: {question}"
+    )
+    with use_route("chat_memory"), timed("llm_condense"):
+        response = chat_model("chat_memory").invoke([HumanMessage(content=prompt)])
+    record_tokens("llm_condense", response)
+    standalone = (response.text or "").strip()
+    return standalone[:2000] or question
+
+
+def save_turn(user_id: str, session_id: str, question: str, answer: str) -> bool:
+    """Append a turn. Returns True when older turns should be folded into the summary."""
+    # A single oversized message must not blow the window on its own
+    max_chars = HISTORY_TOKENS * 2
+    db = _db()
+    # Read and write in one transaction so concurrent turns of a session (other
+    # requests, other workers, the summarizer) never overwrite each other
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        summary, turns = load_session(user_id, session_id)
+        turns.append({"user": question[:max_chars], "assistant": answer[:max_chars]})
+        # Hard cap in case summarization keeps failing: never keep more than 2x the window
+        if sum(_turn_tokens(t) for t in turns) > 2 * HISTORY_TOKENS:
+            turns = recent_window(turns, 2 * HISTORY_TOKENS)
+        db.execute(
+            "INSERT OR REPLACE INTO chat_sessions VALUES (?, ?, ?, ?, ?)",
+            (session_id, user_id, summary, json.dumps(turns), time.time()),
+        )
+        db.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (time.time() - SESSION_TTL_SECONDS,))
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    return len(recent_window(turns)) < len(turns)
+
+
+def summarize_old_turns(user_id: str, session_id: str) -> None:
+    """Fold turns that fell out of the recent window into the rolling summary."""
+    key = (user_id, session_id)
+    with _summarizing_lock:
+        if key in _summarizing:
+            return
+        _summarizing.add(key)
+    try:
+        summary, turns = load_session(user_id, session_id)
+        keep = recent_window(turns)
+        old = turns[:len(turns) - len(keep)]
+        if not old:
+            return
+        transcript = "\n".join(f"Student: {t['user']}\nAssistant: {t['assistant']}" for t in old)
+        prompt = (
+            f"Update the running summary of a tutoring conversation with the turns below. Keep the "
+            f"topics covered, the student's misunderstandings and any decisions, in under "
+            f"{SUMMARY_TOKENS * 3 // 4} words.\n\n"
+            f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"
+        )
+        with use_route("chat_memory"), timed("llm_chat_summary"):
+            response = chat_model("chat_memory").invoke([HumanMessage(content=prompt)])
+        record_tokens("llm_chat_summary", response)
+        new_summary = (response.text or "").strip()[: SUMMARY_TOKENS * 4]
+        db = _db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Re-read: turns may have been appended while we were summarizing
+            latest_summary, latest = load_session(user_id, session_id)
+            folded = latest_summary == summary
+            if folded:
+                # The hard cap may have dropped some of the summarized turns already
+                overlap = next((k for k in range(len(old), 0, -1) if latest[:k] == old[-k:]), 0)
+                db.execute(
+                    "UPDATE chat_sessions SET summary = ?, turns = ?, updated_at = ? WHERE user_id = ? AND session_id = ?",
+                    (new_summary, json.dumps(latest[overlap:]), time.time(), user_id, session_id),
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if folded:
+            logger.debug("summarized chat session=%s folded_turns=%d", session_id, len(old))
+        else:
+            # Another worker folded these turns first; its summary stands
+            logger.debug("chat session=%s changed during summarization; summary discarded", session_id)
+    except Exception as e:
+        logger.warning("Chat summarization failed for session %s: %s", session_id, e)
+    finally:
+        with _summarizing_lock:
+            _summarizing.discard(key)
+
+
+def prepare_history(user_id: str, session_id: Optional[str]) -> Tuple[str, List[Dict]]:
+    """Summary and token-capped recent turns to put in front of the next question."""
+    if not session_id:
+        return "", []
+    summary, turns = load_session(user_id, session_id)
+    return summary, recent_window(turns)
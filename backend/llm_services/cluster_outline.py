@@ -0,0 +1,235 @@
+"""
+Outline from embedding clusters instead of reading the whole corpus.
+
+The user's chunk vectors are already in Qdrant, so the topic structure can be
+found locally: spherical k-means (NumPy, k-means++ seeding) splits the chunks
+into topics and each topic again into subtopics. Clusters are ordered by
+where their chunks sit in the sources, so the outline follows the reading
+order. The LLM only names clusters, from the few chunks nearest each
+centroid, with a handful of parallel calls on the `outline_names` route,
+however large the corpus is.
+"""
+import asyncio
+import logging
+import math
+import os
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from tools.structured import generate_structured
+from tools.extractive import chunk_body
+from tools.outline_tool import DocumentOutline, OutlineNode
+from tools.vector_store import scroll_vectors_for_user
+
+logger = logging.getLogger(__name__)
+
+OUTLINE_MAX_TOPICS = int(os.getenv("OUTLINE_MAX_TOPICS", "12"))
+OUTLINE_MIN_TOPICS = int(os.getenv("OUTLINE_MIN_TOPICS", "4"))
+OUTLINE_MAX_SUBTOPICS = int(os.getenv("OUTLINE_MAX_SUBTOPICS", "6"))
+# Larger corpora are clustered on an even sample of their chunks
+OUTLINE_CLUSTER_MAX_POINTS = int(os.getenv("OUTLINE_CLUSTER_MAX_POINTS", "20000"))
+# Topics named per LLM call
+OUTLINE_TOPICS_PER_CALL = int(os.getenv("OUTLINE_TOPICS_PER_CALL", "4"))
+# Chunks shown to the LLM per topic and per subtopic, and how much of each
+REPRESENTATIVES = 3
+SUB_REPRESENTATIVES = 1
+EXCERPT_CHARS = 600
+KMEANS_ITERATIONS = 25
+
+
+class ClusterName(BaseModel):
+    cluster: int = Field(description="Number of the cluster being named")
+    title: str = Field(description="Short topic title (2-6 words)")
+    summary: str = Field(description="One-sentence summary of the topic")
+    subtopics: list[str] = Field(
+        default_factory=list,
+        description="One short sub-header (1-5 words) per subcluster, in the given order",
+    )
+
+
+class ClusterNames(BaseModel):
+    clusters: list[ClusterName] = Field(description="One entry per cluster")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, seed: int = 0, iterations: int = KMEANS_ITERATIONS) -> np.ndarray:
+    """Cluster labels of L2-normalized `vectors` by cosine k-means with k-means++ seeding."""
+    n = len(vectors)
+    k = min(k, n)
+    if k <= 1:
+        return np.zeros(n, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    centroids = np.empty((k, vectors.shape[1]), dtype=vectors.dtype)
+    centroids[0] = vectors[rng.integers(n)]
+    distance = 1.0 - vectors @ centroids[0]
+    for c in range(1, k):
+        weights = np.maximum(distance, 0) ** 2
+        total = weights.sum()
+        index = rng.choice(n, p=weights / total) if total > 0 else rng.integers(n)
+        centroids[c] = vectors[index]
+        distance = np.minimum(distance, 1.0 - vectors @ centroids[c])
+
+    labels = np.full(n, -1)
+    for _ in range(iterations):
+        similarity = vectors @ centroids.T
+        new_labels = similarity.argmax(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        one_hot = np.zeros((n, k), dtype=vectors.dtype)
+        one_hot[np.arange(n), labels] = 1.0
+        sums = one_hot.T @ vectors
+        counts = one_hot.sum(axis=0)
+        # An empty cluster is reseeded with the point farthest from its centroid
+        for c in np.flatnonzero(counts == 0):
+            farthest = int(similarity[np.arange(n), labels].argmin())
+            sums[c] = vectors[farthest]
+            labels[farthest] = c
+        centroids = _normalize(sums)
+    return labels
+
+
+def _positions(documents) -> np.ndarray:
+    """Reading-order rank of each chunk: source order of first appearance, then page and offset."""
+    source_rank: Dict[str, int] = {}
+    keys = []
+    for doc in documents:
+        metadata = doc.metadata or {}
+        source = metadata.get("source_id") or metadata.get("source") or ""
+        keys.append((
+            source_rank.setdefault(source, len(source_rank)),
+            int(metadata.get("page") or 0),
+            int(metadata.get("start_index") or 0),
+        ))
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    ranks = np.empty(len(keys), dtype=np.int64)
+    ranks[order] = np.arange(len(keys))
+    return ranks
+
+
+def _ordered_clusters(labels: np.ndarray, positions: np.ndarray) -> List[np.ndarray]:
+    """Member indices of each non-empty cluster, clusters sorted by their median reading position."""
+    members = [np.flatnonzero(labels == c) for c in np.unique(labels)]
+    return sorted(members, key=lambda m: float(np.median(positions[m])))
+
+
+def _nearest(vectors: np.ndarray, members: np.ndarray, count: int) -> List[int]:
+    """The `count` members closest to the cluster's mean direction."""
+    centroid = vectors[members].sum(axis=0)
+    scores = vectors[members] @ centroid
+    return [int(members[i]) for i in np.argsort(-scores)[:count]]
+
+
+def _excerpt(doc) -> str:
+    text = " ".join(chunk_body(doc.page_content).split())
+    return text[:EXCERPT_CHARS]
+
+
+def _section_name(documents, members) -> Optional[str]:
+    """Most common section heading among a cluster's chunks (naming fallback)."""
+    sections = Counter(
+        (documents[i].metadata or {}).get("section", "").split(" > ")[-1] for i in members
+    )
+    sections.pop("", None)
+    return sections.most_common(1)[0][0] if sections else None
+
+
+def cluster_corpus(vectors: np.ndarray, documents) -> List[Dict]:
+    """
+    Topic clusters in reading order, each with its subclusters, as dicts of
+    member indices and representative chunk indices.
+    """
+    vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+    positions = _positions(documents)
+    n = len(vectors)
+    k = max(OUTLINE_MIN_TOPICS, min(OUTLINE_MAX_TOPICS, round(math.sqrt(n / 2))))
+    topics = []
+    for t, members in enumerate(_ordered_clusters(spherical_kmeans(vectors, k), positions)):
+        sub_k = max(2, min(OUTLINE_MAX_SUBTOPICS, round(math.sqrt(len(members) / 4))))
+        sub_labels = spherical_kmeans(vectors[members], sub_k, seed=t + 1)
+        subclusters = [members[m] for m in _ordered_clusters(sub_labels, positions[members])]
+        topics.append({
+            "members": members,
+            "representatives": _nearest(vectors, members, REPRESENTATIVES),
+            "subclusters": [
+                {"members": sub, "representatives": _nearest(vectors, sub, SUB_REPRESENTATIVES)}
+                for sub in subclusters
+            ],
+        })
+    return topics
+
+
+def _naming_prompt(topics: List[Dict], numbers: List[int], documents) -> str:
+    blocks = []
+    for number in numbers:
+        topic = topics[number]
+        lines = [f"=== CLUSTER {number} ({len(topic['members'])} chunks) ==="]
+        lines += [f"- {_excerpt(documents[i])}" for i in topic["representatives"]]
+        for s, sub in enumerate(topic["subclusters"], 1):
+            lines.append(f"  Subcluster {s}:")
+            lines += [f"  - {_excerpt(documents[i])}" for i in sub["representatives"]]
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+_NAMING_INSTRUCTIONS = """You name the topics of a course. Each cluster below is a group of related passages from the course material, shown by its most typical passages, followed by its subclusters.
+For every cluster give a short topic title, a one-sentence summary, and one short sub-header per subcluster in the order given.
+Titles and sub-headers name concepts, not specific examples, formulas or definitions."""
+
+
+def _name_group(topics: List[Dict], numbers: List[int], documents) -> Dict[int, ClusterName]:
+    messages = [
+        SystemMessage(content=_NAMING_INSTRUCTIONS),
+        HumanMessage(content=_naming_prompt(topics, numbers, documents)),
+    ]
+    complete = lambda parsed: {c.cluster for c in parsed.clusters} >= set(numbers)
+    try:
+        parsed = generate_structured("outline_names", messages, ClusterNames, "outline_names", is_complete=complete)
+    except Exception:
+        logger.exception("cluster naming failed clusters=%s", numbers)
+        return {}
+    return {c.cluster: c for c in (parsed.clusters if parsed else []) if c.cluster in numbers}
+
+
+def _outline_node(number: int, topic: Dict, name: Optional[ClusterName], documents) -> OutlineNode:
+    subclusters = topic["subclusters"]
+    fallback = [_section_name(documents, sub["members"]) or f"Part {s}" for s, sub in enumerate(subclusters, 1)]
+    if name is None:
+        return OutlineNode(
+            title=_section_name(documents, topic["members"]) or f"Topic {number + 1}",
+            subtopics=list(dict.fromkeys(fallback)),
+        )
+    subtopics = [s.strip() for s in name.subtopics if s.strip()] or fallback
+    return OutlineNode(title=name.title, summary=name.summary, subtopics=list(dict.fromkeys(subtopics)))
+
+
+async def cluster_outline(user_id: str, source_ids: Optional[List[str]] = None) -> Optional[DocumentOutline]:
+    """Outline of a user's stored chunks (only `source_ids` when given) from embedding clusters."""
+    vectors, documents = await asyncio.to_thread(
+        scroll_vectors_for_user, user_id, source_ids, OUTLINE_CLUSTER_MAX_POINTS
+    )
+    if not documents:
+        logger.warning("no stored chunks to cluster user=%s", user_id)
+        return None
+    topics = await asyncio.to_thread(cluster_corpus, vectors, documents)
+    logger.info("clustered chunks=%d topics=%d user=%s", len(documents), len(topics), user_id)
+
+    groups = [
+        list(range(start, min(start + OUTLINE_TOPICS_PER_CALL, len(topics))))
+        for start in range(0, len(topics), OUTLINE_TOPICS_PER_CALL)
+    ]
+    results = await asyncio.gather(*(
+        asyncio.to_thread(_name_group, topics, numbers, documents) for numbers in groups
+    ))
+    names = {number: name for result in results for number, name in result.items()}
+    return DocumentOutline(topics=[
+        _outline_node(number, topic, names.get(number), documents) for number, topic in enumerate(topics)
+    ])
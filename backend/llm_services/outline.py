@@ -1,18 +1,64 @@
 from langchain_core.tools import tool
 from tools.outline_tool import DocumentOutline, OutlineNode, submit_outline
-from tools.model import model
+from tools.model import ROUTES, chat_model, route_metrics, use_route
 from tools.dynamic_prompt import prompt_with_context
 from langchain.agents import create_agent
-from loaders.multiple_file import chunk_directory
+from loaders.multiple_file import stream_text_batches
+from tools.metrics import timed, record_tokens
 from typing import Optional, List, Dict
 import asyncio
 import json
+import logging
+import os
 from tqdm.asyncio import tqdm
 
-# Create agent ONCE globally
-agent = create_agent(model, tools=[submit_outline], middleware=[prompt_with_context])
+logger = logging.getLogger(__name__)
+
 import math
 
+# Each file is shrunk to about this many tokens of headings and central sentences
+# before the map phase (0 sends the full text)
+OUTLINE_SOURCE_TOKENS = int(os.getenv("OUTLINE_SOURCE_TOKENS", "20000"))
+
+# Outline agents per worker process and model route, built by init_agent() at app startup
+_agents = {}
+
+
+def _agent_for(route: str, cascade: bool = False):
+    key = (route, cascade)
+    if key not in _agents:
+        _agents[key] = create_agent(chat_model(route, cascade), tools=[submit_outline], middleware=[prompt_with_context])
+    return _agents[key]
+
+
+def init_agent():
+    """Create this worker's outline agents: map scans and the reduce step run on their own routes (idempotent)."""
+    _agent_for("outline_map")
+    if ROUTES["outline_reduce"].cascade:
+        _agent_for("outline_reduce", cascade=True)
+    return _agent_for("outline_reduce")
+
+
+def _record_agent_tokens(stage: str, step) -> None:
+    """Count tokens of every model turn in the agent's final message list."""
+    for message in (step or {}).get("messages", []):
+        if getattr(message, "type", None) == "ai":
+            record_tokens(stage, message)
+
+
+def _log_outline(label: str, outline: Optional[DocumentOutline]) -> None:
+    if not outline:
+        logger.warning("%s failed", label)
+        return
+    logger.info(
+        "%s topics=%d subtopics=%d", label, len(outline.topics),
+        sum(len(topic.subtopics) for topic in outline.topics),
+    )
+    if logger.isEnabledFor(logging.DEBUG):
+        for topic in outline.topics:
+            logger.debug("%s topic=%r subtopics=%r", label, topic.title, topic.subtopics)
+
+
 async def get_batch_summary(agent, batch_text: str, batch_id: int, user_id: str = None) -> str:
     """Helper: Asks the agent to summarize the themes in a chunk of text."""
     # Inject user_id for middleware extraction
@@ -26,62 +72,84 @@ async def get_batch_summary(agent, batch_text: str, batch_id: int, user_id: str
     # Simple text extraction - we don't need the tool here, just the text response
     # We iterate the stream to get the final answer
     response_content = ""
-    print(f"   ... Analyzing Batch {batch_id} ...")
-    
-    async for step in agent.astream( # Assuming astream for async, or use stream if synchronous wrapper
-        {"messages": [{"role": "user", "content": query}], "user_id": user_id},
-        stream_mode="values",
-    ):
-        last_msg = step["messages"][-1]
-        if last_msg.content:
-            response_content = last_msg.content
+    step = None
+    logger.debug("analyzing batch=%d chars=%d", batch_id, len(batch_text))
+    
+    with use_route("outline_map"), timed("outline_map"):
+        async for step in agent.astream( # Assuming astream for async, or use stream if synchronous wrapper
+            {"messages": [{"role": "user", "content": query}], "user_id": user_id},
+            stream_mode="values",
+        ):
+            last_msg = step["messages"][-1]
+            if last_msg.content:
+                response_content = last_msg.content
+    _record_agent_tokens("outline_map", step)
             
     return response_content
 
+async def _run_reduce(agent, query: str, user_id: str, stage: str) -> Optional[DocumentOutline]:
+    """Run one reduce turn and return the outline from its submit_outline call, if valid."""
+    outline = None
+    step = None
+    with timed(stage):
+        async for step in agent.astream(
+            {"messages": [{"role": "user", "content": query}], "user_id": user_id},
+            stream_mode="values",
+        ):
+            last_message = step["messages"][-1]
+            
+            # 1. Check for Tool Calls (Success Path)
+            if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
+                for tool_call in last_message.tool_calls:
+                    if tool_call['name'] == 'submit_outline':
+                        try:
+                            outline = DocumentOutline(**tool_call['args'])
+                        except Exception as e:
+                            logger.error("Outline parsing error: %s", e)
+            
+            # 2. Check for Text Content (Failure Path - Debugging)
+            elif last_message.content and last_message.type == "ai":
+                if logger.isEnabledFor(logging.DEBUG) and len(last_message.content) > 5:
+                    logger.debug("agent thought: %.100s", last_message.content)
+    _record_agent_tokens(stage, step)
+    return outline
+
+
+async def _reduce(query: str, user_id: str) -> Optional[DocumentOutline]:
+    """Reduce step on the outline_reduce route, retried once on its cascade model without a valid outline."""
+    with use_route("outline_reduce") as settings:
+        outline = await _run_reduce(_agent_for("outline_reduce"), query, user_id, "outline_reduce")
+        if (outline is None or not outline.topics) and settings.cascade:
+            logger.warning("outline reduce produced no valid outline, cascading to %s", settings.cascade)
+            route_metrics.record_cascade("outline_reduce")
+            outline = await _run_reduce(_agent_for("outline_reduce", cascade=True), query, user_id, "outline_reduce_cascade")
+    return outline
+
+
 async def create_outline(dir: str, youtube_urls: List[str] = None, user_id: str = None) -> Optional[DocumentOutline]:
     """✅ Scalable Outline Creator (Map-Reduce)"""
-    print(f"🚀 Processing ALL files for user: {user_id}...")
+    logger.info("creating outline user=%s", user_id)
+    agent = _agent_for("outline_map")
     
-    # 1. Get ALL file chunks
-    all_chunks = await chunk_directory(dir, youtube_urls)
-    print(f'Found {len(all_chunks)} files')
-    
-    # 2. CONFIGURATION
+    # 1. CONFIGURATION
     # Adjust this based on your model's limits (e.g., 40k chars is roughly 10k tokens)
     MAX_BATCH_CHARS = 50000 
     
-    current_batch_text = ""
     file_summaries = []
-    batch_count = 1
-    
-    # 3. MAP PHASE: Iterate and Summarize Batches
-    print(f"🔄 Starting MAP phase (Summarizing content in batches of ~{MAX_BATCH_CHARS/1000:.0f}k chars)...")
+    batch_count = 0
     
-    for filename, chunk_text in all_chunks.items():
-        formatted_text = f"\n\n=== SOURCE: {filename} ===\n{chunk_text}"
-        
-        # Check if adding this file exceeds our batch limit
-        if len(current_batch_text) + len(formatted_text) > MAX_BATCH_CHARS:
-            # Batch is full -> Summarize it
-            summary = await get_batch_summary(agent, current_batch_text, batch_count, user_id)
-            file_summaries.append(f"--- BATCH {batch_count} SUMMARY ---\n{summary}")
-            
-            # Reset
-            batch_count += 1
-            current_batch_text = formatted_text # Start new batch with current file
-        else:
-            current_batch_text += formatted_text
-
-    # Process the final remaining batch
-    if current_batch_text:
-        summary = await get_batch_summary(agent, current_batch_text, batch_count, user_id)
+    # 2. MAP PHASE: Summarize batches as they stream out of the parser
+    # (the first batch is summarized while later pages are still being read)
+    async for batch_text in stream_text_batches(dir, youtube_urls, MAX_BATCH_CHARS, token_budget=OUTLINE_SOURCE_TOKENS):
+        batch_count += 1
+        summary = await get_batch_summary(agent, batch_text, batch_count, user_id)
         file_summaries.append(f"--- BATCH {batch_count} SUMMARY ---\n{summary}")
 
     # Combine all summaries
     master_context = "\n\n".join(file_summaries)
-    print(f"📚 Reduced {len(all_chunks)} files into {len(file_summaries)} condensed summary blocks.")
+    logger.info("map phase summary_blocks=%d", len(file_summaries))
 
-    # 4. REDUCE PHASE: One LLM Call for Master Outline
+    # 3. REDUCE PHASE: One LLM Call for Master Outline
     # Now we feed the *Summaries* to the tool, not the raw text.
     # Inject user_id for middleware extraction
     prefix = f"[USER_ID:{user_id}] " if user_id else ""
@@ -98,47 +166,10 @@ IMPORTANT:
 SUMMARIES FROM ALL FILES:
 {master_context}"""
 
-    print("🚀 Agent is generating Final Master Outline...")
-    final_outline = None
-
-    # Note: Assuming 'agent' is available in scope or passed in
-    async for step in agent.astream(
-        {"messages": [{"role": "user", "content": query}], "user_id": user_id},
-        stream_mode="values",
-    ):
-        last_message = step["messages"][-1]
-        
-        # 1. Check for Tool Calls (Success Path)
-        if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-            print(f"🛠️  Tool Call Detected: {last_message.tool_calls[0]['name']}")
-            for tool_call in last_message.tool_calls:
-                if tool_call['name'] == 'submit_outline':
-                    try:
-                        final_outline = DocumentOutline(**tool_call['args'])
-                        print("✅ Master structure parsed successfully.")
-                    except Exception as e:
-                        print(f"❌ Parsing Error: {e}")
-        
-        # 2. Check for Text Content (Failure Path - Debugging)
-        elif last_message.content and last_message.type == "ai":
-            # Optional: Print only if it's not an empty intermediate thought
-            if len(last_message.content) > 5:
-                print(f"🤖 Agent thought: {last_message.content[:100]}...")
+    final_outline = await _reduce(query, user_id)
 
     # --- Final Output ---
-    if final_outline:
-        print("\n" + "="*60)
-        print("       MASTER OUTLINE FROM ALL FILES")
-        print("="*60)
-        for topic in final_outline.topics:
-            print(f"\n📌 {topic.title}")
-            if topic.subtopics:
-                for subtopic in topic.subtopics:
-                    print(f"   ├─ {subtopic}")
-            else:
-                print("   (No subtopics)")
-    else:
-        print("\n❌ Extraction Failed.") 
+    _log_outline("master outline", final_outline)
     
     return final_outline
 
@@ -157,46 +188,31 @@ async def merge_outlines(
     2. Summarizes the new content
     3. Uses LLM to intelligently merge with existing outline (deduplicating, reorganizing)
     """
-    print(f"🔄 Processing NEW files for outline merge (user: {user_id})...")
-    
-    # 1. Get chunks from new files
-    all_chunks = await chunk_directory(dir, youtube_urls)
-    
-    if not all_chunks:
-        print("⚠️ No new content found, returning existing outline")
-        if existing_outline:
-            return DocumentOutline(**existing_outline)
-        return None
+    logger.info("merging outline user=%s", user_id)
+    agent = _agent_for("outline_map")
     
-    print(f'Found {len(all_chunks)} new files/sources')
-    
-    # 2. Summarize new content (same MAP phase as create_outline)
+    # 1. Summarize new content as it streams in (same MAP phase as create_outline)
     MAX_BATCH_CHARS = 50000
-    current_batch_text = ""
     new_summaries = []
-    batch_count = 1
-    
-    print(f"🔄 Summarizing new content in batches...")
+    batch_count = 0
     
-    for filename, chunk_text in all_chunks.items():
-        formatted_text = f"\n\n=== NEW SOURCE: {filename} ===\n{chunk_text}"
-        
-        if len(current_batch_text) + len(formatted_text) > MAX_BATCH_CHARS:
-            summary = await get_batch_summary(agent, current_batch_text, batch_count, user_id)
-            new_summaries.append(f"--- NEW BATCH {batch_count} SUMMARY ---\n{summary}")
-            batch_count += 1
-            current_batch_text = formatted_text
-        else:
-            current_batch_text += formatted_text
-
-    if current_batch_text:
-        summary = await get_batch_summary(agent, current_batch_text, batch_count, user_id)
+    async for batch_text in stream_text_batches(
+        dir, youtube_urls, MAX_BATCH_CHARS, header="=== NEW SOURCE: {} ===", token_budget=OUTLINE_SOURCE_TOKENS
+    ):
+        batch_count += 1
+        summary = await get_batch_summary(agent, batch_text, batch_count, user_id)
         new_summaries.append(f"--- NEW BATCH {batch_count} SUMMARY ---\n{summary}")
 
+    if not new_summaries:
+        logger.warning("No new content found, returning existing outline")
+        if existing_outline:
+            return DocumentOutline(**existing_outline)
+        return None
+
     new_context = "\n\n".join(new_summaries)
-    print(f"📚 Summarized {len(all_chunks)} new files into {len(new_summaries)} summary blocks.")
+    logger.info("map phase summary_blocks=%d", len(new_summaries))
 
-    # 3. Convert existing outline to readable format
+    # 2. Convert existing outline to readable format
     existing_outline_text = ""
     if existing_outline and "topics" in existing_outline:
         existing_topics = []
@@ -210,7 +226,7 @@ async def merge_outlines(
             existing_topics.append(topic_str)
         existing_outline_text = "\n\n".join(existing_topics)
 
-    # 4. MERGE PHASE: LLM intelligently combines outlines
+    # 3. MERGE PHASE: LLM intelligently combines outlines
     merge_query = f"""You are merging a NEW document set with an EXISTING course outline.
 
 EXISTING OUTLINE:
@@ -229,42 +245,9 @@ INSTRUCTIONS:
 7. Create a cohesive, well-organized structure.
 8. Only output the tool call."""
 
-    print("🚀 Agent is merging outlines...")
-    merged_outline = None
-
-    async for step in agent.astream(
-        {"messages": [{"role": "user", "content": merge_query}], "user_id": user_id},
-        stream_mode="values",
-    ):
-        last_message = step["messages"][-1]
-        
-        if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-            print(f"🛠️  Tool Call Detected: {last_message.tool_calls[0]['name']}")
-            for tool_call in last_message.tool_calls:
-                if tool_call['name'] == 'submit_outline':
-                    try:
-                        merged_outline = DocumentOutline(**tool_call['args'])
-                        print("✅ Merged outline parsed successfully.")
-                    except Exception as e:
-                        print(f"❌ Parsing Error: {e}")
-        
-        elif last_message.content and last_message.type == "ai":
-            if len(last_message.content) > 5:
-                print(f"🤖 Agent thought: {last_message.content[:100]}...")
+    merged_outline = await _reduce(merge_query, user_id)
 
     # --- Final Output ---
-    if merged_outline:
-        print("\n" + "="*60)
-        print("       MERGED OUTLINE")
-        print("="*60)
-        for topic in merged_outline.topics:
-            print(f"\n📌 {topic.title}")
-            if topic.subtopics:
-                for subtopic in topic.subtopics:
-                    print(f"   ├─ {subtopic}")
-            else:
-                print("   (No subtopics)")
-    else:
-        print("\n❌ Merge Failed.") 
+    _log_outline("merged outline", merged_outline)
     
     return merged_outline
\ No newline at end of file
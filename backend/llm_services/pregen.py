@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from llm_services.bot import tutor
+from tools.deadline import request_budget
+from tools.llm_scheduler import BULK, llm_priority, set_llm_user
+from tools.local_db import get_connection, init_schema
+from tools.vector_store import corpus_version
+
+logger = logging.getLogger(__name__)
+
+# Optional: generate lessons for a new outline in the background so the first
+# /tutor request for each subtopic is served from the store instead of cold.
+PREGEN_ENABLED = os.getenv("PREGEN_ENABLED", "").lower() in ("1", "true", "yes")
+DEFAULT_ADAPT = os.getenv("PREGEN_ADAPT", "5")
+# Pre-generation waits while this many interactive requests are in flight
+PAUSE_THRESHOLD = int(os.getenv("PREGEN_PAUSE_THRESHOLD", "1"))
+PAUSE_POLL_SECONDS = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pregenerated_lessons (
+    user_id TEXT NOT NULL,
+    lesson_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    generation_seconds REAL NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, lesson_key)
+);
+"""
+
+
+def lesson_key(text: str, adapt: str, analogy: str) -> str:
+    """Normalize a /tutor request so equivalent requests map to the same stored lesson."""
+    norm = lambda s: re.sub(r"\s+", " ", (s or "").strip().lower())
+    return f"{norm(text)}|{norm(str(adapt))}|{norm(analogy)}"
+
+
+def outline_lesson_queries(outline) -> List[str]:
+    """Subtopic lesson requests in reading order, in the format the learn page sends."""
+    if hasattr(outline, "model_dump"):
+        outline = outline.model_dump()
+    queries = []
+    for topic in (outline or {}).get("topics", []):
+        for sub in topic.get("subtopics") or []:
+            queries.append(f"topic: {topic.get('title', '')}, subtopic: {sub}")
+    return queries
+
+
+class LessonPregenerator:
+    """Low-priority background worker that fills the pre-generated lesson store."""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = None
+        self.worker: Optional[asyncio.Task] = None
+        self.interactive_in_flight = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "avoided_cold_seconds": 0.0,
+            "miss_cold_seconds": 0.0,
+            "generated": 0,
+            "failed": 0,
+            "paused_seconds": 0.0,
+        }
+        # Hits and misses are counted on the request handlers' worker threads
+        self._stats_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _ensure_schema(self):
+        if not self._schema_ready:
+            init_schema(_SCHEMA)
+            self._schema_ready = True
+
+    @contextmanager
+    def interactive(self):
+        """Mark an interactive request as in flight so pre-generation backs off."""
+        self.interactive_in_flight += 1
+        try:
+            yield
+        finally:
+            self.interactive_in_flight -= 1
+
+    def schedule_outline(self, user_id: str, outline, adapt: str = DEFAULT_ADAPT, analogy: str = ""):
+        """Queue every subtopic of an outline for pre-generation (no-op when disabled)."""
+        if not PREGEN_ENABLED or not outline:
+            return
+        self._ensure_schema()
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+        queries = outline_lesson_queries(outline)
+        for text in queries:
+            self.queue.put_nowait((user_id, text, adapt or DEFAULT_ADAPT, analogy or ""))
+        logger.info("queued pregeneration lessons=%d user=%s", len(queries), user_id)
+
+    async def stop(self):
+        """Cancel the worker (app shutdown); queued lessons are dropped."""
+        if self.worker is not None and not self.worker.done():
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+        self.worker = None
+
+    async def _wait_for_quiet(self):
+        paused_at = time.perf_counter()
+        while self.interactive_in_flight >= PAUSE_THRESHOLD:
+            await asyncio.sleep(PAUSE_POLL_SECONDS)
+        self.stats["paused_seconds"] += time.perf_counter() - paused_at
+
+    async def _run(self):
+        # Model calls from this worker always queue behind interactive traffic,
+        # and are not bound to the request that scheduled the outline
+        llm_priority.set(BULK)
+        request_budget.set(None)
+        while True:
+            user_id, text, adapt, analogy = await self.queue.get()
+            set_llm_user(user_id)
+            try:
+                if self._load(user_id, self._key(user_id, text, adapt, analogy)) is not None:
+                    continue
+                await self._wait_for_quiet()
+                # Stored under the corpus the lesson was retrieved from; a source
+                # change during generation leaves it unreachable instead of stale
+                version = corpus_version(user_id)
+                start = time.perf_counter()
+                payload = await tutor(text, adapt, analogy, user_id)
+                elapsed = time.perf_counter() - start
+                if payload is None:
+                    self.stats["failed"] += 1
+                    continue
+                self._store(user_id, version, lesson_key(text, adapt, analogy), payload, elapsed)
+                self.stats["generated"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error("Pre-generation error for '%s': %s", text, e)
+            finally:
+                self.queue.task_done()
+
+    @staticmethod
+    def _key(user_id: str, text: str, adapt: str, analogy: str) -> str:
+        """Store key: the request under the user's current corpus version (any source change misses)."""
+        return f"{corpus_version(user_id)}|{lesson_key(text, adapt, analogy)}"
+
+    def _store(self, user_id: str, version: str, key: str, payload: dict, elapsed: float):
+        db = get_connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # Lessons of earlier corpus versions can never be served again
+            db.execute(
+                "DELETE FROM pregenerated_lessons WHERE user_id = ? AND substr(lesson_key, 1, ?) != ?",
+                (user_id, len(version) + 1, f"{version}|"),
+            )
+            db.execute(
+                "INSERT OR REPLACE INTO pregenerated_lessons VALUES (?, ?, ?, ?, ?)",
+                (user_id, f"{version}|{key}", json.dumps(payload), elapsed, time.time()),
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _load(self, user_id: str, key: str):
+        return get_connection().execute(
+            "SELECT payload, generation_seconds FROM pregenerated_lessons WHERE user_id = ? AND lesson_key = ?",
+            (user_id, key),
+        ).fetchone()
+
+    def lookup(self, user_id: str, text: str, adapt: str, analogy: str) -> Optional[dict]:
+        """Return a stored lesson matching the request, counting the hit."""
+        if not PREGEN_ENABLED:
+            return None
+        self._ensure_schema()
+        row = self._load(user_id, self._key(user_id, text, adapt, analogy))
+        if row is None:
+            return None
+        with self._stats_lock:
+            self.stats["hits"] += 1
+            self.stats["avoided_cold_seconds"] += row[1]
+        return json.loads(row[0])
+
+    def record_miss(self, seconds: float):
+        if PREGEN_ENABLED:
+            with self._stats_lock:
+                self.stats["misses"] += 1
+                self.stats["miss_cold_seconds"] += seconds
+
+    def report(self) -> Dict:
+        served = self.stats["hits"] + self.stats["misses"]
+        return {
+            "enabled": PREGEN_ENABLED,
+            **self.stats,
+            "hit_rate": self.stats["hits"] / served if served else 0.0,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "interactive_in_flight": self.interactive_in_flight,
+        }
+
+
+pregenerator = LessonPregenerator()
@@ -1,14 +1,23 @@
 import os
-import base64
 import asyncio
+import contextvars
 import json
-from typing import Dict, List
+import logging
+import queue
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Tuple
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import (
-    PyMuPDFLoader, TextLoader, YoutubeLoader
+    PyMuPDFLoader, TextLoader
 )
 from langchain_core.documents import Document
-from tools.vector_store import vector_store, add_documents_for_user
+from tools.vector_store import add_documents_for_user, delete_points_for_user
+from tools import source_registry
+from loaders.youtube_transcripts import get_transcript, video_id_for
+from loaders.pdf_structure import page_images, iter_structured_chunks
+from tools.metrics import observe_stage, record_payload
+from tools.extractive import reduce_source
 import fitz  # PyMuPDF
 # from loaders.youtube_utils import process_playlist
 
@@ -16,150 +25,370 @@ text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=2000, chunk_overlap=200, add_start_index=True
 )
 
+logger = logging.getLogger(__name__)
 
-print("--------------------------------------------------")
-print(f"MY VECTOR STORE IS: {vector_store}")
-print(f"THE TYPE IS: {type(vector_store)}")
-print("--------------------------------------------------")
+# Ingestion is a streaming page -> chunk pipeline: sources are parsed one page at a
+# time on a worker thread, and at most INGEST_QUEUE_BATCHES batches of
+# INGEST_BATCH_CHUNKS chunks wait for the consumer (embedding/upsert or the outline
+# map phase), so memory is bounded by a window of pages, not by the document size.
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "64"))
+INGEST_QUEUE_BATCHES = int(os.getenv("INGEST_QUEUE_BATCHES", "2"))
+# Plain-text sources are read in blocks of about this many characters ("pages")
+TEXT_BLOCK_CHARS = 8000
+# "structured": section-coherent chunks from the PDF layout/TOC (loaders/pdf_structure);
+# "page": the character splitter run on each page separately
+PDF_CHUNKER = os.getenv("PDF_CHUNKER", "structured")
 
-def extract_pdf_images_and_text(filepath: str) -> List[Document]:
-    """Extract TEXT + EMBEDDED IMAGES (stored as base64 data URLs in metadata)"""
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt', '.docx')
+
+_DONE = object()
+
+
+def iter_pdf_pages(filepath: str) -> Iterator[Document]:
+    """Yield one Document per page: TEXT + EMBEDDED IMAGES (base64 data URLs in metadata)."""
     doc = fitz.open(filepath)
-    documents = []
-    
-    pdf_filename = os.path.basename(filepath)
-    
-    for page_num, page in enumerate(doc):
-        page_text = page.get_text().strip()
-        
-        # Extract images as base64 data URLs
-        images = []
-        image_list = page.get_images(full=True)
-        if image_list:
-            for idx, img in enumerate(image_list, start=1):
-                xref = img[0]
-                try:
-                    base_image = doc.extract_image(xref)
-                    image_bytes = base_image["image"]
-                    image_ext = base_image.get("ext", "png")
-                    
-                    # Convert to base64 data URL
-                    mime_type = f"image/{image_ext}"
-                    if image_ext == "jpg":
-                        mime_type = "image/jpeg"
-                    base64_data = base64.b64encode(image_bytes).decode('utf-8')
-                    data_url = f"data:{mime_type};base64,{base64_data}"
-                    images.append(data_url)
-                except Exception as e:
-                    print(f"Error extracting image: {e}")
-        
-        # Create document with text and images in metadata
-        # Serialize images list to JSON string for vector DB compatibility
-        metadata = {"source": filepath, "page": page_num + 1, "images": json.dumps(images)}
-        documents.append(Document(page_content=f"[Page {page_num+1}]\n{page_text}", metadata=metadata))
-    
-    doc.close()
-    return documents
-
-def _process_file_sync(filepath: str):
-    """Helper to process a single file synchronously."""
+    try:
+        for page_num, page in enumerate(doc):
+            page_text = page.get_text().strip()
+            # Serialize images list to JSON string for vector DB compatibility
+            metadata = {"source": filepath, "page": page_num + 1, "images": json.dumps(page_images(doc, page))}
+            yield Document(page_content=f"[Page {page_num+1}]\n{page_text}", metadata=metadata)
+    finally:
+        doc.close()
+
+
+def iter_text_pages(filepath: str) -> Iterator[Document]:
+    """Yield a plain-text file in blocks of about TEXT_BLOCK_CHARS, split on line ends."""
+    with open(filepath, encoding="utf-8") as f:
+        block, size, start = [], 0, 0
+        for line in f:
+            block.append(line)
+            size += len(line)
+            if size >= TEXT_BLOCK_CHARS:
+                yield Document(page_content="".join(block), metadata={"source": filepath, "offset": start})
+                start += size
+                block, size = [], 0
+        if block:
+            yield Document(page_content="".join(block), metadata={"source": filepath, "offset": start})
+
+
+def extract_pdf_images_and_text(filepath: str) -> List[Document]:
+    """Extract every page of a PDF at once (small files / scripts; ingestion streams instead)."""
+    return list(iter_pdf_pages(filepath))
+
+
+def iter_file_chunks(filepath: str) -> Iterator[Document]:
+    """Stream a file's chunks page by page; splitting a page never needs the rest of the file."""
     filename = os.path.basename(filepath)
-    if filename.endswith('.pdf'):
-        print(filename)
-        docs = extract_pdf_images_and_text(filepath)
-        chunks = text_splitter.split_documents(docs)
-    else:
-        loader = TextLoader(filepath)
-        docs = loader.load()
-        chunks = text_splitter.split_documents(docs)
-    return filename, chunks
+    if filename.endswith('.pdf') and PDF_CHUNKER == "structured":
+        yield from _iter_structured_file_chunks(filepath)
+        return
+    pages = iter_pdf_pages(filepath) if filename.endswith('.pdf') else iter_text_pages(filepath)
+    page_count = chunk_count = source_chars = 0
+    extract_seconds = split_seconds = 0.0
+    while True:
+        # Time parsing and splitting only, not the time spent waiting on the consumer
+        start = time.perf_counter()
+        page = next(pages, None)
+        extract_seconds += time.perf_counter() - start
+        if page is None:
+            break
+        page_count += 1
+        source_chars += len(page.page_content)
+        start = time.perf_counter()
+        chunks = text_splitter.split_documents([page])
+        split_seconds += time.perf_counter() - start
+        del page
+        for chunk in chunks:
+            chunk_count += 1
+            yield chunk
+    observe_stage("pdf_extract" if filename.endswith('.pdf') else "text_extract", extract_seconds)
+    observe_stage("split", split_seconds)
+    record_payload("source_text", source_chars)
+    logger.info("processed file=%s pages=%d chunks=%d", filename, page_count, chunk_count)
+
+
+def _iter_structured_file_chunks(filepath: str) -> Iterator[Document]:
+    filename = os.path.basename(filepath)
+    stats: Dict = {}
+    chunks = iter_structured_chunks(filepath, stats)
+    chunk_seconds = 0.0
+    source_chars = 0
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        chunk_seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        source_chars += len(chunk.page_content)
+        yield chunk
+    observe_stage("pdf_structure", chunk_seconds)
+    record_payload("source_text", source_chars)
+    logger.info(
+        "processed file=%s pages=%d chunks=%d image_only_pages=%d boilerplate_lines=%d dropped_chunks=%d",
+        filename, stats["pages"], stats["chunks"], stats["image_only_pages"], stats["boilerplate_lines"], stats["dropped_chunks"],
+    )
 
-def _process_youtube_sync(url: str):
-    """Helper to process a single YouTube URL synchronously."""
-    print(f"Processing YouTube: {url}")
+
+async def _process_youtube(url: str):
+    """Transcript (shared cache, bounded pool, per-URL timeout) split into chunks."""
+    logger.info("Processing YouTube: %s", url)
     try:
-        loader = YoutubeLoader.from_youtube_url(url, add_video_info=False)
-        docs = loader.load()
+        transcript = await get_transcript(url)
+        docs = [Document(page_content=transcript, metadata={"source": video_id_for(url)})]
         chunks = text_splitter.split_documents(docs)
         chunk_text = "\n\n".join([chunk.page_content for chunk in chunks])
         return url, chunk_text, chunks
     except Exception as e:
-        print(f"YouTube error {url}: {e}")
+        logger.warning("YouTube error %s: %s", url, e)
         return url, f"[ERROR: {e}]", []
 
-async def process_youtube_urls(youtube_urls: List[str]) -> Dict[str, str]:
-    """Process YouTube URLs concurrently and return {url: transcript_text}"""
-    results = {}
-    tasks = [asyncio.to_thread(_process_youtube_sync, url) for url in youtube_urls]
-    processed_results = await asyncio.gather(*tasks)
-    
-    for url, text, _ in processed_results:
-        results[url] = text
-    
-    return results
-
-async def chunk_directory(directory_path: str, youtube_urls: List[str] = None) -> Dict[str, str]:
-    """Process files + YouTube URLs concurrently. Returns {filename_or_url: chunk_text}"""
-    results = {}
-    tasks = []
-
-    # Process local files
-    for filename in os.listdir(directory_path):
-        if filename.endswith(('.pdf', '.txt', '.docx')):
-            filepath = os.path.join(directory_path, filename)
-            tasks.append(asyncio.to_thread(_process_file_sync, filepath))
-    
-    # Process YouTube URLs
-    if youtube_urls:
-        for url in youtube_urls:
-            tasks.append(asyncio.to_thread(_process_youtube_sync, url))
-            
-    processed_items = await asyncio.gather(*tasks)
-
-    for item in processed_items:
-        if len(item) == 2: # File result: (filename, chunks)
-            filename, chunks = item
-            chunk_text = "\n\n".join([chunk.page_content for chunk in chunks])
-            results[filename] = chunk_text
-        else: # YouTube result: (url, text, chunks)
-            url, text, _ = item
-            results[url] = text
-            
-    return results
-
-async def load_directory(directory_path: str, youtube_urls: List[str] = None, user_id: str = None):
-    """Load files + YouTube to vector store concurrently with user isolation"""
+
+def _source_files(directory_path: str) -> List[str]:
+    return [
+        os.path.join(directory_path, filename)
+        for filename in sorted(os.listdir(directory_path))
+        if filename.endswith(SUPPORTED_EXTENSIONS)
+    ]
+
+
+def iter_directory_chunks(directory_path: str) -> Iterator[Tuple[str, Document]]:
+    """(filename, chunk) for every file in the directory, one file and one page at a time."""
+    for filepath in _source_files(directory_path):
+        filename = os.path.basename(filepath)
+        for chunk in iter_file_chunks(filepath):
+            yield filename, chunk
+
+
+def _reducer_metadata(metadata: Dict) -> Dict:
+    return {key: metadata[key] for key in ("section", "page") if key in metadata}
+
+
+def iter_reduced_directory_texts(directory_path: str, token_budget: int) -> Iterator[Tuple[str, str]]:
+    """(filename, paragraph) for every file, each shrunk to ~token_budget tokens by the extractive reducer."""
+    for filepath in _source_files(directory_path):
+        filename = os.path.basename(filepath)
+        # The reducer scores a source as a whole, so its chunks are collected first,
+        # keeping only the text and the section/page it groups them by (not the images)
+        chunks = [
+            Document(page_content=chunk.page_content, metadata=_reducer_metadata(chunk.metadata))
+            for chunk in iter_file_chunks(filepath)
+        ]
+        stats = {}
+        start = time.perf_counter()
+        reduced = reduce_source(chunks, token_budget, stats)
+        elapsed = time.perf_counter() - start
+        observe_stage("extractive_reduce", elapsed)
+        logger.info(
+            "extractive reduce source=%s tokens=%d->%d seconds=%.2f",
+            filename, stats["input_tokens"], stats["output_tokens"], elapsed,
+        )
+        del chunks
+        for paragraph in reduced.split("\n"):
+            if paragraph.strip():
+                yield filename, paragraph
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def iterate_in_thread(make_iter: Callable[[], Iterable], window: int = INGEST_QUEUE_BATCHES) -> AsyncIterator:
+    """
+    Run a blocking iterator on a worker thread, keeping at most `window` items
+    buffered ahead of the consumer. Parsing continues while the consumer works
+    on earlier items, and stops (backpressure) when the consumer falls behind.
+    """
+    items: queue.Queue = queue.Queue(maxsize=max(1, window))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in make_iter():
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    # Copy the context so stages timed on the producer thread count towards this request
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                # Bounded wait so a cancelled consumer never strands a pool thread
+                item = await asyncio.to_thread(items.get, True, 0.5)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+async def stream_text_batches(
+    directory_path: str,
+    youtube_urls: List[str] = None,
+    max_chars: int = 50000,
+    header: str = "=== SOURCE: {} ===",
+    token_budget: int = 0,
+) -> AsyncIterator[str]:
+    """
+    Stream all sources as text batches of at most ~max_chars for the outline map
+    phase. A source longer than one batch continues in the next batch under a
+    repeated header, so the first batch is ready after its first pages are parsed.
+    With a token_budget, each file is first reduced to its headings and most
+    central sentences (tools/extractive.py), which needs the whole file parsed.
+    """
+    # Transcripts are small and network-bound: fetch them (bounded pool) while files stream
+    youtube_tasks = [asyncio.create_task(_process_youtube(url)) for url in youtube_urls or []]
+
+    def batches():
+        current, current_source = [], None
+        size = 0
+        if token_budget > 0:
+            pieces = iter_reduced_directory_texts(directory_path, token_budget)
+        else:
+            pieces = ((source, chunk.page_content) for source, chunk in iter_directory_chunks(directory_path))
+        for source, text in pieces:
+            if size and size + len(text) > max_chars:
+                yield "".join(current)
+                current, current_source, size = [], None, 0
+            if source != current_source:
+                part = f"\n\n{header.format(source)}\n"
+                current.append(part)
+                size += len(part)
+                current_source = source
+            current.append(text + "\n\n")
+            size += len(text) + 2
+        if current:
+            yield "".join(current)
+
+    try:
+        async for batch in iterate_in_thread(batches, window=1):
+            yield batch
+        for task in youtube_tasks:
+            url, text, _ = await task
+            yield f"\n\n{header.format(url)}\n{text}"
+    finally:
+        for task in youtube_tasks:
+            task.cancel()
+
+
+def _changed_chunks(directory_path: str, user_id: str, summary: Dict, replace: Dict[str, str]) -> Iterator:
+    """
+    Chunks of new or changed files as (chunk, point_id), each file followed by
+    its SourceDiff once all of its chunks have been yielded. Files whose content
+    is already indexed are not parsed at all. A file named in `replace` is
+    diffed against that source ID; any other file gets its own source.
+    """
+    for filepath in _source_files(directory_path):
+        filename = os.path.basename(filepath)
+        content_hash = source_registry.file_hash(filepath)
+        source_id = replace.get(filename) or source_registry.file_source_id(user_id, filename, content_hash)
+        summary["source_ids"].append(source_id)
+        if source_registry.is_current(user_id, source_id, content_hash):
+            summary["unchanged_sources"] += 1
+            continue
+        diff = source_registry.SourceDiff(user_id, source_id, "file", content_hash)
+        for chunk in iter_file_chunks(filepath):
+            point_id = diff.admit(chunk)
+            if point_id:
+                yield chunk, point_id
+        yield diff
+
+
+def _finish_source(diff: source_registry.SourceDiff, summary: Dict) -> None:
+    """Delete chunks the new version no longer has, then record it (its new chunks are already upserted)."""
+    stale = diff.stale()
+    delete_points_for_user(stale, diff.user_id)
+    diff.commit()
+    summary["updated_sources"] += 1
+    summary["added_chunks"] += diff.added
+    summary["kept_chunks"] += diff.kept
+    summary["removed_chunks"] += len(stale)
+    logger.info(
+        "indexed source=%s user=%s added=%d kept=%d removed=%d",
+        diff.source_id, diff.user_id, diff.added, diff.kept, len(stale),
+    )
+
+
+def _sync_youtube(url: str, chunk_text: str, chunks: List[Document], user_id: str, summary: Dict) -> None:
+    source_id = video_id_for(url)
+    summary["source_ids"].append(source_id)
+    content_hash = source_registry.text_hash(chunk_text)
+    if source_registry.is_current(user_id, source_id, content_hash):
+        summary["unchanged_sources"] += 1
+        return
+    diff = source_registry.SourceDiff(user_id, source_id, "youtube", content_hash)
+    pending = [(chunk, point_id) for chunk in chunks if (point_id := diff.admit(chunk))]
+    if pending:
+        add_documents_for_user([c for c, _ in pending], user_id, ids=[i for _, i in pending])
+    _finish_source(diff, summary)
+
+
+async def load_directory(
+    directory_path: str, youtube_urls: List[str] = None, user_id: str = None, replace: Dict[str, str] = None
+) -> Dict:
+    """Stream files + YouTube into the vector store with user isolation.
+
+    Every source is diffed against the source registry: files already indexed
+    are skipped. `replace` maps file names to the source IDs they are new
+    versions of; of such a file only new or edited chunks are embedded and
+    upserted (in batches of INGEST_BATCH_CHUNKS while later pages are still
+    being parsed) before its removed chunks are deleted. The summary's
+    `source_ids` are the registry IDs of the sources, files first.
+    """
     if not user_id:
         raise ValueError("user_id is required for document loading")
-    
-    document_ids_list = []
-    tasks = []
-    
-    # Local files
-    for filename in os.listdir(directory_path):
-        if filename.endswith(('.pdf', '.txt', '.docx')):
-            filepath = os.path.join(directory_path, filename)
-            tasks.append(asyncio.to_thread(_process_file_sync, filepath))
-    
-    # YouTube URLs
-    if youtube_urls:
-        for url in youtube_urls:
-            tasks.append(asyncio.to_thread(_process_youtube_sync, url))
-            
-    processed_items = await asyncio.gather(*tasks)
-    
-    # Add to vector store with user_id
-    for item in processed_items:
-        chunks = []
-        if len(item) == 2: # File
-            _, chunks = item
-        else: # YouTube
-            _, _, chunks = item
-            
-        if chunks:
-            # Use user-scoped add function
-            document_ids = await asyncio.to_thread(add_documents_for_user, chunks, user_id)
-            document_ids_list.append(document_ids)
-    
-    print(f"📚 Loaded {len(document_ids_list)} document batches for user: {user_id}")
-    return str(document_ids_list[:3])
\ No newline at end of file
+
+    summary = dict(updated_sources=0, unchanged_sources=0, added_chunks=0, kept_chunks=0, removed_chunks=0, source_ids=[])
+    youtube_tasks = [asyncio.create_task(_process_youtube(url)) for url in youtube_urls or []]
+
+    try:
+        # Local files, page by page
+        items = lambda: _batched(_changed_chunks(directory_path, user_id, summary, replace or {}), INGEST_BATCH_CHUNKS)
+        async for batch in iterate_in_thread(items):
+            pending = [item for item in batch if isinstance(item, tuple)]
+            if pending:
+                # Use user-scoped add function
+                await asyncio.to_thread(
+                    add_documents_for_user, [c for c, _ in pending], user_id, [i for _, i in pending]
+                )
+            for item in batch:
+                if isinstance(item, source_registry.SourceDiff):
+                    await asyncio.to_thread(_finish_source, item, summary)
+
+        # YouTube URLs
+        for task in youtube_tasks:
+            url, chunk_text, chunks = await task
+            if chunks:
+                await asyncio.to_thread(_sync_youtube, url, chunk_text, chunks, user_id, summary)
+    finally:
+        for task in youtube_tasks:
+            task.cancel()
+
+    logger.info(
+        "loaded user=%s %s", user_id, " ".join(f"{k}={v}" for k, v in summary.items() if k != "source_ids")
+    )
+    return summary
@@ -1,5 +1,5 @@
 from langchain_community.document_loaders import PyMuPDFLoader
-from tools.vector_store import vector_store
+from tools.vector_store import get_vector_store
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 file_path = "UniversityPhysicsVolume1-LR.pdf"
@@ -22,6 +22,6 @@ def load_single_pdf(file_path):
 
     print(f"Split blog post into {len(all_splits)} sub-documents.")
 
-    document_ids = vector_store.add_documents(documents=all_splits)
+    document_ids = get_vector_store().add_documents(documents=all_splits)
 
     print(document_ids[:3])
@@ -0,0 +1,343 @@
+"""
+Structure-aware PDF chunking from PyMuPDF layout and the document outline.
+
+Character splitting per page fragments sections that span pages, embeds the same
+running header/footer over and over and turns image-only pages into near-empty
+chunks. This chunker instead:
+
+- samples the document once to learn its body font size, heading sizes and the
+  lines repeated in the top/bottom margins (running headers, footers, page numbers)
+- starts a new section at each TOC entry (`doc.get_toc()`), or, for PDFs without
+  an outline, at lines set noticeably larger than the body text
+- packs paragraphs of one section into chunks of about CHUNK_CHARS across page
+  breaks, never mixing two sections in one chunk
+- drops boilerplate lines and chunks with almost no text; images of image-only
+  pages are attached to the neighbouring chunk instead
+
+Each chunk carries `section` (e.g. "2 Limits > 2.1 One-sided limits"),
+`section_level`, `page` and `page_end` in its metadata. Pages are still read one
+at a time, so memory is bounded by one section's worth of text.
+"""
+import base64
+import json
+import logging
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import fitz  # PyMuPDF
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+logger = logging.getLogger(__name__)
+
+CHUNK_CHARS = int(os.getenv("PDF_CHUNK_CHARS", "2000"))
+OVERLAP_CHARS = int(os.getenv("PDF_CHUNK_OVERLAP", "200"))
+# Chunks with less text than this (after boilerplate removal) are not embedded
+MIN_CHUNK_CHARS = 40
+# A line is a heading candidate when its font is at least this much larger than body text
+HEADING_RATIO = 1.2
+# Top/bottom share of the page searched for running headers and footers
+MARGIN_RATIO = 0.08
+# A margin line is boilerplate when it repeats on this share of the sampled pages
+BOILERPLATE_SHARE = 0.3
+SAMPLE_PAGES = 40
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+_PAGE_NUMBER = re.compile(r"^(page )?[#ivxlc]+( of #)?$")
+
+_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_CHARS, chunk_overlap=OVERLAP_CHARS)
+
+
+def page_images(doc, page) -> List[str]:
+    """Embedded images of one page as base64 data URLs."""
+    images = []
+    for img in page.get_images(full=True):
+        xref = img[0]
+        try:
+            base_image = doc.extract_image(xref)
+            image_bytes = base_image["image"]
+            image_ext = base_image.get("ext", "png")
+
+            # Convert to base64 data URL
+            mime_type = f"image/{image_ext}"
+            if image_ext == "jpg":
+                mime_type = "image/jpeg"
+            base64_data = base64.b64encode(image_bytes).decode('utf-8')
+            images.append(f"data:{mime_type};base64,{base64_data}")
+        except Exception as e:
+            logger.warning("Error extracting image: %s", e)
+    return images
+
+
+def _normalize(text: str) -> str:
+    """Compare lines ignoring case, spacing and numbers ("Page 3" == "Page 14")."""
+    return _DIGITS.sub("#", _title_key(text))
+
+
+def _title_key(text: str) -> str:
+    return _SPACES.sub(" ", text.strip().lower())
+
+
+@dataclass
+class _Line:
+    text: str
+    size: float
+    top: float
+    bottom: float
+    block: int
+
+
+def _page_lines(page) -> List[_Line]:
+    lines = []
+    for block_no, block in enumerate(page.get_text("dict")["blocks"]):
+        if block.get("type") != 0:
+            continue
+        for line in block["lines"]:
+            spans = [s for s in line["spans"] if s["text"].strip()]
+            if not spans:
+                continue
+            text = "".join(s["text"] for s in line["spans"]).strip()
+            lines.append(_Line(text, round(max(s["size"] for s in spans), 1), line["bbox"][1], line["bbox"][3], block_no))
+    return lines
+
+
+def _in_margin(line: _Line, height: float) -> bool:
+    return line.top < height * MARGIN_RATIO or line.bottom > height * (1 - MARGIN_RATIO)
+
+
+@dataclass
+class LayoutProfile:
+    body_size: float = 0.0
+    # Heading font sizes, largest (level 1) first
+    heading_sizes: List[float] = field(default_factory=list)
+    # Normalized margin lines repeated across pages
+    boilerplate: Set[str] = field(default_factory=set)
+
+    def heading_level(self, size: float) -> int:
+        """1-based heading level for a font size, 0 for body text."""
+        for level, heading_size in enumerate(self.heading_sizes, 1):
+            if size >= heading_size - 0.25:
+                return level
+        return 0
+
+
+def profile_document(doc, sample_pages: int = SAMPLE_PAGES) -> LayoutProfile:
+    """Body/heading font sizes and running headers/footers from evenly spaced sample pages."""
+    count = len(doc)
+    if not count:
+        return LayoutProfile()
+    step = max(1, count // sample_pages)
+    indices = range(0, count, step)
+    size_chars: Counter = Counter()
+    margin_lines: Counter = Counter()
+    for i in indices:
+        page = doc[i]
+        seen = set()
+        for line in _page_lines(page):
+            size_chars[line.size] += len(line.text)
+            if _in_margin(line, page.rect.height):
+                seen.add(_normalize(line.text))
+        margin_lines.update(seen)
+    if not size_chars:
+        return LayoutProfile()
+    body = size_chars.most_common(1)[0][0]
+    threshold = max(2, BOILERPLATE_SHARE * len(indices))
+    return LayoutProfile(
+        body_size=body,
+        heading_sizes=sorted((s for s in size_chars if s >= body * HEADING_RATIO), reverse=True)[:4],
+        boilerplate={text for text, n in margin_lines.items() if n >= threshold},
+    )
+
+
+def _is_boilerplate(line: _Line, height: float, profile: LayoutProfile) -> bool:
+    if not _in_margin(line, height):
+        return False
+    normalized = _normalize(line.text)
+    return normalized in profile.boilerplate or bool(_PAGE_NUMBER.match(normalized))
+
+
+def _looks_like_heading(text: str) -> bool:
+    return 1 < len(text) <= 150 and any(c.isalpha() for c in text) and not text.endswith((".", ",", ";"))
+
+
+def _toc_by_page(doc) -> Dict[int, List[Tuple[int, str]]]:
+    toc: Dict[int, List[Tuple[int, str]]] = {}
+    for level, title, page in doc.get_toc(simple=True):
+        if page >= 1 and title.strip():
+            toc.setdefault(page, []).append((level, title.strip()))
+    return toc
+
+
+def _match_toc(entries: List[Tuple[int, str]], lines: List[_Line]) -> Dict[int, List[Tuple[int, str]]]:
+    """Line index at which each TOC entry of a page starts; unmatched entries start with the previous one."""
+    starts: Dict[int, List[Tuple[int, str]]] = {}
+    position = 0
+    for level, title in entries:
+        wanted = _title_key(title)
+        for i in range(position + 1 if starts else 0, len(lines)):
+            text = _title_key(lines[i].text)
+            if len(text) >= 3 and (text == wanted or wanted.startswith(text) or text.startswith(wanted)):
+                position = i
+                break
+        starts.setdefault(position, []).append((level, title))
+    return starts
+
+
+@dataclass
+class _Chunk:
+    parts: List[str] = field(default_factory=list)
+    size: int = 0
+    # Characters carried over from the previous chunk of the same section
+    overlap: int = 0
+    first_page: int = 0
+    last_page: int = 0
+    images: List[str] = field(default_factory=list)
+
+
+def iter_structured_chunks(filepath: str, stats: Optional[Dict] = None, chunk_chars: int = CHUNK_CHARS) -> Iterator[Document]:
+    """Yield section-coherent chunks of a PDF (about `chunk_chars` each), reading it one page at a time."""
+    splitter = _splitter if chunk_chars == CHUNK_CHARS else RecursiveCharacterTextSplitter(
+        chunk_size=chunk_chars, chunk_overlap=min(OVERLAP_CHARS, chunk_chars // 5)
+    )
+    stats = stats if stats is not None else {}
+    for key in ("pages", "image_only_pages", "boilerplate_lines", "dropped_chunks", "chunks"):
+        stats.setdefault(key, 0)
+    doc = fitz.open(filepath)
+    try:
+        profile = profile_document(doc)
+        toc = _toc_by_page(doc)
+        section: List[Tuple[int, str]] = []
+        chunk = _Chunk()
+
+        def emit(carry_overlap: bool) -> Optional[Document]:
+            nonlocal chunk
+            text = "\n\n".join(chunk.parts).strip()
+            previous = chunk
+            chunk = _Chunk(first_page=previous.last_page, last_page=previous.last_page)
+            if len(text) - previous.overlap < MIN_CHUNK_CHARS:
+                # Too little text to be worth an embedding: keep its images for the next chunk
+                if text:
+                    stats["dropped_chunks"] += 1
+                chunk.images = previous.images
+                chunk.first_page = previous.first_page
+                if carry_overlap:
+                    chunk.parts, chunk.size, chunk.overlap = previous.parts, previous.size, previous.overlap
+                return None
+            if carry_overlap and OVERLAP_CHARS:
+                tail = text[-OVERLAP_CHARS:]
+                tail = tail[tail.find(" ") + 1:] if " " in tail else tail
+                chunk.parts, chunk.size, chunk.overlap = [tail], len(tail), len(tail)
+            path = " > ".join(title for _, title in section)
+            pages = f"Page {previous.first_page}" if previous.first_page == previous.last_page else f"Pages {previous.first_page}-{previous.last_page}"
+            header = f"[{pages}]" + (f"\n[Section: {path}]" if path else "")
+            stats["chunks"] += 1
+            return Document(
+                page_content=f"{header}\n{text}",
+                metadata={
+                    "source": filepath,
+                    "page": previous.first_page,
+                    "page_end": previous.last_page,
+                    "section": path,
+                    "section_level": section[-1][0] if section else 0,
+                    "images": json.dumps(previous.images),
+                },
+            )
+
+        def start_section(level: int, title: str) -> Optional[Document]:
+            nonlocal section
+            flushed = emit(carry_overlap=False)
+            section = [entry for entry in section if entry[0] < level] + [(level, title)]
+            return flushed
+
+        def add_paragraph(text: str) -> Iterator[Document]:
+            pieces = splitter.split_text(text) if len(text) > chunk_chars else [text]
+            for piece in pieces:
+                if chunk.size - chunk.overlap > 0 and chunk.size + len(piece) > chunk_chars:
+                    flushed = emit(carry_overlap=True)
+                    if flushed:
+                        yield flushed
+                chunk.parts.append(piece)
+                chunk.size += len(piece) + 2
+
+        for page_index in range(len(doc)):
+            page = doc[page_index]
+            page_number = page_index + 1
+            stats["pages"] += 1
+            if chunk.size - chunk.overlap <= 0 and not chunk.images:
+                chunk.first_page = page_number
+            chunk.last_page = page_number
+            chunk.images.extend(page_images(doc, page))
+
+            height = page.rect.height
+            lines = []
+            for line in _page_lines(page):
+                if _is_boilerplate(line, height, profile):
+                    stats["boilerplate_lines"] += 1
+                else:
+                    lines.append(line)
+            if not lines:
+                stats["image_only_pages"] += 1
+
+            toc_starts = _match_toc(toc[page_number], lines) if page_number in toc else {}
+            paragraph: List[str] = []
+            previous_block = None
+            heading: Optional[_Line] = None
+            for i, line in enumerate(lines):
+                entries = toc_starts.get(i, [])
+                level = 0
+                if not toc and _looks_like_heading(line.text):
+                    level = profile.heading_level(line.size)
+                is_heading = bool(entries) or bool(level)
+                if is_heading or line.block != previous_block:
+                    if paragraph:
+                        yield from add_paragraph("\n".join(paragraph))
+                        paragraph = []
+                previous_block = line.block
+                if entries:
+                    for entry_level, title in entries:
+                        flushed = start_section(entry_level, title)
+                        if flushed:
+                            yield flushed
+                    chunk.first_page = chunk.last_page = page_number
+                    # The matched title line itself is carried by the section path
+                    if _title_key(line.text) in {_title_key(t) for _, t in entries}:
+                        continue
+                elif level:
+                    # Headings wrapped over several lines of the same block form one title
+                    if heading and heading.block == line.block and heading.size == line.size and section:
+                        section[-1] = (section[-1][0], f"{section[-1][1]} {line.text}")
+                    else:
+                        flushed = start_section(level, line.text)
+                        if flushed:
+                            yield flushed
+                        chunk.first_page = chunk.last_page = page_number
+                    heading = line
+                    continue
+                heading = None
+                paragraph.append(line.text)
+            # TOC entries starting a page with no text lines still open their section
+            if not lines:
+                for entry_level, title in toc_starts.get(0, []):
+                    flushed = start_section(entry_level, title)
+                    if flushed:
+                        yield flushed
+            if paragraph:
+                yield from add_paragraph("\n".join(paragraph))
+
+        flushed = emit(carry_overlap=False)
+        if flushed:
+            yield flushed
+        elif chunk.images and stats["chunks"] == 0:
+            # An image-only document still gets one chunk so its images stay retrievable
+            stats["chunks"] += 1
+            yield Document(
+                page_content=f"[Page {chunk.first_page}]",
+                metadata={"source": filepath, "page": chunk.first_page, "page_end": chunk.last_page,
+                          "section": "", "section_level": 0, "images": json.dumps(chunk.images)},
+            )
+    finally:
+        doc.close()
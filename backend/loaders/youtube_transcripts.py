@@ -0,0 +1,164 @@
+"""
+Shared YouTube transcript cache and bounded transcript fetching.
+
+Transcripts are stored in the local database keyed by (video_id, language) and
+shared by every user, so a popular lecture is fetched from YouTube once. Cache
+misses go through a fixed-size worker pool with a per-URL timeout, and
+concurrent uploads of the same video share one fetch.
+
+Where transcripts come from:
+- YOUTUBE_TRANSCRIPT_DIR set: local files `<video_id>.<language>.txt` (or
+  `<video_id>.txt`), for tests and air-gapped deployments
+- offline mode (SCAFFOLD_OFFLINE=1) otherwise: a deterministic synthetic transcript
+- otherwise: YouTube, via langchain's YoutubeLoader
+"""
+import asyncio
+import contextvars
+import functools
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from langchain_community.document_loaders import YoutubeLoader
+from tools.local_db import get_connection, init_schema
+from tools.metrics import timed
+from tools.offline import OFFLINE
+from tools.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+LANGUAGE = os.getenv("YOUTUBE_LANGUAGE", "en")
+WORKERS = int(os.getenv("YOUTUBE_WORKERS", "4"))
+TIMEOUT_SECONDS = float(os.getenv("YOUTUBE_TIMEOUT_SECONDS", "30"))
+TRANSCRIPT_DIR = os.getenv("YOUTUBE_TRANSCRIPT_DIR")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS youtube_transcripts (
+    video_id TEXT NOT NULL,
+    language TEXT NOT NULL,
+    transcript TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (video_id, language)
+);
+"""
+_schema_ready = False
+
+_executor = ThreadPoolExecutor(max_workers=max(1, WORKERS), thread_name_prefix="youtube")
+_flight = SingleFlight("youtube_transcript")
+
+transcript_stats = {
+    "cache_hits": 0,
+    "fetched": 0,
+    "fetch_seconds": 0.0,
+    "timeouts": 0,
+    "errors": 0,
+}
+
+
+def _db():
+    global _schema_ready
+    if not _schema_ready:
+        init_schema(_SCHEMA)
+        _schema_ready = True
+    return get_connection()
+
+
+def video_id_for(url: str) -> str:
+    """Video ID of a YouTube URL (raises ValueError for unrecognized URLs)."""
+    return YoutubeLoader.extract_video_id(url)
+
+
+def fetch_from_youtube(video_id: str, language: str) -> str:
+    docs = YoutubeLoader(video_id, add_video_info=False, language=[language]).load()
+    return "\n".join(d.page_content for d in docs)
+
+
+class LocalTranscripts:
+    """Transcript stand-in that reads `<video_id>.<language>.txt` / `<video_id>.txt` from a directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def __call__(self, video_id: str, language: str) -> str:
+        for name in (f"{video_id}.{language}.txt", f"{video_id}.txt"):
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    return f.read()
+        raise FileNotFoundError(f"No local transcript for video {video_id}")
+
+
+def synthetic_transcript(video_id: str, language: str) -> str:
+    """Deterministic lecture-like transcript for offline runs."""
+    seed = int(hashlib.sha256(video_id.encode()).hexdigest(), 16)
+    topics = ["limits", "derivatives", "integrals", "vectors", "matrices", "probability", "entropy", "recursion"]
+    picked = [topics[(seed >> (4 * i)) % len(topics)] for i in range(4)]
+    return " ".join(
+        f"In this part of lecture {video_id} we discuss {t}, define the key terms and work through an example."
+        for t in picked * 10
+    )
+
+
+if TRANSCRIPT_DIR:
+    fetch_transcript: Callable[[str, str], str] = LocalTranscripts(TRANSCRIPT_DIR)
+elif OFFLINE:
+    fetch_transcript = synthetic_transcript
+else:
+    fetch_transcript = fetch_from_youtube
+
+
+def set_transcript_fetcher(fetcher: Callable[[str, str], str]) -> None:
+    """Swap the transcript source (e.g. LocalTranscripts in tests)."""
+    global fetch_transcript
+    fetch_transcript = fetcher
+
+
+def _cached(video_id: str, language: str) -> Optional[str]:
+    row = _db().execute(
+        "SELECT transcript FROM youtube_transcripts WHERE video_id = ? AND language = ?", (video_id, language)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _fetch_and_store(video_id: str, language: str) -> str:
+    start = time.perf_counter()
+    with timed("youtube_transcript"):
+        transcript = fetch_transcript(video_id, language)
+    transcript_stats["fetched"] += 1
+    transcript_stats["fetch_seconds"] += time.perf_counter() - start
+    _db().execute(
+        "INSERT OR REPLACE INTO youtube_transcripts VALUES (?, ?, ?, ?)",
+        (video_id, language, transcript, time.time()),
+    )
+    return transcript
+
+
+async def get_transcript(url: str, language: str = LANGUAGE, timeout: float = TIMEOUT_SECONDS) -> str:
+    """Transcript text for a YouTube URL: local cache first, then one bounded, timed fetch."""
+    video_id = video_id_for(url)
+    cached = await asyncio.to_thread(_cached, video_id, language)
+    if cached is not None:
+        transcript_stats["cache_hits"] += 1
+        return cached
+
+    async def fetch():
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(_executor, functools.partial(context.run, _fetch_and_store, video_id, language))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            transcript_stats["timeouts"] += 1
+            raise TimeoutError(f"Transcript fetch for {video_id} timed out after {timeout:g}s")
+        except Exception:
+            transcript_stats["errors"] += 1
+            raise
+
+    return await _flight.run((video_id, language), fetch)
+
+
+def report() -> Dict:
+    return {**transcript_stats, "in_flight": _flight.stats["in_flight"], "coalesced": _flight.stats["coalesced"]}
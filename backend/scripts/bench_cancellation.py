@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Cancellation Benchmark
+
+Drives the ASGI app in offline mode with a burst of /tutor and /quizes
+requests plus one PDF upload, under a tight model quota (LLM_RPM, 60 here) so calls
+queue as they would at peak hours. A share of the clients (--leave-share)
+disconnects after a random 0.5-3 s, like students navigating away. Runs
+once without and once with the request deadline middleware.
+
+Reports model calls sent, model seconds and tokens spent, embedding calls,
+how many calls the cancelled requests skipped, and the latency of the
+requests whose clients stayed.
+
+Usage:
+    cd backend
+    python scripts/bench_cancellation.py --requests 24 --leave-share 0.5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+os.environ.setdefault("LLM_RPM", "60")
+os.environ.setdefault("LLM_TPM", "1000000000")
+os.environ.setdefault("EMBED_RPM", "600")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_cancel_"), "scaffold.db"))
+
+from bench_outline_presummarize import write_textbook
+
+import app as app_module
+from loaders.multiple_file import load_directory
+from tools import embeddings as embeddings_module
+from tools import model as model_module
+from tools import vector_store
+from tools.deadline import RequestDeadlineMiddleware
+from tools.llm_scheduler import chat_scheduler
+from tools.metrics import CANCELLED_WORK
+from tools.model import route_metrics
+
+USER_ID = "bench-cancel-user"
+
+
+class CountingEmbedder:
+    def __init__(self, inner):
+        self.calls = 0
+        self._documents, self._query = inner.embed_documents, inner.embed_query
+        inner.embed_documents, inner.embed_query = self.embed_documents, self.embed_query
+
+    def embed_documents(self, texts, **kwargs):
+        self.calls += 1
+        return self._documents(texts, **kwargs)
+
+    def embed_query(self, text, **kwargs):
+        self.calls += 1
+        return self._query(text, **kwargs)
+
+
+def _multipart(path: str, boundary: str = "benchboundary") -> bytes:
+    with open(path, "rb") as f:
+        data = f.read()
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="user_id"\r\n\r\n{USER_ID}-upload\r\n'.encode(),
+        f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="upload.pdf"\r\n'
+        f"Content-Type: application/pdf\r\n\r\n".encode() + data + b"\r\n",
+        f"--{boundary}--\r\n".encode(),
+    ]
+    return b"".join(parts)
+
+
+async def request(asgi, path: str, body: bytes, content_type: str, leave_after=None):
+    """One HTTP exchange; the client disconnects after `leave_after` seconds if still waiting."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+    done = asyncio.Event()
+    state = {"body_sent": False, "status": None}
+    start = time.perf_counter()
+
+    async def receive():
+        if not state["body_sent"]:
+            state["body_sent"] = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        try:
+            await asyncio.wait_for(done.wait(), leave_after)
+        except asyncio.TimeoutError:
+            pass
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            state["status"] = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await asyncio.wait({asyncio.ensure_future(asgi(scope, receive, send))}, timeout=leave_after)
+    # A client that left stops listening; the server's work carries on in the background
+    left = not done.is_set() and leave_after is not None
+    if not left:
+        await done.wait()
+    return left, state["status"], time.perf_counter() - start
+
+
+def _skipped() -> float:
+    return sum(
+        sample.value for metric in CANCELLED_WORK.collect() for sample in metric.samples
+        if sample.name.endswith("_total") and sample.labels.get("outcome") == "skipped"
+    )
+
+
+async def _settle():
+    """Wait until no model call is queued or running (work of abandoned requests included)."""
+    idle_since = None
+    while True:
+        busy = chat_scheduler.stats["waiting"] or route_metrics._started
+        if busy:
+            idle_since = None
+        elif idle_since is None:
+            idle_since = time.perf_counter()
+        elif time.perf_counter() - idle_since > 1.0:
+            return
+        await asyncio.sleep(0.1)
+
+
+async def run(label: str, asgi, args, upload_body: bytes, embedder: CountingEmbedder):
+    rng = random.Random(args.seed)
+    route_metrics.totals.clear()
+    embedder.calls = 0
+    skipped_before = _skipped()
+    start = time.perf_counter()
+    jobs = []
+    for i in range(args.requests):
+        leave = rng.uniform(0.5, 3.0) if rng.random() < args.leave_share else None
+        if i % 3 == 2:
+            body = json.dumps({"text": f"Quiz part {i} of the course", "user_id": USER_ID, "question_count": 30})
+            jobs.append(request(asgi, "/quizes", body.encode(), "application/json", leave))
+        else:
+            body = json.dumps({"text": f"topic: Course, subtopic: Part {i}", "adapt": "5", "user_id": USER_ID})
+            jobs.append(request(asgi, "/tutor", body.encode(), "application/json", leave))
+    jobs.append(request(asgi, "/upload_pdfs", upload_body, "multipart/form-data; boundary=benchboundary", 1.0))
+    results = await asyncio.gather(*jobs)
+    await _settle()
+    elapsed = time.perf_counter() - start
+
+    totals = route_metrics.totals.values()
+    calls = sum(t["calls"] for t in totals)
+    seconds = sum(t["seconds"] for t in totals)
+    tokens = sum(t["input_tokens"] + t["output_tokens"] for t in totals)
+    stayed = [latency for left, status, latency in results if not left]
+    ok = sum(1 for left, status, _ in results if not left and status == 200)
+    left = sum(1 for left, _, _ in results if left)
+    p50 = statistics.median(stayed) if stayed else 0.0
+    print(f"{label:>13} {left:>5} {ok:>3}/{len(stayed):<3} {calls:>6} {seconds:>9.1f} {tokens:>9,} "
+          f"{embedder.calls:>6} {_skipped() - skipped_before:>8.0f} {p50:>8.2f} {elapsed:>8.1f}")
+
+
+async def main(args):
+    await asyncio.to_thread(vector_store.connect)
+    app_module.init_agent()
+    for route in model_module.ROUTES:
+        model_module.chat_model(route).latency = args.call_ms / 1000
+        if model_module.ROUTES[route].cascade:
+            model_module.chat_model(route, cascade=True).latency = args.call_ms / 1000
+    course_dir = tempfile.mkdtemp(prefix="bench_cancel_course_")
+    write_textbook(os.path.join(course_dir, "textbook.pdf"), 60)
+    await load_directory(course_dir, [], USER_ID)
+    upload_dir = tempfile.mkdtemp(prefix="bench_cancel_upload_")
+    write_textbook(os.path.join(upload_dir, "upload.pdf"), args.upload_pages, seed=3)
+    upload_body = _multipart(os.path.join(upload_dir, "upload.pdf"))
+    embedder = CountingEmbedder(embeddings_module.embeddings.inner)
+
+    app = app_module.app
+    with_deadlines = app.build_middleware_stack()
+    app.user_middleware = [m for m in app.user_middleware if m.cls is not RequestDeadlineMiddleware]
+    without_deadlines = app.build_middleware_stack()
+
+    print("=" * 60)
+    print("CANCELLATION BENCHMARK")
+    print("=" * 60)
+    print(f"{args.requests} requests + 1 upload ({args.upload_pages} pages, client leaves after 1 s), "
+          f"{args.leave_share:.0%} of clients leave after 0.5-3 s; "
+          f"LLM_RPM {os.environ['LLM_RPM']}, {args.call_ms:.0f} ms per call\n")
+    print(f"{'':>13} {'left':>5} {'ok/stayed':>9} {'calls':>6} {'model s':>9} {'tokens':>9} "
+          f"{'embeds':>6} {'skipped':>8} {'p50 s':>8} {'wall s':>8}")
+    await run("no deadlines", without_deadlines, args, upload_body, embedder)
+    # Fresh user for the upload so it is not skipped as unchanged
+    upload_body = upload_body.replace(f"{USER_ID}-upload".encode(), f"{USER_ID}-upload2".encode())
+    await run("deadlines", with_deadlines, args, upload_body, embedder)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--requests", type=int, default=24)
+    parser.add_argument("--leave-share", type=float, default=0.5)
+    parser.add_argument("--call-ms", type=float, default=1500)
+    parser.add_argument("--upload-pages", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Chat Memory Benchmark
+
+Plays a long /chatbot conversation in offline mode two ways: the old client
+pattern (every message resends the whole transcript in `text`) and server-side
+sessions (rolling summary + token-capped recent window + condensed retrieval
+question). Prints model input tokens and latency per turn.
+
+Usage:
+    cd backend
+    python scripts/bench_chat_memory.py --turns 120
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+# Measure prompt growth, not admission control
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ.setdefault("LLM_TPM", "1000000000")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_chat_"), "scaffold.db"))
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+
+from llm_services import bot
+from tools.model import model
+from tools.vector_store import add_documents_for_user
+
+USER_ID = "bench-chat-user"
+TOPICS = ["complex numbers", "polar form", "de Moivre's theorem", "roots of unity", "Euler's formula", "conjugates"]
+
+
+class InputTokenCounter(BaseCallbackHandler):
+    def __init__(self):
+        self.tokens = 0
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                self.tokens += (getattr(generation.message, "usage_metadata", None) or {}).get("input_tokens", 0)
+
+
+def question(turn: int) -> str:
+    topic = TOPICS[turn % len(TOPICS)]
+    return f"Turn {turn}: can you explain {topic} again, and how it relates to what we discussed before?"
+
+
+async def play(turns: int, sessions: bool, counter: InputTokenCounter):
+    transcript = ""
+    rows = []
+    for turn in range(turns):
+        q = question(turn)
+        text = q if sessions else f"{transcript}\nStudent: {q}"
+        counter.tokens = 0
+        start = time.perf_counter()
+        answer = await bot.ask_chatbot(text, USER_ID, session_id="bench" if sessions else None)
+        elapsed = time.perf_counter() - start
+        rows.append((counter.tokens, elapsed))
+        transcript += f"\nStudent: {q}\nAssistant: {answer}"
+        # Think time between messages: background summarization finishes here
+        while bot._background_tasks:
+            await asyncio.gather(*list(bot._background_tasks))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--turns", type=int, default=120)
+    args = parser.parse_args()
+
+    add_documents_for_user(
+        [Document(page_content=f"{t.title()}: notes on {t} with worked examples.", metadata={"page": i}) for i, t in enumerate(TOPICS)],
+        USER_ID,
+    )
+    counter = InputTokenCounter()
+    model.callbacks.append(counter)
+
+    print("=" * 60)
+    print("CHAT MEMORY BENCHMARK")
+    print("=" * 60)
+    resend = asyncio.run(play(args.turns, False, counter))
+    session = asyncio.run(play(args.turns, True, counter))
+
+    print(f"\n{'turn':>6} {'resend tokens':>14} {'resend ms':>10} {'session tokens':>15} {'session ms':>11}")
+    step = max(1, args.turns // 10)
+    for turn in list(range(0, args.turns, step)) + [args.turns - 1]:
+        (rt, rs), (st, ss) = resend[turn], session[turn]
+        print(f"{turn + 1:>6} {rt:>14} {rs * 1000:>10.1f} {st:>15} {ss * 1000:>11.1f}")
+    print(f"\ntotal input tokens: resend {sum(r[0] for r in resend)}, sessions {sum(r[0] for r in session)}")
+
+
+if __name__ == "__main__":
+    main()
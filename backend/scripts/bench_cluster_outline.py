@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Cluster Outline Benchmark
+
+Builds a fixture textbook (--pages, with chapters and sections), ingests it
+into the offline vector store, then builds its outline in offline mode twice:
+with the map-reduce outline (the LLM reads the pre-summarized text) and with
+the cluster outline (k-means over the stored chunk vectors, the LLM only names
+the clusters). Ingestion is needed by both and is timed once, separately.
+
+Reports LLM calls, input/output tokens, estimated cost and wall time per mode
+(the fake model sleeps --call-ms per call plus --token-ms per input token,
+standing in for prompt processing), the number of topics, and for the
+clusters their section cohesion: the share of each section's chunks that land
+in the same cluster (sections split across topics lower it).
+
+Usage:
+    cd backend
+    python scripts/bench_cluster_outline.py --pages 300,1500
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("LLM_TPM", "1000000000")
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_cluster_"), "scaffold.db"))
+
+from bench_outline_presummarize import write_textbook
+
+from llm_services import cluster_outline, outline
+from loaders.multiple_file import load_directory
+from tools import model as model_module
+from tools.model import route_metrics
+from tools.vector_store import scroll_vectors_for_user
+
+USER_ID = "bench-cluster-user"
+
+
+def _slow_by_input(args):
+    """Make each fake call also sleep for its input tokens, like prompt processing on a real model."""
+    for route in ("outline_map", "outline_reduce", "outline_names"):
+        fake = model_module.chat_model(route)
+        fake.latency = args.call_ms / 1000
+    original = model_module.RouteMetrics.on_chat_model_start
+
+    def on_start(self, serialized, messages, **kwargs):
+        original(self, serialized, messages, **kwargs)
+        text = " ".join(str(m.content) for batch in messages for m in batch)
+        time.sleep(len(text) / 4 * args.token_ms / 1000)
+
+    model_module.RouteMetrics.on_chat_model_start = on_start
+
+
+def _cohesion(topics, documents) -> float:
+    cluster_of = {int(i): t for t, topic in enumerate(topics) for i in topic["members"]}
+    by_section = {}
+    for i, t in cluster_of.items():
+        by_section.setdefault((documents[i].metadata or {}).get("section", ""), []).append(t)
+    kept = sum(Counter(clusters).most_common(1)[0][1] for clusters in by_section.values())
+    return kept / max(1, len(cluster_of))
+
+
+async def run(label: str, build):
+    route_metrics.totals.clear()
+    start = time.perf_counter()
+    result = await build()
+    elapsed = time.perf_counter() - start
+    totals = route_metrics.totals.values()
+    calls = sum(t["calls"] for t in totals)
+    input_tokens = sum(t["input_tokens"] for t in totals)
+    output_tokens = sum(t["output_tokens"] for t in totals)
+    cost = sum(t["cost_usd"] for t in totals)
+    topics = len(result.topics) if result else 0
+    return label, calls, input_tokens, output_tokens, cost, elapsed, topics
+
+
+async def main(args):
+    _slow_by_input(args)
+    print("=" * 60)
+    print("CLUSTER OUTLINE BENCHMARK")
+    print("=" * 60)
+    print(f"LLM call {args.call_ms:.0f} ms + {args.token_ms} ms/input token\n")
+    print(f"{'pages':>6} {'mode':>11} {'calls':>6} {'in tokens':>10} {'out tokens':>11} "
+          f"{'cost $':>8} {'seconds':>8} {'topics':>7} {'cohesion':>9}")
+    for pages in [int(p) for p in args.pages.split(",")]:
+        course_dir = tempfile.mkdtemp(prefix="bench_cluster_course_")
+        write_textbook(os.path.join(course_dir, "textbook.pdf"), pages)
+        user_id = f"{USER_ID}-{pages}"
+        start = time.perf_counter()
+        await load_directory(course_dir, [], user_id)
+        ingest = time.perf_counter() - start
+
+        rows = [
+            await run("map_reduce", lambda: outline.create_outline(course_dir, [], user_id)),
+            await run("cluster", lambda: cluster_outline.cluster_outline(user_id, ["textbook.pdf"])),
+        ]
+        vectors, documents = scroll_vectors_for_user(user_id, None, cluster_outline.OUTLINE_CLUSTER_MAX_POINTS)
+        cohesion = _cohesion(cluster_outline.cluster_corpus(vectors, documents), documents)
+        for label, calls, input_tokens, output_tokens, cost, elapsed, topics in rows:
+            shown = f"{cohesion:>9.0%}" if label == "cluster" else f"{'-':>9}"
+            print(f"{pages:>6} {label:>11} {calls:>6} {input_tokens:>10,} {output_tokens:>11,} "
+                  f"{cost:>8.4f} {elapsed:>8.2f} {topics:>7} {shown}")
+        print(f"{pages:>6} {'(ingest)':>11} {len(documents):>6} chunks in {ingest:.2f}s, shared by both modes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--pages", default="300,1500")
+    parser.add_argument("--call-ms", type=float, default=1500)
+    parser.add_argument("--token-ms", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Hedged Requests Benchmark
+
+Generates --calls text lessons and --calls vision lessons in offline mode,
+--concurrency at a time, against fake models with injected latency tails: a
+lognormal jitter on every call, a slow share (--slow-rate) that takes
+--slow-ms longer, and vision calls that also fail outright (--vision-error-rate).
+Runs once with the previous policy (no hedging; a failed vision call is
+followed by a text-only call) and once per --percentiles with the hedged
+policy (a backup after that percentile of the route's recent latencies; the
+vision call raced against a text-only lesson).
+
+Reports lesson latency percentiles, model calls per lesson (the extra load of
+the backups) and how often the backup won. Vision lessons use
+gemini-2.5-flash as their model here so they have their own fake; cascades
+are off so only hedging differs between runs.
+
+Usage:
+    cd backend
+    python scripts/bench_hedging.py --calls 300 --concurrency 16
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("LLM_TPM", "1000000000")
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_hedging_"), "scaffold.db"))
+
+from langchain_core.messages import HumanMessage
+
+from llm_services import bot
+from tools import model as model_module
+from tools.lesson_schema import Lesson
+from tools.llm_scheduler import INTERACTIVE, llm_priority
+from tools.model import chat_model, route_metrics
+from tools.structured import generate_structured
+
+VISION_MODEL = "gemini-2.5-flash"
+PROMPT = (
+    "Convert the user's notes into a lesson with lesson_phases.\n\nContext:\n"
+    "Photosynthesis converts light energy into chemical energy stored in glucose. Chlorophyll absorbs "
+    "light; the Calvin cycle fixes carbon dioxide.\n\nUser Query: topic: Biology, subtopic: Photosynthesis"
+)
+IMAGE = "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+
+
+def tune_fakes(args):
+    for route in ("lesson", "lesson_vision"):
+        model_module.ROUTES[route] = replace(model_module.ROUTES[route], cascade=None)
+    model_module.ROUTES["lesson_vision"] = replace(model_module.ROUTES["lesson_vision"], model=VISION_MODEL)
+    for route, latency, error_rate, seed in (
+        ("lesson", args.text_ms, 0.0, args.seed),
+        ("lesson_vision", args.vision_ms, args.vision_error_rate, args.seed + 1),
+    ):
+        fake = chat_model(route)
+        fake.latency, fake.jitter, fake.error_rate = latency / 1000, args.jitter, error_rate
+        fake.slow_rate, fake.slow_latency = args.slow_rate, args.slow_ms / 1000
+        fake._rng = random.Random(seed)
+
+
+def text_lesson():
+    return generate_structured("lesson", [HumanMessage(content=PROMPT)], Lesson, "llm_lesson", bot.lesson_complete)
+
+
+def vision_messages():
+    return [HumanMessage(content=[{"type": "text", "text": PROMPT}, {"type": "image_url", "image_url": {"url": IMAGE}}])]
+
+
+def vision_lesson_sequential():
+    """The policy before hedging: the text-only lesson only after the vision call failed."""
+    try:
+        return generate_structured("lesson_vision", vision_messages(), Lesson, "llm_lesson_vision", bot.lesson_complete)
+    except Exception:
+        return text_lesson()
+
+
+def vision_lesson_hedged():
+    return generate_structured(
+        "lesson_vision", vision_messages(), Lesson, "llm_lesson_vision", bot.lesson_complete, text_lesson
+    )
+
+
+def _timed(fn):
+    llm_priority.set(INTERACTIVE)
+    start = time.perf_counter()
+    try:
+        ok = fn() is not None
+    except Exception:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_many(fn, calls: int, concurrency: int):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(lambda _: _timed(fn), range(calls)))
+
+
+def _percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def set_hedging(percentile):
+    for route in ("lesson", "lesson_vision"):
+        model_module.ROUTES[route] = replace(model_module.ROUTES[route], hedge=percentile)
+
+
+def measure(label: str, workload: str, fn, args):
+    route_metrics.totals.clear()
+    results = run_many(fn, args.calls, args.concurrency)
+    seconds = [s for s, _ in results]
+    failed = sum(1 for _, ok in results if not ok)
+    totals = route_metrics.report()
+    calls = sum(totals[r].get("calls", 0) for r in ("lesson", "lesson_vision"))
+    hedges = sum(totals[r].get("hedges", 0) for r in ("lesson", "lesson_vision"))
+    won = sum(totals[r].get("hedges_won", 0) for r in ("lesson", "lesson_vision"))
+    print(f"{workload:>7} {label:>12} {_percentile(seconds, 0.5):>7.2f} {_percentile(seconds, 0.95):>7.2f} "
+          f"{_percentile(seconds, 0.99):>7.2f} {max(seconds):>7.2f} {calls / args.calls:>10.2f} "
+          f"{hedges:>7} {won:>5} {failed:>7}")
+
+
+def main(args):
+    tune_fakes(args)
+    # Fill the latency windows the hedge percentile is taken from
+    set_hedging(None)
+    run_many(text_lesson, args.warmup, args.concurrency)
+    run_many(vision_lesson_sequential, args.warmup, args.concurrency)
+
+    print("=" * 60)
+    print("HEDGED REQUESTS BENCHMARK")
+    print("=" * 60)
+    print(f"{args.calls} lessons per workload, {args.concurrency} at a time; text {args.text_ms:.0f} ms, "
+          f"vision {args.vision_ms:.0f} ms, jitter {args.jitter}, {args.slow_rate:.0%} slow by {args.slow_ms:.0f} ms, "
+          f"{args.vision_error_rate:.0%} of vision calls fail\n")
+    print(f"{'':>7} {'policy':>12} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'max s':>7} {'calls/req':>10} "
+          f"{'backups':>7} {'won':>5} {'failed':>7}")
+    for workload, before, after in (
+        ("text", text_lesson, text_lesson),
+        ("vision", vision_lesson_sequential, vision_lesson_hedged),
+    ):
+        set_hedging(None)
+        measure("sequential", workload, before, args)
+        for percentile in args.percentiles:
+            set_hedging(percentile)
+            measure(f"hedged p{percentile * 100:g}", workload, after, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--text-ms", type=float, default=400)
+    parser.add_argument("--vision-ms", type=float, default=700)
+    parser.add_argument("--jitter", type=float, default=0.25)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-ms", type=float, default=6000)
+    parser.add_argument("--vision-error-rate", type=float, default=0.05)
+    parser.add_argument("--percentiles", type=float, nargs="+", default=[0.9, 0.95])
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
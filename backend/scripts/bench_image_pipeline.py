@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Image Pipeline Benchmark
+
+Compares what the vision path sends per /tutor request before (first five
+raw data URLs at original resolution) and after tools/image_pipeline
+(ranked, decorative/duplicate images dropped, downscaled, cached). One photo
+also appears on another page as a JPEG copy, as when a PDF embeds the same
+figure twice, so it differs from the original in bytes but not in content.
+
+Usage:
+    cd backend
+    python scripts/bench_image_pipeline.py --uplink-mbps 20
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+import numpy as np
+from langchain_core.documents import Document
+
+from tools.image_pipeline import select_images
+
+
+def _photo(width: int, height: int, seed: int) -> fitz.Pixmap:
+    """A photo-like image: smooth shapes under sensor noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width] / max(width, height)
+    fx, fy, phase = rng.uniform(2, 6, 3)
+    scene = 96 + 48 * np.sin(fx * x * np.pi + phase) * np.cos(fy * y * np.pi)
+    # Low-amplitude noise on top: PNG can't compress it, JPEG can
+    pixels = scene[..., None] + rng.normal(0, 12, (height, width, 3))
+    samples = np.clip(pixels, 0, 255).astype(np.uint8).tobytes()
+    return fitz.Pixmap(fitz.csRGB, width, height, samples, False)
+
+
+def _data_url(pix: fitz.Pixmap, fmt: str = "png") -> str:
+    data = pix.tobytes("jpeg", jpg_quality=90) if fmt == "jpeg" else pix.tobytes("png")
+    return f"data:image/{fmt};base64," + base64.b64encode(data).decode("utf-8")
+
+
+def build_docs():
+    photos = [_data_url(_photo(1600, 1200, s)) for s in range(3)]
+    # The first photo embedded again on another page, as a JPEG
+    photos.append(_data_url(_photo(1600, 1200, 0), "jpeg"))
+    icons = [_data_url(_photo(24, 24, 100 + s)) for s in range(4)]
+    docs = []
+    for rank in range(4):
+        # Every page carries the header logo; photos repeat across neighbouring chunks
+        images = [icons[0], icons[rank % 4], photos[rank % 4], photos[(rank + 1) % 4]]
+        docs.append(Document(page_content=f"[Page {rank + 1}] text", metadata={"images": json.dumps(images)}))
+    return docs
+
+
+def legacy_selection(docs):
+    images = []
+    for d in docs:
+        images.extend(json.loads(d.metadata["images"]))
+    return list(dict.fromkeys(images))[:5]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--uplink-mbps", type=float, default=20.0,
+                        help="Bandwidth used to estimate upload time to the model API")
+    args = parser.parse_args()
+    bytes_per_second = args.uplink_mbps * 1_000_000 / 8
+
+    docs = build_docs()
+    before = legacy_selection(docs)
+    before_bytes = sum(len(u) for u in before)
+
+    start = time.perf_counter()
+    after_cold, report = select_images(docs)
+    cold_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    after_warm, warm_report = select_images(docs)
+    warm_seconds = time.perf_counter() - start
+    after_bytes = sum(len(u) for u in after_cold)
+
+    print("=" * 60)
+    print("    IMAGE PIPELINE BENCHMARK")
+    print("=" * 60)
+    print(f"before: {len(before)} images, {before_bytes / 1024:8.1f} KB payload, "
+          f"~{before_bytes / bytes_per_second * 1000:6.0f} ms upload")
+    print(f"after:  {len(after_cold)} images, {after_bytes / 1024:8.1f} KB payload, "
+          f"~{after_bytes / bytes_per_second * 1000:6.0f} ms upload")
+    print(f"dropped: {report['dropped_decorative']} decorative, {report['dropped_duplicate']} duplicate, "
+          f"{report['dropped_budget']} over budget")
+    print(f"pipeline: {cold_seconds * 1000:.1f} ms cold, {warm_seconds * 1000:.1f} ms warm "
+          f"({warm_report['cache_hits']} cache hits, {warm_report['saved_processing_seconds'] * 1000:.1f} ms saved)")
+    upload_saved = (before_bytes - after_bytes) / bytes_per_second
+    print(f"latency saved per request: ~{(upload_saved - cold_seconds) * 1000:.0f} ms cold cache, "
+          f"~{(upload_saved - warm_seconds) * 1000:.0f} ms warm cache")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Ingestion Memory Benchmark
+
+Builds a synthetic --pages PDF (text plus one photo-like image per page) and
+measures peak RSS and time-to-first-batch of the ingestion pipeline, each mode
+in a fresh process:
+
+  legacy     whole-document List[Document] -> second list of chunks -> one
+             joined string per file -> 50k outline batches (the old loaders)
+  streaming  loaders/multiple_file page -> chunk generators with a bounded
+             queue, feeding both the outline batches and upsert batches
+  reduced    streaming, with the outline batches built from the extractive
+             reducer's output (--budget tokens per file, the default
+             OUTLINE_SOURCE_TOKENS), as create_outline does
+
+Upserts go to a discarding sink so only pipeline memory is measured (a remote
+Qdrant holds the vectors, not this process).
+
+Usage:
+    cd backend
+    python scripts/bench_ingest_memory.py --pages 1000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+
+import fitz  # PyMuPDF
+
+
+def build_pdf(path: str, pages: int):
+    rng = random.Random(0)
+    words = [f"term{i}" for i in range(500)]
+    # A 400x300 noisy image, re-used with different noise per 10 pages
+    images = []
+    for s in range(10):
+        samples = random.Random(s).randbytes(400 * 300 * 3)
+        images.append(fitz.Pixmap(fitz.csRGB, 400, 300, samples, False).tobytes("png"))
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        text = " ".join(rng.choice(words) for _ in range(450))
+        page.insert_textbox(fitz.Rect(40, 40, 560, 520), text, fontsize=9)
+        page.insert_image(fitz.Rect(40, 540, 440, 800), stream=images[p % 10])
+    doc.save(path)
+    doc.close()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_legacy(directory: str):
+    from loaders.multiple_file import extract_pdf_images_and_text, text_splitter
+
+    start = time.perf_counter()
+    first_batch = None
+    results = {}
+    for filename in os.listdir(directory):
+        docs = extract_pdf_images_and_text(os.path.join(directory, filename))
+        chunks = text_splitter.split_documents(docs)
+        results[filename] = "\n\n".join(chunk.page_content for chunk in chunks)
+    batches, current = [], ""
+    for filename, chunk_text in results.items():
+        formatted = f"\n\n=== SOURCE: {filename} ===\n{chunk_text}"
+        if current and len(current) + len(formatted) > 50000:
+            batches.append(current)
+            first_batch = first_batch or time.perf_counter() - start
+            current = formatted
+        else:
+            current += formatted
+    batches.append(current)
+    first_batch = first_batch or time.perf_counter() - start
+    # Upsert path parses again and holds the whole chunk list
+    docs = extract_pdf_images_and_text(os.path.join(directory, os.listdir(directory)[0]))
+    chunks = text_splitter.split_documents(docs)
+    return first_batch, time.perf_counter() - start, len(batches), len(chunks)
+
+
+def run_streaming(directory: str, token_budget: int = 0):
+    from loaders.multiple_file import INGEST_BATCH_CHUNKS, _batched, iter_directory_chunks, iterate_in_thread, stream_text_batches
+
+    async def main():
+        start = time.perf_counter()
+        first_batch, batches, chunks = None, 0, 0
+        async for _ in stream_text_batches(directory, [], 50000, token_budget=token_budget):
+            batches += 1
+            first_batch = first_batch or time.perf_counter() - start
+        make = lambda: _batched((c for _, c in iter_directory_chunks(directory)), INGEST_BATCH_CHUNKS)
+        async for batch in iterate_in_thread(make):
+            chunks += len(batch)  # discarding sink
+        return first_batch, time.perf_counter() - start, batches, chunks
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--budget", type=int, help="Reducer token budget per file (default OUTLINE_SOURCE_TOKENS)")
+    parser.add_argument("--mode", choices=["legacy", "streaming", "reduced"], help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        baseline = peak_rss_mb()
+        if args.mode == "legacy":
+            first, total, batches, chunks = run_legacy(args.dir)
+        else:
+            first, total, batches, chunks = run_streaming(args.dir, args.budget if args.mode == "reduced" else 0)
+        print(json.dumps({"peak": peak_rss_mb(), "baseline": baseline, "first": first, "total": total, "batches": batches, "chunks": chunks}))
+        return
+
+    if args.budget is None:
+        from llm_services.outline import OUTLINE_SOURCE_TOKENS
+        args.budget = OUTLINE_SOURCE_TOKENS
+    directory = tempfile.mkdtemp(prefix="bench_ingest_")
+    path = os.path.join(directory, "book.pdf")
+    print("=" * 60)
+    print("INGESTION MEMORY BENCHMARK")
+    print("=" * 60)
+    build_pdf(path, args.pages)
+    print(f"{args.pages}-page PDF: {os.path.getsize(path) / 1e6:.1f} MB; reducer budget {args.budget} tokens\n")
+    print(f"{'mode':>10} {'peak RSS MB':>12} {'pipeline MB':>12} {'1st batch s':>12} {'total s':>8} {'batches':>8} {'chunks':>7}")
+    for mode in ("legacy", "streaming", "reduced"):
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--mode", mode, "--dir", directory, "--budget", str(args.budget)],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        print(f"{mode:>10} {r['peak']:>12.0f} {r['peak'] - r['baseline']:>12.0f} {r['first']:>12.2f} {r['total']:>8.2f} {r['batches']:>8} {r['chunks']:>7}")
+    os.remove(path)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    main()
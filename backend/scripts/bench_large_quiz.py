@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Large Quiz Benchmark
+
+Generates quizzes of growing --counts against a synthetic course of --sections
+subtopics in offline mode, comparing:
+
+  single call   the old way: k=8 chunks, every question in one generation
+  partitioned   retrieval scaled with the question count, chunks grouped by
+                subtopic, one sub-quiz per group in parallel, merged with
+                near-duplicate removal
+
+The fake model sleeps --token-ms per output token, so generation time grows
+with the number of questions as it does with Gemini. Reports wall time,
+questions returned, distinct questions and subtopics the retrieved material
+came from.
+
+Usage:
+    cd backend
+    python scripts/bench_large_quiz.py --counts 5,10,20,40,80
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+# Measure generation, not admission control
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("LLM_TPM", "1000000000")
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_quiz_"), "scaffold.db"))
+
+from langchain_core.documents import Document
+
+from llm_services import bot
+from tools.model import model
+from tools.vector_store import add_documents_for_user, search_for_user
+
+USER_ID = "bench-quiz-user"
+TOPIC = "cell biology"
+
+
+def build_course(sections: int, chunks_per_section: int, seed: int = 0):
+    rng = random.Random(seed)
+    docs = []
+    for s in range(sections):
+        terms = [f"s{s}term{i}" for i in range(12)]
+        for c in range(chunks_per_section):
+            words = [rng.choice(terms) if rng.random() < 0.4 else f"{TOPIC.split()[rng.random() < 0.5]}" for _ in range(150)]
+            docs.append(Document(
+                page_content=" ".join(words),
+                metadata={"source": "course.pdf", "page": s * 2 + c // 3, "section": f"Cell Biology > Subtopic {s}"},
+            ))
+    return docs
+
+
+def _sections(docs) -> int:
+    return len({d.metadata.get("section") for d in docs})
+
+
+async def single_call(count: int):
+    docs = await asyncio.to_thread(search_for_user, TOPIC, USER_ID, 8)
+    cards = await asyncio.to_thread(bot._quiz_from_docs, TOPIC, docs, USER_ID, count)
+    return cards["flashcards"], _sections(docs)
+
+
+async def partitioned(count: int):
+    docs = await asyncio.to_thread(search_for_user, TOPIC, USER_ID, bot.quiz_retrieval_k(count))
+    cards = await bot._quiz_from_retrieved(TOPIC, docs, USER_ID, count)
+    return cards["flashcards"], _sections(docs)
+
+
+async def main(args):
+    model.per_token_latency = args.token_ms / 1000
+    model.latency = args.call_ms / 1000
+    add_documents_for_user(build_course(args.sections, args.chunks), USER_ID)
+
+    print("=" * 60)
+    print("LARGE QUIZ BENCHMARK")
+    print("=" * 60)
+    print(f"{args.sections} subtopics x {args.chunks} chunks, {args.call_ms:.0f} ms/call + {args.token_ms} ms/output token\n")
+    print(f"{'questions':>9} {'path':>12} {'seconds':>8} {'returned':>9} {'distinct':>9} {'subtopics':>10}")
+    for count in [int(c) for c in args.counts.split(",")]:
+        for label, run in (("single call", single_call), ("partitioned", partitioned)):
+            start = time.perf_counter()
+            flashcards, sections = await run(count)
+            elapsed = time.perf_counter() - start
+            distinct = len({card["question"] for card in flashcards})
+            print(f"{count:>9} {label:>12} {elapsed:>8.2f} {len(flashcards):>9} {distinct:>9} {sections:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--counts", default="5,10,20,40,80")
+    parser.add_argument("--sections", type=int, default=16)
+    parser.add_argument("--chunks", type=int, default=6)
+    parser.add_argument("--call-ms", type=float, default=400)
+    parser.add_argument("--token-ms", type=float, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+LLM Scheduler Benchmark
+
+Simulates a quota-limited provider (requests above --quota-rps in any one
+second fail with 429 RESOURCE_EXHAUSTED) while a bulk ingest hammers it from
+--bulk-workers threads, and measures the latency of interactive /tutor-style
+calls arriving alongside. Compares direct calls with client-side retry against
+calls admitted by tools/llm_scheduler.
+
+Usage:
+    cd backend
+    python scripts/bench_llm_scheduler.py --seconds 15 --bulk-workers 16
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+
+from langchain_core.messages import HumanMessage
+
+from tools.llm_scheduler import BULK, INTERACTIVE, LLMScheduler, SchedulerFeedback, llm_priority, set_llm_user
+from tools.offline import FakeChatModel
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class Quota:
+    """Sliding one-second window shared by every simulated client."""
+
+    def __init__(self, rps: int):
+        self.rps = rps
+        self.calls = deque()
+        self.lock = threading.Lock()
+
+    def check(self):
+        with self.lock:
+            now = time.monotonic()
+            while self.calls and now - self.calls[0] > 1.0:
+                self.calls.popleft()
+            if len(self.calls) >= self.rps:
+                raise QuotaExceeded("429 RESOURCE_EXHAUSTED: quota exceeded")
+            self.calls.append(now)
+
+
+class QuotaFakeChatModel(FakeChatModel):
+    quota: object = None
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.quota.check()
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+
+def call_with_retry(llm, prompt, stop_at, max_retries=6):
+    """Exponential backoff, as the provider SDK does when no scheduler is in front."""
+    delay = 0.25
+    for attempt in range(max_retries + 1):
+        try:
+            return llm.invoke([HumanMessage(content=prompt)])
+        except QuotaExceeded:
+            if attempt == max_retries or time.monotonic() > stop_at:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 8.0)
+
+
+def run(args, scheduled: bool):
+    quota = Quota(args.quota_rps)
+    extra = {}
+    scheduler = None
+    if scheduled:
+        # Admit under the provider quota (burst + one second of refill must fit the
+        # one-second window); bulk keeps a reserve free for interactive
+        scheduler = LLMScheduler("bench", requests_per_minute=args.quota_rps * 60 * 0.8, burst_seconds=0.25)
+        extra = dict(rate_limiter=scheduler, callbacks=[SchedulerFeedback(scheduler)])
+    llm = QuotaFakeChatModel(latency=args.model_latency, quota=quota, **extra)
+
+    stop_at = time.monotonic() + args.seconds
+    interactive_latencies, interactive_failures = [], 0
+    bulk_done, bulk_failures = [0], [0]
+    lock = threading.Lock()
+
+    def bulk_worker(i):
+        llm_priority.set(BULK)
+        set_llm_user(f"uploader-{i % 2}")
+        while time.monotonic() < stop_at:
+            try:
+                call_with_retry(llm, f"Summarize chunk {i} of the ingested document.", stop_at)
+                with lock:
+                    bulk_done[0] += 1
+            except QuotaExceeded:
+                with lock:
+                    bulk_failures[0] += 1
+
+    def interactive_worker():
+        nonlocal interactive_failures
+        llm_priority.set(INTERACTIVE)
+        set_llm_user("student")
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                call_with_retry(llm, "Explain this subtopic to a student.", stop_at + args.seconds)
+                interactive_latencies.append(time.perf_counter() - start)
+            except QuotaExceeded:
+                interactive_failures += 1
+            time.sleep(args.interactive_interval)
+
+    threads = [threading.Thread(target=bulk_worker, args=(i,)) for i in range(args.bulk_workers)]
+    threads.append(threading.Thread(target=interactive_worker))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    lat = sorted(interactive_latencies) or [0.0]
+    p = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] * 1000
+    return {
+        "interactive_requests": len(interactive_latencies),
+        "interactive_failures": interactive_failures,
+        "p50": statistics.median(lat) * 1000,
+        "p95": p(0.95),
+        "p99": p(0.99),
+        "bulk_completed": bulk_done[0],
+        "bulk_failures": bulk_failures[0],
+        "rate_limited": scheduler.report()["rate_limited"] if scheduler else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--seconds", type=float, default=15.0, help="Duration of each run")
+    parser.add_argument("--bulk-workers", type=int, default=16, help="Concurrent bulk ingest callers")
+    parser.add_argument("--quota-rps", type=int, default=20, help="Provider requests per second before 429")
+    parser.add_argument("--model-latency", type=float, default=0.05, help="Seconds per model call")
+    parser.add_argument("--interactive-interval", type=float, default=0.2, help="Pause between interactive calls")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("LLM SCHEDULER BENCHMARK")
+    print("=" * 60)
+    print(f"quota {args.quota_rps} rps, {args.bulk_workers} bulk workers, {args.seconds:.0f}s per run")
+
+    for label, scheduled in (("direct + retry", False), ("scheduler", True)):
+        r = run(args, scheduled)
+        print(f"\n{label}:")
+        print(f"  interactive: {r['interactive_requests']} ok, {r['interactive_failures']} failed")
+        print(f"  interactive latency p50 {r['p50']:.0f} ms | p95 {r['p95']:.0f} ms | p99 {r['p99']:.0f} ms")
+        print(f"  bulk: {r['bulk_completed']} completed, {r['bulk_failures']} failed")
+        if r["rate_limited"] is not None:
+            print(f"  429s seen by scheduler: {r['rate_limited']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Model Routing Benchmark
+
+Runs one course's workload (outline map/reduce over a --pages PDF, --lessons
+/tutor lessons, --lessons quizzes) in offline mode under three route
+configurations:
+
+  all flash       every route on gemini-2.5-flash, no cascade
+  all flash-lite  every route on gemini-2.5-flash-lite, no cascade
+  tiered          the default routes (tools/model.py): flash-lite everywhere,
+                  lessons, quizzes and the outline reduce cascade to flash when
+                  their answer fails validation
+
+The fake models stand in for the tiers: flash-lite answers faster and cheaper
+but --lite-truncated of its structured answers are cut off (repair salvages
+only part of the lesson or quiz); flash is slower and never truncates. Reports
+wall time per workload, incomplete lessons/quizzes, cascades and the estimated
+cost from the route metrics.
+
+Usage:
+    cd backend
+    python scripts/bench_model_routes.py --lessons 20
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("LLM_TPM", "1000000000")
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_routes_"), "scaffold.db"))
+
+import fitz  # PyMuPDF
+from langchain_core.documents import Document
+
+from llm_services import bot, outline
+from tools import model as model_module
+from tools.model import DEFAULT_ROUTES, chat_model, load_routes, route_metrics
+from tools.vector_store import add_documents_for_user
+
+USER_ID = "bench-routes-user"
+LITE, FLASH = "gemini-2.5-flash-lite", "gemini-2.5-flash"
+
+CONFIGS = {
+    "all flash": {name: {"model": FLASH, "cascade": None} for name in DEFAULT_ROUTES},
+    "all flash-lite": {name: {"model": LITE, "cascade": None} for name in DEFAULT_ROUTES},
+    "tiered": {},
+}
+
+
+def write_course(path: str, pages: int):
+    rng = random.Random(0)
+    words = [f"concept{i}" for i in range(300)]
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 560, 800), " ".join(rng.choice(words) for _ in range(420)), fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def tune_fakes(args):
+    """Give each tier's fake model its speed and failure rate."""
+    for name, latency, per_token, truncated in (
+        (LITE, args.lite_ms, args.lite_token_ms, args.lite_truncated),
+        (FLASH, args.flash_ms, args.flash_token_ms, 0.0),
+    ):
+        model_module.ROUTES["chat"] = replace(model_module.ROUTES["chat"], model=name)
+        fake = chat_model("chat")
+        fake.latency, fake.per_token_latency, fake.truncated_rate = latency / 1000, per_token / 1000, truncated
+
+
+async def run(label: str, overrides, course_dir: str, args):
+    model_module.ROUTES.clear()
+    model_module.ROUTES.update(load_routes(overrides))
+    outline._agents.clear()
+    route_metrics.totals.clear()
+
+    start = time.perf_counter()
+    await outline.create_outline(course_dir, [], USER_ID)
+    outline_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lessons = await asyncio.gather(*(
+        bot.tutor(f"topic: Course, subtopic: Part {i}", "5", "", USER_ID) for i in range(args.lessons)
+    ), return_exceptions=True)
+    quizzes = await asyncio.gather(*(
+        bot.quiz(f"Part {i}", USER_ID, 5) for i in range(args.lessons)
+    ), return_exceptions=True)
+    study_seconds = time.perf_counter() - start
+
+    failed = sum(1 for r in lessons if not isinstance(r, dict) or len(r["lesson_phases"]) < bot.LESSON_PHASES)
+    failed += sum(1 for r in quizzes if not isinstance(r, dict) or len(r["flashcards"]) < 5)
+    totals = route_metrics.report()
+    cost = sum(r.get("cost_usd", 0.0) for r in totals.values())
+    cascades = sum(r.get("cascades", 0) for r in totals.values())
+    print(f"{label:>15} {outline_seconds:>10.2f} {study_seconds:>13.2f} {failed:>10} {cascades:>9} {cost * 1000:>12.3f}")
+    return totals
+
+
+async def main(args):
+    course_dir = tempfile.mkdtemp(prefix="bench_routes_course_")
+    write_course(os.path.join(course_dir, "course.pdf"), args.pages)
+    add_documents_for_user(
+        [Document(page_content=f"Part {i}: " + " ".join(f"concept{(i * 7 + j) % 300}" for j in range(200)),
+                  metadata={"source": "course.pdf", "page": i + 1}) for i in range(args.lessons)],
+        USER_ID,
+    )
+    tune_fakes(args)
+
+    print("=" * 60)
+    print("MODEL ROUTING BENCHMARK")
+    print("=" * 60)
+    print(f"{args.pages}-page outline, {args.lessons} lessons + {args.lessons} quizzes; "
+          f"flash-lite truncates {args.lite_truncated:.0%} of structured answers\n")
+    print(f"{'':>15} {'outline s':>10} {'lessons+quiz s':>13} {'incomplete':>10} {'cascades':>9} {'cost (m$)':>12}")
+    tiered = None
+    for label, overrides in CONFIGS.items():
+        tiered = await run(label, overrides, course_dir, args)
+
+    print("\nper route (tiered):")
+    for name, r in tiered.items():
+        if r.get("calls"):
+            print(f"  {name:>15} {r['model']:>22} calls {r['calls']:>4}  mean {1000 * r['seconds'] / r['calls']:>7.1f} ms"
+                  f"  cascades {r['cascades']:>3}  cost {r['cost_usd'] * 1000:.3f} m$")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--lessons", type=int, default=20)
+    parser.add_argument("--lite-ms", type=float, default=300)
+    parser.add_argument("--lite-token-ms", type=float, default=1)
+    parser.add_argument("--flash-ms", type=float, default=600)
+    parser.add_argument("--flash-token-ms", type=float, default=3)
+    parser.add_argument("--lite-truncated", type=float, default=0.1)
+    asyncio.run(main(parser.parse_args()))
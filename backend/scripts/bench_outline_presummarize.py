@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Outline Pre-summarization Benchmark
+
+Builds fixture textbooks (--pages each, with a table of contents) whose
+sections mix conceptual prose with number-heavy worked examples and
+exercises, then runs create_outline in offline mode with the extractive
+reducer off (the full text goes to the map phase) and on (each file shrunk to
+--budget tokens first).
+
+Reports map calls, map input tokens, wall time (the fake model sleeps
+--call-ms per call plus --token-ms per input token, standing in for prompt
+processing), the share of section headings that reach the map phase and the
+share of worked-example/exercise sentences among those that do.
+
+Usage:
+    cd backend
+    python scripts/bench_outline_presummarize.py --pages 300,1500
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("LLM_TPM", "1000000000")
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_presum_"), "scaffold.db"))
+
+import fitz  # PyMuPDF
+
+from llm_services import outline
+from tools.tokens import estimate_tokens
+
+USER_ID = "bench-presum-user"
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(["ka", "lo", "mi", "ter", "van", "os", "ri", "del", "pha", "sun", "ni", "bel"])
+                   for _ in range(rng.randint(3, 4)))
+
+
+def write_textbook(path: str, pages: int, seed: int = 0):
+    """A textbook of chapters and sections; returns the section titles."""
+    rng = random.Random(seed)
+    common = [_word(rng) for _ in range(300)]
+    doc, toc, titles = fitz.open(), [], []
+    while len(doc) < pages:
+        chapter = f"Chapter {len(toc) + 1}: {_word(rng).title()} {_word(rng).title()}"
+        toc.append([1, chapter, len(doc) + 1])
+        for _ in range(rng.randint(3, 5)):
+            terms = [_word(rng) for _ in range(6)]
+            title = f"{terms[0].title()} and {terms[1].title()}"
+            titles.append(title)
+            # Conceptual pages, then worked examples and exercises
+            for kind in ["concept"] * 2 + ["example"] * 2 + ["exercise"]:
+                if len(doc) >= pages:
+                    break
+                page = doc.new_page()
+                y = 72
+                if kind == "concept" and toc[-1][1] != title:
+                    page.insert_text((72, y), title, fontsize=14)
+                    toc.append([2, title, len(doc)])
+                    y += 30
+                sentences = []
+                for n in range(22):
+                    if kind == "concept":
+                        words = [rng.choice(terms if rng.random() < 0.3 else common) for _ in range(14)]
+                        sentences.append(f"The {terms[0]} of {' '.join(words)} explains the {terms[1]}.")
+                    elif kind == "example":
+                        a, b = rng.randint(2, 99), rng.randint(2, 99)
+                        sentences.append(f"Example {n}: with {terms[2]} = {a}.{b} and k = {b}, {a} x {b} = {a * b}; (= {a * b / 7:.2f}).")
+                    else:
+                        sentences.append(f"Exercise {n}: solve {a}x + {b} = {a + b * 3} for x, then {a}/{b} = ?")
+                page.insert_textbox(fitz.Rect(72, y, 540, 780), " ".join(sentences), fontsize=8)
+    doc.set_toc(toc)
+    doc.save(path)
+    doc.close()
+    return titles
+
+
+async def run(course_dir: str, budget: int, args, titles):
+    outline.OUTLINE_SOURCE_TOKENS = budget
+    calls, tokens, texts = 0, 0, []
+    original = outline.get_batch_summary
+
+    async def counting(agent, batch_text, batch_id, user_id=None):
+        nonlocal calls, tokens
+        calls += 1
+        tokens += estimate_tokens(batch_text)
+        texts.append(batch_text)
+        # Prompt processing time on top of the fake model's per-call latency
+        await asyncio.sleep(estimate_tokens(batch_text) * args.token_ms / 1000)
+        return await original(agent, batch_text, batch_id, user_id)
+
+    outline.get_batch_summary = counting
+    try:
+        start = time.perf_counter()
+        result = await outline.create_outline(course_dir, [], USER_ID)
+        elapsed = time.perf_counter() - start
+    finally:
+        outline.get_batch_summary = original
+    text = "\n".join(texts)
+    headings = sum(1 for title in set(titles) if title in text) / len(set(titles))
+    sentences = [s for s in text.replace("\n", " ").split(". ") if len(s) > 25]
+    worked = sum(1 for s in sentences if "Example " in s or "Exercise " in s) / max(1, len(sentences))
+    return calls, tokens, elapsed, headings, worked, result is not None
+
+
+async def main(args):
+    outline.chat_model("outline_map").latency = args.call_ms / 1000
+    print("=" * 60)
+    print("OUTLINE PRE-SUMMARIZATION BENCHMARK")
+    print("=" * 60)
+    print(f"map call {args.call_ms:.0f} ms + {args.token_ms} ms/input token; budget {args.budget} tokens per file\n")
+    print(f"{'pages':>6} {'reducer':>8} {'map calls':>10} {'map tokens':>11} {'seconds':>8} {'headings':>9} {'worked share':>13}")
+    for pages in [int(p) for p in args.pages.split(",")]:
+        course_dir = tempfile.mkdtemp(prefix="bench_presum_course_")
+        titles = write_textbook(os.path.join(course_dir, "textbook.pdf"), pages)
+        for label, budget in (("off", 0), ("on", args.budget)):
+            calls, tokens, elapsed, headings, worked, ok = await run(course_dir, budget, args, titles)
+            print(f"{pages:>6} {label:>8} {calls:>10} {tokens:>11,} {elapsed:>8.2f} {headings:>9.0%} {worked:>13.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--pages", default="300,1500")
+    parser.add_argument("--budget", type=int, default=outline.OUTLINE_SOURCE_TOKENS)
+    parser.add_argument("--call-ms", type=float, default=1500)
+    parser.add_argument("--token-ms", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+PDF Chunker Benchmark
+
+Builds a synthetic --chapters textbook (TOC, large-font section headings,
+running header and page-number footer on every page, sections spanning pages,
+an image-only figure page per chapter) and chunks it two ways:
+
+  page        text_splitter (2000/200 characters) on each page separately
+  structured  loaders/pdf_structure: TOC/heading sections, boilerplate removed,
+              chunks packed across page breaks within a section
+
+Reports chunk count, embedding calls (batches of 100 texts), chunks containing
+the running header, near-empty chunks, chunks mixing two sections, and parse
+throughput. Run with --no-toc to exercise font-size heading detection.
+
+Usage:
+    cd backend
+    python scripts/bench_pdf_chunker.py --chapters 30
+"""
+
+import argparse
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+
+import fitz  # PyMuPDF
+
+EMBED_BATCH = 100
+RUNNING_HEADER = "Calculus for Engineers - Lecture Notes"
+SECTION_MARK = re.compile(r"\bS(\d+)\.(\d+)\b")
+
+
+def build_pdf(path: str, chapters: int, toc: bool):
+    rng = random.Random(0)
+    words = [f"term{i}" for i in range(400)]
+    image = fitz.Pixmap(fitz.csRGB, 200, 150, random.Random(1).randbytes(200 * 150 * 3), False).tobytes("png")
+    doc = fitz.open()
+    entries = []
+    page, y = None, 0.0
+
+    def new_page():
+        nonlocal page, y
+        page = doc.new_page()
+        page.insert_text((40, 30), RUNNING_HEADER, fontsize=8)
+        page.insert_text((290, 820), str(len(doc)), fontsize=8)
+        y = 60.0
+
+    def write(text: str, fontsize: float, lines: int):
+        nonlocal y
+        height = lines * fontsize * 1.5 + 10
+        if page is None or y + height > 790:
+            new_page()
+        page.insert_textbox(fitz.Rect(40, y, 555, y + height), text, fontsize=fontsize)
+        y += height
+
+    for c in range(1, chapters + 1):
+        new_page()
+        write(f"Chapter {c} Topic {c}", 18, 1)
+        entries.append([1, f"Chapter {c} Topic {c}", len(doc)])
+        for s in range(1, rng.randint(3, 5) + 1):
+            write(f"{c}.{s} Subtopic {c}.{s}", 13, 1)
+            entries.append([2, f"{c}.{s} Subtopic {c}.{s}", len(doc)])
+            for _ in range(rng.randint(2, 7)):
+                # Paragraph words are tagged with their section so mixing can be detected
+                text = " ".join(f"S{c}.{s}" if i % 12 == 0 else rng.choice(words) for i in range(110))
+                write(text + ".", 10, 10)
+        # A full-page figure with no text besides the running header/footer
+        new_page()
+        page.insert_image(fitz.Rect(100, 200, 500, 500), stream=image)
+    if toc:
+        doc.set_toc(entries)
+    doc.save(path)
+    doc.close()
+
+
+def page_chunks(path):
+    from loaders.multiple_file import iter_pdf_pages, text_splitter
+
+    for page in iter_pdf_pages(path):
+        yield from text_splitter.split_documents([page])
+
+
+def structured_chunks(path):
+    from loaders.pdf_structure import iter_structured_chunks
+
+    return iter_structured_chunks(path)
+
+
+def measure(chunks_of, path, pages):
+    start = time.perf_counter()
+    chunks = list(chunks_of(path))
+    elapsed = time.perf_counter() - start
+    # Text left once the page/section labels, running header and page numbers are removed
+    body = lambda c: re.sub(r"^\[Pages? [\d-]+\]\n(\[Section: .*\]\n)?|\d+", "", c.page_content).replace(RUNNING_HEADER, "")
+    return {
+        "chunks": len(chunks),
+        "embed_calls": math.ceil(len(chunks) / EMBED_BATCH),
+        "chars": sum(len(c.page_content) for c in chunks),
+        "boilerplate": sum(RUNNING_HEADER in c.page_content for c in chunks),
+        "tiny": sum(len(body(c).strip()) < 40 for c in chunks),
+        "mixed": sum(len(set(SECTION_MARK.findall(c.page_content))) > 1 for c in chunks),
+        "pages_per_s": pages / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--chapters", type=int, default=30)
+    parser.add_argument("--no-toc", action="store_true", help="Omit the PDF outline (font-size headings only)")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_chunker_"), "textbook.pdf")
+    build_pdf(path, args.chapters, toc=not args.no_toc)
+    with fitz.open(path) as doc:
+        pages = len(doc)
+
+    print("=" * 60)
+    print("PDF CHUNKER BENCHMARK")
+    print("=" * 60)
+    print(f"{pages}-page textbook, {args.chapters} chapters, TOC {'off' if args.no_toc else 'on'}\n")
+    print(f"{'chunker':>11} {'chunks':>7} {'embed calls':>12} {'chars':>9} {'w/ header':>10} {'near-empty':>11} {'mixed':>6} {'pages/s':>8}")
+    for name, chunks_of in (("page", page_chunks), ("structured", structured_chunks)):
+        r = measure(chunks_of, path, pages)
+        print(f"{name:>11} {r['chunks']:>7} {r['embed_calls']:>12} {r['chars']:>9} {r['boilerplate']:>10} {r['tiny']:>11} {r['mixed']:>6} {r['pages_per_s']:>8.0f}")
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Source Registry Benchmark
+
+Ingests a synthetic --files course (each file --pages pages) in offline mode,
+then measures what it costs to bring the index up to date after one lecture
+PDF changes (--edited pages rewritten):
+
+  full re-ingest   the old way: wipe the user's documents and ingest every file
+  re-upload        the whole course uploaded again (unchanged files are
+                   skipped; the changed file is indexed as a new source)
+  replace source   only the changed file, diffed chunk by chunk against the
+                   source it replaces (PUT /sources/{source_id})
+
+Reports chunks embedded, embedding calls, points deleted and wall time.
+Embedding calls sleep --embed-ms to stand in for the API round trip.
+
+Usage:
+    cd backend
+    python scripts/bench_source_registry.py --files 30
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_sources_"), "scaffold.db"))
+
+import fitz  # PyMuPDF
+
+from loaders.multiple_file import load_directory
+from tools import embeddings as embeddings_module
+from tools import source_registry
+from tools.vector_store import delete_user_documents
+
+USER_ID = "bench-sources-user"
+
+
+class EmbedCounter:
+    def __init__(self, inner):
+        self.inner = inner
+        self.calls = self.texts = 0
+
+    def __call__(self, texts, **kwargs):
+        self.calls += 1
+        self.texts += len(texts)
+        return self.inner(texts, **kwargs)
+
+
+def write_lecture(path: str, lecture: int, pages: int, edited: int = 0):
+    rng = random.Random(lecture)
+    words = [f"term{i}" for i in range(600)]
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 60), f"Lecture {lecture} Part {p + 1}", fontsize=16)
+        text = " ".join(rng.choice(words) for _ in range(380))
+        if p < edited:
+            text = f"Revised: {text[::-1]}"
+        page.insert_textbox(fitz.Rect(72, 90, 540, 780), text, fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+async def measure(label: str, directory: str, counter: EmbedCounter, wipe: bool = False, replace=None):
+    counter.calls = counter.texts = 0
+    start = time.perf_counter()
+    if wipe:
+        await asyncio.to_thread(delete_user_documents, USER_ID)
+    summary = await load_directory(directory, [], USER_ID, replace)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>16} {counter.texts:>9} {counter.calls:>12} {summary['removed_chunks']:>8} "
+          f"{summary['unchanged_sources']:>10} {elapsed:>8.2f}")
+    return summary
+
+
+async def main(args):
+    inner = embeddings_module.embeddings.inner
+    inner.latency = args.embed_ms / 1000
+    counter = EmbedCounter(inner.embed_documents)
+    inner.embed_documents = counter
+
+    course = tempfile.mkdtemp(prefix="bench_course_")
+    for i in range(args.files):
+        write_lecture(os.path.join(course, f"lecture_{i:02d}.pdf"), i, args.pages)
+    single = tempfile.mkdtemp(prefix="bench_replace_")
+
+    print("=" * 60)
+    print("SOURCE REGISTRY BENCHMARK")
+    print("=" * 60)
+    print(f"{args.files} files x {args.pages} pages, 1 file with {args.edited} pages edited\n")
+    print(f"{'':>16} {'embedded':>9} {'embed calls':>12} {'deleted':>8} {'unchanged':>10} {'seconds':>8}")
+    await measure("initial ingest", course, counter)
+
+    changed = os.path.join(course, "lecture_07.pdf")
+    write_lecture(changed, 7, args.pages, edited=args.edited)
+    await measure("full re-ingest", course, counter, wipe=True)
+
+    write_lecture(changed, 7, args.pages, edited=args.edited + 1)
+    summary = await measure("re-upload", course, counter)
+    source_id = next(i for i in summary["source_ids"] if source_registry.source_name(i) == "lecture_07.pdf")
+
+    write_lecture(changed, 7, args.pages, edited=args.edited + 2)
+    shutil.copy(changed, os.path.join(single, "lecture_07.pdf"))
+    await measure("replace source", single, counter, replace={"lecture_07.pdf": source_id})
+
+    sources = source_registry.list_sources(USER_ID)
+    print(f"\nregistry: {len(sources)} sources, {sum(s['chunk_count'] for s in sources)} chunks")
+    shutil.rmtree(course)
+    shutil.rmtree(single)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--files", type=int, default=30)
+    parser.add_argument("--pages", type=int, default=12)
+    parser.add_argument("--edited", type=int, default=2)
+    parser.add_argument("--embed-ms", type=float, default=150)
+    asyncio.run(main(parser.parse_args()))
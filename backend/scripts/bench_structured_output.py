@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Structured Output Benchmark
+
+Compares the legacy free-text "Output ONLY valid JSON" path (parse with
+clean_and_parse_json, user retries on a 500) against schema-constrained
+generation with local repair, using the offline fake model. Free-text
+answers break at --malformed-rate; constrained answers still come back
+invalid at --structured-malformed-rate (raw LaTeX backslashes, trailing
+commas, fenced answers, renamed fields) and are repaired locally or, when
+repair fails, generated again on the cascade model.
+
+Usage:
+    cd backend
+    python scripts/bench_structured_output.py --runs 200 --malformed-rate 0.15
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage
+
+from tools.vector_store import add_documents_for_user, search_for_user
+from tools.model import model, route_metrics
+from tools import structured
+from llm_services import bot
+
+USER_ID = "bench-user"
+MAX_USER_ATTEMPTS = 3
+repairs = {"attempted": 0, "recovered": 0}
+
+LEGACY_LESSON_PROMPT = '''Convert the user's notes into a lesson.
+Output ONLY valid JSON matching the structure below.
+{"topic_title": "Topic Name", "lesson_phases": [{"phase_name": "...", "steps": [{"narration": "...", "board": "..."}], "source": "..."}]}
+'''
+LEGACY_QUIZ_PROMPT = '''Convert the user's notes into a set of quizzes.
+Output ONLY valid JSON matching the structure below.
+{"topic_title": "Topic Name", "flashcards": [{"question": "...", "options": ["A", "B", "C", "D"], "answer": "A"}]}
+Generate exactly 5 MCQs
+'''
+
+
+def clean_and_parse_json(ai_response_text):
+    """The parser /tutor and /quizes used before structured output (kept verbatim for comparison)."""
+    if not ai_response_text:
+        return None
+    clean_text = ai_response_text.replace("```json", "").replace("```", "").strip()
+    if not clean_text.startswith('{') and not clean_text.startswith('['):
+        json_match = re.search(r'(\{[\s\S]*\}|\[[\s\S]*\])', clean_text)
+        if json_match:
+            clean_text = json_match.group(1)
+    clean_text = clean_text.replace('\\', '\\\\')
+    try:
+        return json.loads(clean_text)
+    except json.JSONDecodeError:
+        return None
+
+
+def seed_corpus():
+    docs = [
+        Document(
+            page_content=f"[Page {i}]\nComplex numbers: multiplication, conjugates, modulus and argument. "
+                         f"Euler formula relates exponentials and trigonometry. Example {i}: polar form.",
+            metadata={"source": "algebra.pdf", "page": i, "images": "[]"},
+        )
+        for i in range(1, 21)
+    ]
+    add_documents_for_user(docs, USER_ID)
+
+
+def legacy_call(prompt_head: str, query: str, key: str):
+    """One user-visible request on the old path; returns (latency, attempts, ok)."""
+    start = time.perf_counter()
+    for attempt in range(1, MAX_USER_ATTEMPTS + 1):
+        docs = search_for_user(query, USER_ID, k=8)
+        context = "\n\n".join(d.page_content for d in docs)
+        raw = model.invoke([HumanMessage(content=f"{prompt_head}\n\nContext:\n{context}\n\nTopic: {query}")]).content
+        parsed = clean_and_parse_json(raw)
+        if isinstance(parsed, dict) and parsed.get(key):
+            return time.perf_counter() - start, attempt, True
+    return time.perf_counter() - start, MAX_USER_ATTEMPTS, False
+
+
+def _count_repairs(repair):
+    def counted(raw_text, schema):
+        result = repair(raw_text, schema)
+        repairs["attempted"] += 1
+        repairs["recovered"] += result is not None
+        return result
+    return counted
+
+
+def _model_calls() -> int:
+    return sum(totals["calls"] for totals in route_metrics.report().values() if "calls" in totals)
+
+
+def structured_call(kind: str, query: str):
+    calls = _model_calls()
+    start = time.perf_counter()
+    if kind == "lesson":
+        result = asyncio.run(bot.tutor(query, "5", "", USER_ID))
+        ok = bool(result and result.get("lesson_phases"))
+    else:
+        result = asyncio.run(bot.quiz(query, USER_ID, 5))
+        ok = bool(result and result.get("flashcards"))
+    return time.perf_counter() - start, _model_calls() - calls, ok
+
+
+def summarize(label, rows):
+    latencies = sorted(r[0] for r in rows)
+    first_try_failures = sum(1 for r in rows if r[1] > 1 or not r[2])
+    failures = sum(1 for r in rows if not r[2])
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{label:<22} first-try fail {first_try_failures / len(rows):6.1%}  "
+          f"final fail {failures / len(rows):6.1%}  "
+          f"mean {statistics.mean(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  "
+          f"calls {sum(r[1] for r in rows)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--malformed-rate", type=float, default=0.15)
+    parser.add_argument("--structured-malformed-rate", type=float, default=0.05)
+    parser.add_argument("--truncated-rate", type=float, default=0.03)
+    parser.add_argument("--per-token-latency", type=float, default=0.0005,
+                        help="Simulated seconds per output token")
+    args = parser.parse_args()
+
+    model.malformed_rate = args.malformed_rate
+    model.truncated_rate = args.truncated_rate
+    model.structured_malformed_rate = args.structured_malformed_rate
+    structured.repair_structured_output = _count_repairs(structured.repair_structured_output)
+    model.per_token_latency = args.per_token_latency
+    seed_corpus()
+
+    query = "topic: Algebra of Complex Numbers, subtopic: Multiplication"
+    print("=" * 60)
+    print("    STRUCTURED OUTPUT BENCHMARK (offline fake model)")
+    print("=" * 60)
+    for kind, head, key in (("lesson", LEGACY_LESSON_PROMPT, "lesson_phases"),
+                            ("quiz", LEGACY_QUIZ_PROMPT, "flashcards")):
+        before = [legacy_call(head, query, key) for _ in range(args.runs)]
+        repairs.update(attempted=0, recovered=0)
+        after = [structured_call(kind, query) for _ in range(args.runs)]
+        summarize(f"{kind} before", before)
+        summarize(f"{kind} after", after)
+        print(f"{'':<22} repaired locally {repairs['recovered']}/{repairs['attempted']} invalid answers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Subtopic Index Benchmark
+
+Ingests a fixture textbook (--pages) and builds its outline in offline mode,
+then retrieves the chunks for every subtopic of the outline the way /tutor
+and /quizes do: once with a vector search per request (embed the request
+text, filtered Qdrant search) and once from the subtopic index (chunks
+fetched by ID). The embedder sleeps --embed-ms per call, standing in for the
+embedding API round trip.
+
+Reports the one-off index build time, embedding calls and retrieval latency
+(p50/p95) per request for both paths, whether both return the same chunks,
+and how a source change is handled (stale entries skipped, then refreshed).
+
+Usage:
+    cd backend
+    python scripts/bench_subtopic_index.py --pages 300
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("LLM_TPM", "1000000000")
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_subidx_"), "scaffold.db"))
+
+from bench_outline_presummarize import write_textbook
+
+from llm_services import bot, outline
+from loaders.multiple_file import load_directory
+from tools import embeddings as embeddings_module
+from tools import subtopic_index
+from tools.vector_store import search_for_user
+
+USER_ID = "bench-subidx-user"
+
+
+class CountingEmbedder:
+    """Counts embedding calls of the offline embedder."""
+
+    def __init__(self, inner):
+        self.inner, self.calls = inner, 0
+        self._query, self._documents = inner.embed_query, inner.embed_documents
+        inner.embed_query, inner.embed_documents = self.embed_query, self.embed_documents
+
+    def embed_query(self, text, **kwargs):
+        self.calls += 1
+        return self._query(text, **kwargs)
+
+    def embed_documents(self, texts, **kwargs):
+        self.calls += 1
+        return self._documents(texts, **kwargs)
+
+
+def _percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def _time_each(fn, queries):
+    seconds, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(fn(query))
+        seconds.append(time.perf_counter() - start)
+    return seconds, results
+
+
+async def main(args):
+    embedder = CountingEmbedder(embeddings_module.embeddings.inner)
+    course_dir = tempfile.mkdtemp(prefix="bench_subidx_course_")
+    write_textbook(os.path.join(course_dir, "textbook.pdf"), args.pages)
+    await load_directory(course_dir, [], USER_ID)
+    course = await outline.create_outline(course_dir, [], USER_ID)
+    queries = subtopic_index.outline_queries(course)
+
+    embedder.inner.latency = args.embed_ms / 1000
+    embedder.calls = 0
+    start = time.perf_counter()
+    subtopic_index.build(USER_ID, "bench-course", course)
+    build_seconds, build_calls = time.perf_counter() - start, embedder.calls
+
+    print("=" * 60)
+    print("SUBTOPIC INDEX BENCHMARK")
+    print("=" * 60)
+    print(f"{args.pages} pages, {len(queries)} subtopics, embedding call {args.embed_ms:.0f} ms")
+    print(f"index build: {build_seconds * 1000:.0f} ms, {build_calls} embedding call(s)\n")
+    print(f"{'path':>8} {'k':>3} {'embed calls':>12} {'p50 ms':>8} {'p95 ms':>8} {'same chunks':>12}")
+    for k in (4, bot.quiz_retrieval_k(5)):
+        embedder.calls = 0
+        search_seconds, searched = _time_each(lambda q: search_for_user(q, USER_ID, k), queries)
+        search_calls = embedder.calls
+        embedder.calls = 0
+        index_seconds, indexed = _time_each(lambda q: subtopic_index.lookup(USER_ID, q, k), queries)
+        same = sum(
+            [d.page_content for d in a] == [d.page_content for d in (b or [])] for a, b in zip(searched, indexed)
+        ) / len(queries)
+        for label, seconds, calls in (("search", search_seconds, search_calls), ("index", index_seconds, embedder.calls)):
+            print(f"{label:>8} {k:>3} {calls:>12} {_percentile(seconds, 0.5) * 1000:>8.1f} "
+                  f"{_percentile(seconds, 0.95) * 1000:>8.1f} {same:>12.0%}")
+
+    # A new source bumps the corpus version: entries are skipped until refreshed
+    embedder.inner.latency = 0
+    extra_dir = tempfile.mkdtemp(prefix="bench_subidx_extra_")
+    write_textbook(os.path.join(extra_dir, "appendix.pdf"), max(5, args.pages // 10), seed=1)
+    await load_directory(extra_dir, [], USER_ID)
+    embedder.inner.latency = args.embed_ms / 1000
+    stale = sum(subtopic_index.lookup(USER_ID, q, 4) is None for q in queries)
+    embedder.calls = 0
+    start = time.perf_counter()
+    refreshed = subtopic_index.refresh(USER_ID)
+    refresh_seconds = time.perf_counter() - start
+    hits = sum(subtopic_index.lookup(USER_ID, q, 4) is not None for q in queries)
+    print(f"\nafter adding a source: {stale}/{len(queries)} lookups fell back to search; "
+          f"refresh re-indexed {refreshed} in {refresh_seconds * 1000:.0f} ms "
+          f"({embedder.calls} embedding call(s)); {hits}/{len(queries)} hits after")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--embed-ms", type=float, default=120)
+    asyncio.run(main(parser.parse_args()))
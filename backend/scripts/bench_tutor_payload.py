@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Tutor Payload Benchmark
+
+Requests --lessons /tutor lessons (each with the course's images) through the
+app in offline mode and compares what the browser downloads:
+
+  inline          the old response: every phase carries every image as a data URL
+  inline + gzip   the same response compressed
+  by ID + gzip    images listed once by ID, JSON compressed, image bytes fetched
+                  from GET /images/{id} (first lesson) or revalidated with a
+                  304 from the browser cache (later lessons sharing the images)
+
+Reports JSON and image bytes per lesson, JSON parse time and an estimated load
+time at --mbps with --rtt-ms per request (image requests run in parallel).
+
+Usage:
+    cd backend
+    python scripts/bench_tutor_payload.py --images 5
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_payload_"), "scaffold.db"))
+
+import fitz  # PyMuPDF
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+
+from app import app
+from tools import image_store
+from tools.vector_store import add_documents_for_user
+
+USER_ID = "bench-payload-user"
+
+
+def figure(seed: int) -> str:
+    """A noisy 640x480 diagram-like PNG as a data URL (compresses like a real figure)."""
+    rng = random.Random(seed)
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 640, 480), 0)
+    pix.set_rect(pix.irect, (255, 255, 255))
+    for _ in range(120):
+        x, y = rng.randrange(600), rng.randrange(440)
+        pix.set_rect(fitz.IRect(x, y, x + rng.randrange(8, 60), y + rng.randrange(8, 40)),
+                     tuple(rng.randrange(256) for _ in range(3)))
+    samples = bytearray(pix.samples)
+    for i in range(0, len(samples), 7):
+        samples[i] = (samples[i] + rng.randrange(-12, 12)) % 256
+    noisy = fitz.Pixmap(fitz.csRGB, 640, 480, bytes(samples), 0)
+    return "data:image/png;base64," + base64.b64encode(noisy.tobytes("png")).decode("ascii")
+
+
+def inline_payload(lesson: dict) -> dict:
+    """The response as /tutor built it before: every phase inlines every image."""
+    urls = []
+    for image_id in lesson["images"]:
+        mime, data = image_store.get_image(image_id)
+        urls.append(f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}")
+    legacy = {"topic_title": lesson["topic_title"], "lesson_phases": []}
+    for phase in lesson["lesson_phases"]:
+        phase = {k: v for k, v in phase.items() if k != "image_ids"}
+        phase["images"] = urls
+        legacy["lesson_phases"].append(phase)
+    return legacy
+
+
+def parse_ms(body: bytes, runs: int = 5) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        json.loads(body)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def load_ms(json_bytes: int, image_bytes: int, image_requests: int, args) -> float:
+    bytes_per_ms = args.mbps * 1e6 / 8 / 1000
+    total = args.rtt_ms + json_bytes / bytes_per_ms
+    if image_requests:
+        total += args.rtt_ms + image_bytes / bytes_per_ms
+    return total
+
+
+def main(args):
+    docs = []
+    images = [figure(i) for i in range(args.images)]
+    for i in range(8):
+        text = " ".join(f"mitosis{j % 17} spindle{j % 11} chromatid{j % 7}" for j in range(60 + i))
+        docs.append(Document(page_content=text, metadata={"source": "biology.pdf", "page": i + 1,
+                                                          "images": json.dumps(images[i % len(images):] + images[:i % len(images)])}))
+
+    with TestClient(app) as client:
+        add_documents_for_user(docs, USER_ID)
+        rows = {"inline": [], "inline + gzip": [], "by ID + gzip": []}
+        cached = set()
+        for n in range(args.lessons):
+            body = {"text": f"topic: Cell Division, subtopic: Mitosis {n}", "adapt": "5", "analogy": "", "user_id": USER_ID}
+            response = client.post("/tutor", json=body, headers={"Accept-Encoding": "gzip"})
+            response.raise_for_status()
+            lesson = response.json()
+            wire = int(response.headers["content-length"])
+
+            legacy = json.dumps(inline_payload(lesson)).encode("utf-8")
+            rows["inline"].append((len(legacy), 0, 0, parse_ms(legacy)))
+            rows["inline + gzip"].append((len(gzip.compress(legacy, 6)), 0, 0, parse_ms(legacy)))
+
+            image_bytes = requests = 0
+            for path in lesson["images"].values():
+                etag = f'"{path.rsplit("/", 1)[-1]}"'
+                headers = {"If-None-Match": etag} if etag in cached else {}
+                image = client.get(path, headers=headers)
+                assert image.status_code in (200, 304), image.status_code
+                image_bytes += len(image.content)
+                requests += 1
+                cached.add(image.headers["etag"])
+            rows["by ID + gzip"].append((wire, image_bytes, requests, parse_ms(response.content)))
+
+    print("=" * 60)
+    print("TUTOR PAYLOAD BENCHMARK")
+    print("=" * 60)
+    print(f"{args.lessons} lessons x 5 phases, {args.images} images; {args.mbps} Mbit/s, {args.rtt_ms} ms RTT\n")
+    print(f"{'':>14} {'lesson':>7} {'JSON bytes':>11} {'image bytes':>12} {'parse ms':>9} {'load ms':>8}")
+    for label, runs in rows.items():
+        for name, run in (("first", runs[0]), ("later", runs[-1])):
+            json_bytes, image_bytes, requests, parse = run
+            total = load_ms(json_bytes, image_bytes, requests, args) + parse
+            print(f"{label:>14} {name:>7} {json_bytes:>11,} {image_bytes:>12,} {parse:>9.2f} {total:>8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--lessons", type=int, default=3)
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--mbps", type=float, default=10.0)
+    parser.add_argument("--rtt-ms", type=float, default=80.0)
+    main(parser.parse_args())
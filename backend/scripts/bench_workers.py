@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Worker Scaling Benchmark
+
+Starts the backend in offline mode with 1, 2, 4 ... uvicorn worker processes
+and drives /tutor with a fixed number of concurrent clients, reporting
+throughput and latency for each worker count. The fake model spends
+--cpu-ms of GIL-holding CPU per call on top of --latency seconds of waiting,
+so a single process saturates one core the way parsing, validation and
+serialization do in production.
+
+Usage:
+    cd backend
+    python scripts/bench_workers.py --workers 1 2 4 --concurrency 32 --seconds 10
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(workers: int, port: int, args, data_dir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        SCAFFOLD_OFFLINE="1",
+        FAKE_MODEL_LATENCY=str(args.latency),
+        FAKE_MODEL_CPU_MS=str(args.cpu_ms),
+        WEB_CONCURRENCY=str(workers),
+        SCAFFOLD_DB_PATH=os.path.join(data_dir, "scaffold.db"),
+        # Admission control would otherwise cap throughput before the CPU does
+        LLM_RPM="1000000",
+        EMBED_RPM="1000000",
+        LOG_LEVEL="WARNING",
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(base_url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError("server did not start")
+
+
+async def drive(base_url: str, concurrency: int, seconds: float):
+    latencies, errors = [], 0
+    stop_at = time.monotonic() + seconds
+
+    async def client_loop(i):
+        nonlocal errors
+        n = 0
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            while time.monotonic() < stop_at:
+                start = time.perf_counter()
+                r = await client.post("/tutor", json={"text": f"topic: Topic {i}, subtopic: Part {n}", "adapt": "5", "user_id": f"student-{i}"})
+                n += 1
+                if r.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(i) for i in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration per worker count")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model wait per call (s)")
+    parser.add_argument("--cpu-ms", type=float, default=20.0, help="Fake model CPU per call (ms)")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("WORKER SCALING BENCHMARK")
+    print("=" * 60)
+    print(f"cores {os.cpu_count()}, {args.concurrency} clients, model {args.latency * 1000:.0f} ms wait + {args.cpu_ms:.0f} ms CPU")
+    print(f"\n{'workers':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+
+    baseline = None
+    for workers in args.workers:
+        data_dir = tempfile.mkdtemp(prefix="bench_workers_")
+        server = start_server(workers, args.port, args, data_dir)
+        base_url = f"http://127.0.0.1:{args.port}"
+        try:
+            asyncio.run(wait_ready(base_url))
+            latencies, errors, elapsed = asyncio.run(drive(base_url, args.concurrency, args.seconds))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            shutil.rmtree(data_dir, ignore_errors=True)
+        latencies.sort()
+        rps = len(latencies) / elapsed
+        baseline = baseline or rps
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0
+        print(f"{workers:>8} {rps:>8.1f} {p50:>8.0f} {p99:>8.0f} {errors:>7}   ({rps / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,7 @@ import os
 # Add parent directory to path to import from tools
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from tools.vector_store import clear_collection, client, COLLECTION_NAME
+from tools.vector_store import clear_collection, get_client, COLLECTION_NAME
 
 
 def main():
@@ -33,7 +33,7 @@ def main():
     
     # Show current collection stats
     try:
-        collection_info = client.get_collection(COLLECTION_NAME)
+        collection_info = get_client().get_collection(COLLECTION_NAME)
         print(f"Current collection stats:")
         print(f"  - Points count: {collection_info.points_count}")
         print(f"  - Vectors count: {collection_info.vectors_count}")
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Retrieval Evaluation
+
+Builds a labeled fixture corpus and measures how search_for_user's settings
+trade retrieval quality against latency and prompt size, on the offline
+backends (hashing embeddings, in-memory Qdrant), so it runs in CI.
+
+The corpus is a synthetic --chapters textbook whose outline (chapters ->
+subtopics) is known. Every subtopic has its own vocabulary; a chunk is relevant
+to a subtopic's query when it contains at least RELEVANT_TERMS of its terms,
+which labels chunks the same way whatever chunker produced them.
+
+Compared:
+  index settings      chunker x chunk size (page/2000 is the old splitter)
+  query formulations  tutor_prompt    what /tutor embeds today (instructions + topic)
+                      topic_subtopic  the course page's "topic: X, subtopic: Y"
+                      subtopic        the subtopic title alone
+  k                   --ks
+
+Reports recall@k, MRR, search latency (embedding + Qdrant) and the prompt
+tokens the retrieved chunks add, as a Markdown table (and --json). With
+--min-recall / --min-mrr it exits non-zero when the --gate row falls below them.
+
+Usage:
+    cd backend
+    python scripts/eval_retrieval.py
+    python scripts/eval_retrieval.py --min-recall 0.5 --min-mrr 0.8   # CI gate
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SCAFFOLD_OFFLINE", "1")
+# Measure retrieval, not admission control
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ.setdefault("SCAFFOLD_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="eval_retrieval_"), "scaffold.db"))
+
+import fitz  # PyMuPDF
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from loaders.multiple_file import iter_pdf_pages
+from loaders.pdf_structure import iter_structured_chunks
+from tools.tokens import estimate_tokens
+from tools.vector_store import add_documents_for_user, clear_collection, search_for_user
+
+RELEVANT_TERMS = 3
+TERMS_PER_SUBTOPIC = 8
+INDEX_SETTINGS = [("page", 2000), ("structured", 1000), ("structured", 2000)]
+FORMULATIONS = ("tutor_prompt", "topic_subtopic", "subtopic")
+
+
+def _word(rng: random.Random) -> str:
+    syllables = ["ka", "lo", "mi", "ter", "van", "os", "ri", "del", "pha", "sun", "qua", "ni", "bel", "tor", "ex", "ul"]
+    return "".join(rng.choice(syllables) for _ in range(rng.randint(3, 4)))
+
+
+def build_corpus(path: str, chapters: int, seed: int = 0):
+    """Write the fixture PDF; returns its outline and each subtopic's vocabulary."""
+    rng = random.Random(seed)
+    common = [_word(rng) for _ in range(400)]
+    outline, vocabulary = {"topics": []}, {}
+    doc = fitz.open()
+    toc = []
+    for c in range(chapters):
+        chapter_terms = [_word(rng) for _ in range(6)]
+        chapter_title = f"{chapter_terms[0].title()} {chapter_terms[1].title()}"
+        topic = {"title": chapter_title, "subtopics": []}
+        page = doc.new_page()
+        page.insert_text((72, 72), chapter_title, fontsize=18)
+        toc.append([1, chapter_title, len(doc)])
+        y = 100
+        for s in range(rng.randint(3, 4)):
+            terms = [_word(rng) for _ in range(TERMS_PER_SUBTOPIC)]
+            title = f"{terms[0].title()} {terms[1]} {terms[2]}"
+            topic["subtopics"].append(title)
+            vocabulary[(chapter_title, title)] = set(terms)
+            if y > 650:
+                page, y = doc.new_page(), 72
+            page.insert_text((72, y), title, fontsize=14)
+            toc.append([2, title, len(doc)])
+            y += 24
+            for _ in range(rng.randint(3, 6)):
+                words = []
+                for _ in range(120):
+                    r = rng.random()
+                    pool = terms if r < 0.2 else chapter_terms if r < 0.3 else common
+                    words.append(rng.choice(pool))
+                if y > 560:
+                    page, y = doc.new_page(), 72
+                page.insert_textbox(fitz.Rect(72, y, 540, y + 200), " ".join(words) + ".", fontsize=10)
+                y += 205
+        outline["topics"].append(topic)
+    doc.set_toc(toc)
+    doc.save(path)
+    doc.close()
+    return outline, vocabulary
+
+
+def chunk_corpus(path: str, chunker: str, size: int):
+    if chunker == "structured":
+        return list(iter_structured_chunks(path, chunk_chars=size))
+    splitter = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=200, add_start_index=True)
+    return [chunk for page in iter_pdf_pages(path) for chunk in splitter.split_documents([page])]
+
+
+def formulate(kind: str, topic: str, subtopic: str) -> str:
+    request_text = f"topic: {topic}, subtopic: {subtopic}"
+    if kind == "tutor_prompt":
+        # Same text llm_services.bot.tutor embeds (mid-range understanding, no analogy info)
+        return (
+            f"Act as a tutor. The user's understanding out of ten is 5 where 10 is firm grasp "
+            f"of the concept and 0 is absolutely no idea what the concept is. For analogy here is "
+            f"some info about the user: . If no info is provided use a suitable one. {request_text}"
+        )[:2000]
+    if kind == "topic_subtopic":
+        return request_text
+    return subtopic
+
+
+def is_relevant(text: str, terms: set) -> bool:
+    return len(terms.intersection(text.lower().split())) >= RELEVANT_TERMS
+
+
+def evaluate(outline, vocabulary, user_id: str, chunk_texts, ks):
+    rows = {}
+    for kind in FORMULATIONS:
+        for k in ks:
+            recalls, ranks, latencies, tokens = [], [], [], []
+            for topic in outline["topics"]:
+                for subtopic in topic["subtopics"]:
+                    terms = vocabulary[(topic["title"], subtopic)]
+                    relevant = {t for t in chunk_texts if is_relevant(t, terms)}
+                    if not relevant:
+                        continue
+                    start = time.perf_counter()
+                    hits = search_for_user(formulate(kind, topic["title"], subtopic), user_id, k)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    found = [h.page_content for h in hits]
+                    recalls.append(len(relevant.intersection(found)) / len(relevant))
+                    rank = next((i for i, text in enumerate(found, 1) if text in relevant), None)
+                    ranks.append(1 / rank if rank else 0.0)
+                    tokens.append(estimate_tokens("\n\n".join(found)))
+            rows[(kind, k)] = {
+                "queries": len(recalls),
+                "recall": statistics.mean(recalls),
+                "mrr": statistics.mean(ranks),
+                "p50_ms": statistics.median(latencies),
+                "p95_ms": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+                "prompt_tokens": statistics.mean(tokens),
+            }
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--chapters", type=int, default=10)
+    parser.add_argument("--ks", default="2,4,8,12")
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--gate", default="structured-2000/topic_subtopic/4",
+                        help="Row checked by --min-recall/--min-mrr: <chunker>-<size>/<formulation>/<k>")
+    parser.add_argument("--min-recall", type=float, default=0.0)
+    parser.add_argument("--min-mrr", type=float, default=0.0)
+    args = parser.parse_args()
+    ks = [int(k) for k in args.ks.split(",")]
+
+    path = os.path.join(tempfile.mkdtemp(prefix="eval_corpus_"), "course.pdf")
+    outline, vocabulary = build_corpus(path, args.chapters)
+    subtopics = sum(len(t["subtopics"]) for t in outline["topics"])
+
+    print("# Retrieval evaluation\n")
+    print(f"{args.chapters} chapters, {subtopics} subtopic queries, offline hashing embeddings\n")
+    print("| index | chunks | query | k | recall@k | MRR | p50 ms | p95 ms | prompt tokens |")
+    print("|---|---|---|---|---|---|---|---|---|")
+    results = []
+    for chunker, size in INDEX_SETTINGS:
+        index = f"{chunker}-{size}"
+        chunks = chunk_corpus(path, chunker, size)
+        user_id = f"eval-{index}"
+        # One index per setting, so latency reflects its own size
+        clear_collection()
+        add_documents_for_user(chunks, user_id)
+        rows = evaluate(outline, vocabulary, user_id, {c.page_content for c in chunks}, ks)
+        for (kind, k), r in rows.items():
+            results.append({"index": index, "chunks": len(chunks), "query": kind, "k": k, **r})
+            print(f"| {index} | {len(chunks)} | {kind} | {k} | {r['recall']:.3f} | {r['mrr']:.3f} | "
+                  f"{r['p50_ms']:.1f} | {r['p95_ms']:.1f} | {r['prompt_tokens']:.0f} |")
+    os.remove(path)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    index, kind, k = args.gate.split("/")
+    gate = next((r for r in results if r["index"] == index and r["query"] == kind and r["k"] == int(k)), None)
+    if gate is None:
+        sys.exit(f"Gate row {args.gate} was not evaluated")
+    if gate["recall"] < args.min_recall or gate["mrr"] < args.min_mrr:
+        sys.exit(f"FAIL {args.gate}: recall@{k} {gate['recall']:.3f} (min {args.min_recall}), "
+                 f"MRR {gate['mrr']:.3f} (min {args.min_mrr})")
+    print(f"\ngate {args.gate}: recall@{k} {gate['recall']:.3f}, MRR {gate['mrr']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Online Re-embedding Migration
+
+Re-embeds every stored chunk with a new embedding model into a new collection
+while the app keeps serving from the old one, then switches the app's
+collection alias to the new collection in one atomic step.
+
+  1. copy      scroll the live collection in --batch pages and re-embed each
+               page's `page_content` in --embed-batch requests, at most
+               --concurrency at a time (through the embedding rate limiter).
+               Points keep their IDs and payloads, so the source registry
+               stays valid. Progress is checkpointed after every page in the
+               local database: re-running the same command resumes.
+  2. catch up  copy points added and delete points removed while step 1 ran
+  3. switch    (--finalize) catch up once more and point the alias at the new
+               collection; the old collection is kept for rollback
+
+A deployment from before aliases has a collection named COLLECTION_NAME, and
+an alias cannot take that name while the collection exists. Its points are
+therefore also copied as they are (vectors included) into
+COLLECTION_NAME__legacy during steps 1 and 2. --finalize deletes the original
+only once the copy is complete, then aliases the name to the new collection;
+the copy is what a rollback returns to. Reads and writes to the name fail for
+the moment between the delete and the alias update.
+
+Deploy the app with EMBEDDING_MODEL (and EMBEDDING_SIZE) set to the new model
+right after the switch: queries must be embedded by the model that built the
+index. Until then the app keeps using the old collection. --rollback points
+the alias back at the collection the switch replaced; redeploy the previous
+EMBEDDING_MODEL with it.
+
+Usage:
+    cd backend
+    python scripts/migrate_embeddings.py --model models/gemini-embedding-001
+    python scripts/migrate_embeddings.py --model models/gemini-embedding-001 --finalize
+    python scripts/migrate_embeddings.py --model models/gemini-embedding-001 --rollback
+
+    # Against a local Qdrant (server, or an on-disk embedded store)
+    python scripts/migrate_embeddings.py --url http://localhost:6333 --model ...
+    python scripts/migrate_embeddings.py --path ./qdrant_data --model ...
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointIdsList, PointStruct
+
+from tools import source_registry
+from tools import vector_store
+from tools.embeddings import EMBEDDING_MODEL, create_embeddings
+from tools.local_db import get_connection, init_schema
+from tools.vector_store import COLLECTION_NAME, CONTENT_KEY, collection_for_alias, create_collection, physical_collection_name, switch_alias
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embedding_migrations (
+    target TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    model TEXT NOT NULL,
+    next_offset TEXT,
+    copied INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Where a pre-alias COLLECTION_NAME collection is copied before the name becomes an alias
+LEGACY_BACKUP = f"{COLLECTION_NAME}__legacy"
+# Checkpoint model of a plain copy (vectors kept, nothing re-embedded)
+COPY_MODEL = "(copy)"
+
+
+def _db():
+    init_schema(_SCHEMA)
+    return get_connection()
+
+
+def load_checkpoint(target: str):
+    row = _db().execute(
+        "SELECT source, model, next_offset, copied, status FROM embedding_migrations WHERE target = ?", (target,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"source": row[0], "model": row[1], "next_offset": json.loads(row[2]), "copied": row[3], "status": row[4]}
+
+
+def save_checkpoint(target: str, source: str, model: str, next_offset, copied: int, status: str):
+    _db().execute(
+        "INSERT OR REPLACE INTO embedding_migrations VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (target, source, model, json.dumps(next_offset), copied, status, time.time()),
+    )
+
+
+class Reembedder:
+    """Re-embeds points' page_content with bounded parallelism and upserts them into the target."""
+
+    with_vectors = False
+
+    def __init__(self, client: QdrantClient, target: str, model: str, embed_batch: int, concurrency: int):
+        self.client = client
+        self.target = target
+        self.embeddings = create_embeddings(model)
+        self.embed_batch = embed_batch
+        self.pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="reembed")
+
+    def vector_size(self) -> int:
+        return len(self.embeddings.embed_documents(["dimension probe"])[0])
+
+    def copy(self, records) -> int:
+        records = [r for r in records if isinstance((r.payload or {}).get(CONTENT_KEY), str)]
+        if not records:
+            return 0
+        texts = [r.payload[CONTENT_KEY] for r in records]
+        batches = [texts[i:i + self.embed_batch] for i in range(0, len(texts), self.embed_batch)]
+        vectors = [v for batch in self.pool.map(self.embeddings.embed_documents, batches) for v in batch]
+        self.client.upsert(
+            collection_name=self.target,
+            points=[PointStruct(id=r.id, vector=v, payload=r.payload) for r, v in zip(records, vectors)],
+            wait=True,
+        )
+        return len(records)
+
+
+class VectorCopier:
+    """Upserts points into the target as they are, vectors included."""
+
+    with_vectors = True
+
+    def __init__(self, client: QdrantClient, target: str):
+        self.client = client
+        self.target = target
+
+    def copy(self, records) -> int:
+        if records:
+            self.client.upsert(
+                collection_name=self.target,
+                points=[PointStruct(id=r.id, vector=r.vector, payload=r.payload) for r in records],
+                wait=True,
+            )
+        return len(records)
+
+
+class Progress:
+    def __init__(self, total: int, done: int):
+        self.total = total
+        self.start_done = done
+        self.start = time.perf_counter()
+
+    def report(self, done: int):
+        elapsed = time.perf_counter() - self.start
+        rate = (done - self.start_done) / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - done)
+        eta = f"{remaining / rate:,.0f}s" if rate > 0 else "?"
+        pct = 100 * done / self.total if self.total else 100.0
+        print(f"  {done:,}/{self.total:,} points ({pct:5.1f}%)  {rate:,.1f} points/s  ETA {eta}", flush=True)
+
+
+def _point_ids(client: QdrantClient, collection: str) -> set:
+    ids, offset = set(), None
+    while True:
+        records, offset = client.scroll(collection, limit=1000, offset=offset, with_payload=False, with_vectors=False)
+        ids.update(r.id for r in records)
+        if offset is None:
+            return ids
+
+
+def copy_points(client: QdrantClient, source: str, target: str, copier, model: str, batch: int) -> int:
+    """Copy every point of `source` into `target` in pages of `batch`, resuming from the checkpoint."""
+    checkpoint = load_checkpoint(target)
+    if checkpoint and checkpoint["status"] != "copying":
+        return checkpoint["copied"]
+    total = client.count(source, exact=True).count
+    copied = checkpoint["copied"] if checkpoint else 0
+    offset = checkpoint["next_offset"] if checkpoint else None
+    print(f"\ncopy to {target}: {total:,} points" + (f", resuming after {copied:,}" if copied else ""))
+    progress = Progress(total, copied)
+    while True:
+        records, offset = client.scroll(
+            source, limit=batch, offset=offset, with_payload=True, with_vectors=copier.with_vectors
+        )
+        copied += copier.copy(records)
+        save_checkpoint(target, source, model, offset, copied, "copying" if offset is not None else "copied")
+        progress.report(copied)
+        if offset is None:
+            return copied
+
+
+def catch_up(client: QdrantClient, source: str, target: str, copier, batch: int) -> tuple:
+    """Copy points written to the source since they were scrolled; delete points removed from it."""
+    source_ids = _point_ids(client, source)
+    target_ids = _point_ids(client, target)
+    missing = sorted(source_ids - target_ids, key=str)
+    removed = sorted(target_ids - source_ids, key=str)
+    for i in range(0, len(missing), batch):
+        copier.copy(client.retrieve(source, missing[i:i + batch], with_payload=True, with_vectors=copier.with_vectors))
+    if removed:
+        client.delete(collection_name=target, points_selector=PointIdsList(points=removed), wait=True)
+    return len(missing), len(removed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--model", required=True, help="New embedding model (e.g. models/gemini-embedding-001)")
+    parser.add_argument("--target", help="New collection name (default: derived from the model)")
+    parser.add_argument("--batch", type=int, default=256, help="Points per scroll page / checkpoint")
+    parser.add_argument("--embed-batch", type=int, default=64, help="Texts per embedding request")
+    parser.add_argument("--concurrency", type=int, default=4, help="Embedding requests in flight")
+    parser.add_argument("--finalize", action="store_true", help="Catch up and switch the alias to the new collection")
+    parser.add_argument("--rollback", action="store_true",
+                        help=f"Point '{COLLECTION_NAME}' back at the collection the switch to --model replaced")
+    parser.add_argument("--url", help="Qdrant URL (default: the app's QdrantClient_url / QdrantClient_path)")
+    parser.add_argument("--path", help="On-disk embedded Qdrant directory")
+    args = parser.parse_args()
+
+    if args.url or args.path:
+        client = QdrantClient(url=args.url, api_key=os.getenv("QdrantClient_api_key")) if args.url else QdrantClient(path=args.path)
+    else:
+        # Not connect(): that refuses to start when EMBEDDING_MODEL already names the new model
+        client = vector_store._create_client()
+    try:
+        rollback(client, args) if args.rollback else migrate(client, args)
+    finally:
+        client.close()
+
+
+def migrate(client: QdrantClient, args):
+    if not client.collection_exists(COLLECTION_NAME):
+        sys.exit(f"Collection '{COLLECTION_NAME}' does not exist: nothing to migrate.")
+    source = collection_for_alias(client, COLLECTION_NAME) or COLLECTION_NAME
+    legacy = source == COLLECTION_NAME
+    target = args.target or physical_collection_name(args.model)
+    if target == source:
+        sys.exit(f"'{COLLECTION_NAME}' already serves collection '{target}'.")
+
+    print("=" * 60)
+    print("RE-EMBEDDING MIGRATION")
+    print("=" * 60)
+    print(f"alias {COLLECTION_NAME} -> {source}  =>  {target} ({args.model})")
+
+    reembedder = Reembedder(client, target, args.model, args.embed_batch, args.concurrency)
+    checkpoint = load_checkpoint(target)
+    if checkpoint and checkpoint["model"] != args.model:
+        sys.exit(f"'{target}' is being built with {checkpoint['model']}; pass a different --target.")
+    if checkpoint and checkpoint["status"] == "switched":
+        print("already switched")
+        return
+    if not client.collection_exists(target):
+        size = reembedder.vector_size()
+        create_collection(client, target, size)
+        _db().execute("DELETE FROM embedding_migrations WHERE target = ?", (target,))
+        print(f"created {target} ({size} dimensions)")
+
+    copied = copy_points(client, source, target, reembedder, args.model, args.batch)
+    added, removed = catch_up(client, source, target, reembedder, args.batch)
+    print(f"\ncatch-up: {added} points added, {removed} removed since they were scrolled")
+
+    copier = VectorCopier(client, LEGACY_BACKUP)
+    if legacy:
+        # The name becomes an alias at the switch; keep its points under another name first
+        if not client.collection_exists(LEGACY_BACKUP):
+            create_collection(client, LEGACY_BACKUP, client.get_collection(source).config.params.vectors.size)
+            _db().execute("DELETE FROM embedding_migrations WHERE target = ?", (LEGACY_BACKUP,))
+        copy_points(client, source, LEGACY_BACKUP, copier, COPY_MODEL, args.batch)
+        catch_up(client, source, LEGACY_BACKUP, copier, args.batch)
+    if not args.finalize:
+        print(f"\nRe-run with --finalize to switch '{COLLECTION_NAME}' to '{target}'.")
+        return
+
+    added, removed = catch_up(client, source, target, reembedder, args.batch)
+    if legacy:
+        catch_up(client, source, LEGACY_BACKUP, copier, args.batch)
+        kept, total = client.count(LEGACY_BACKUP, exact=True).count, client.count(source, exact=True).count
+        if kept != total:
+            sys.exit(f"'{LEGACY_BACKUP}' has {kept} of {total} points; not deleting '{COLLECTION_NAME}'. Re-run.")
+        client.delete_collection(COLLECTION_NAME)
+    switch_alias(client, COLLECTION_NAME, target)
+    save_checkpoint(target, LEGACY_BACKUP if legacy else source, args.model, None, copied, "switched")
+    relabeled = source_registry.relabel_embedding_model(args.model)
+    print(f"final catch-up: {added} added, {removed} removed")
+    print(f"\nswitched '{COLLECTION_NAME}' -> '{target}'; {relabeled} registered sources now on {args.model}")
+    print(f"'{LEGACY_BACKUP if legacy else source}' is kept for rollback; delete it once the new model is deployed.")
+    print(f"Deploy with EMBEDDING_MODEL={args.model} now.")
+
+
+def rollback(client: QdrantClient, args):
+    """Point the alias back at the collection the switch to `args.model` replaced."""
+    target = args.target or physical_collection_name(args.model)
+    checkpoint = load_checkpoint(target)
+    if checkpoint is None or checkpoint["status"] != "switched":
+        sys.exit(f"No switch to '{target}' to roll back.")
+    previous = checkpoint["source"]
+    if not client.collection_exists(previous):
+        sys.exit(f"'{previous}' no longer exists; nothing to roll back to.")
+    switch_alias(client, COLLECTION_NAME, previous)
+    save_checkpoint(target, previous, checkpoint["model"], None, checkpoint["copied"], "copied")
+    # Run with the previous deployment's settings: EMBEDDING_MODEL names the model of `previous`
+    relabeled = source_registry.relabel_embedding_model(EMBEDDING_MODEL)
+    print(f"rolled back '{COLLECTION_NAME}' -> '{previous}'; {relabeled} registered sources back on {EMBEDDING_MODEL}")
+    print(f"Deploy with EMBEDDING_MODEL={EMBEDDING_MODEL} now.")
+
+
+if __name__ == "__main__":
+    main()
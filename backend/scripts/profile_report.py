@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Profile Report
+
+Summarizes the request profiles stored by tools/profiling.py (PROFILE_DIR):
+the profiles per endpoint, then the functions with the most samples across
+them. Self samples count where a function was running; total samples count
+where it was anywhere on the stack. --cpu uses only the samples in which the
+thread was on CPU, which leaves out waiting on the model, Qdrant or the
+network. --collapsed writes the merged stacks for flamegraph.pl or speedscope.
+
+Usage:
+    cd backend
+    python scripts/profile_report.py --endpoint /upload_pdfs --top 20
+    python scripts/profile_report.py --cpu --collapsed upload.folded
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.profiling import PROFILE_DIR
+
+
+def load_profiles(directory: str, endpoint=None, since_hours=None):
+    cutoff = time.time() - since_hours * 3600 if since_hours else 0
+    profiles = []
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            profile = json.load(f)
+        metadata = profile["metadata"]
+        if endpoint and metadata["endpoint"] != endpoint:
+            continue
+        if metadata["started_at"] < cutoff:
+            continue
+        profiles.append(profile)
+    return profiles
+
+
+def hot_spots(stacks: Counter):
+    """Self and total samples per function (a function counts once per stack for total)."""
+    self_samples, total_samples = Counter(), Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]  # first entry is the thread group
+        if not frames:
+            continue
+        self_samples[frames[-1]] += count
+        for frame in set(frames):
+            total_samples[frame] += count
+    return self_samples, total_samples
+
+
+def print_table(title: str, counts: Counter, samples: int, top: int):
+    print(f"\n{title}")
+    print(f"{'samples':>8} {'share':>7}  function")
+    for frame, count in counts.most_common(top):
+        print(f"{count:>8} {count / max(1, samples):>7.1%}  {frame}")
+
+
+def main(args):
+    profiles = load_profiles(args.dir, args.endpoint, args.since_hours)
+    kind = "cpu" if args.cpu else "wall"
+    print("=" * 60)
+    print("PROFILE REPORT")
+    print("=" * 60)
+    if not profiles:
+        print(f"no profiles in {args.dir}")
+        return
+
+    by_endpoint = defaultdict(list)
+    for profile in profiles:
+        by_endpoint[profile["metadata"]["endpoint"]].append(profile["metadata"])
+    print(f"{len(profiles)} profiles in {args.dir} ({kind} samples)\n")
+    print(f"{'endpoint':<24} {'profiles':>8} {'p50 s':>8} {'max s':>8} {'samples':>8} {'overlap':>8}")
+    for endpoint, metas in sorted(by_endpoint.items()):
+        seconds = [m["seconds"] for m in metas]
+        print(f"{endpoint:<24} {len(metas):>8} {statistics.median(seconds):>8.2f} {max(seconds):>8.2f} "
+              f"{sum(m['samples'] for m in metas):>8} {max(m['max_concurrent_requests'] for m in metas):>8}")
+
+    stacks = Counter()
+    for profile in profiles:
+        stacks.update(profile[kind])
+    samples = sum(stacks.values())
+    self_samples, total_samples = hot_spots(stacks)
+    print(f"\n{samples} thread samples")
+    print_table("top functions by self samples", self_samples, samples, args.top)
+    print_table("top functions by total samples", total_samples, samples, args.top)
+
+    if args.collapsed:
+        with open(args.collapsed, "w") as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        print(f"\nwrote {len(stacks)} collapsed stacks to {args.collapsed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--dir", default=PROFILE_DIR)
+    parser.add_argument("--endpoint", help="Only profiles of this route template, e.g. /tutor")
+    parser.add_argument("--since-hours", type=float)
+    parser.add_argument("--cpu", action="store_true", help="On-CPU samples only")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--collapsed", help="Write the merged collapsed stacks to this file")
+    main(parser.parse_args())
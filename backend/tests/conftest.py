@@ -0,0 +1,39 @@
+"""
+Test setup: offline mode (fake models and embeddings, in-process Qdrant) and
+a throwaway local database, configured before any backend module is imported.
+"""
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["SCAFFOLD_OFFLINE"] = "1"
+os.environ.setdefault("LLM_RPM", "1000000")
+os.environ.setdefault("LLM_TPM", "1000000000")
+os.environ.setdefault("EMBED_RPM", "1000000")
+os.environ["SCAFFOLD_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="scaffold_tests_"), "scaffold.db")
+
+import fitz  # PyMuPDF
+import pytest
+
+
+@pytest.fixture
+def user_id():
+    """A fresh user per test, so tests share the database without seeing each other's rows."""
+    return f"test-{uuid.uuid4().hex[:12]}"
+
+
+@pytest.fixture
+def write_pdf():
+    """Write a PDF with one page per text to `path`."""
+
+    def write(path: str, pages):
+        doc = fitz.open()
+        for text in pages:
+            doc.new_page().insert_textbox(fitz.Rect(72, 72, 540, 770), text, fontsize=10)
+        doc.save(path)
+        doc.close()
+        return path
+
+    return write
@@ -0,0 +1,78 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import AIMessage
+
+from llm_services import chat_memory
+
+
+class _Summarizer:
+    """Fake chat_memory model; `during` runs while the summary is being "generated"."""
+
+    def __init__(self, during=None):
+        self.during = during
+
+    def invoke(self, messages):
+        if self.during:
+            self.during()
+        return AIMessage(content="summary of the early turns")
+
+
+def test_concurrent_turns_are_all_kept(user_id):
+    start = threading.Barrier(8)
+
+    def talk(worker):
+        start.wait()
+        for i in range(10):
+            chat_memory.save_turn(user_id, "s1", f"q{worker}-{i}", f"a{worker}-{i}")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(talk, range(8)))
+
+    _, turns = chat_memory.load_session(user_id, "s1")
+    assert sorted(t["user"] for t in turns) == sorted(f"q{w}-{i}" for w in range(8) for i in range(10))
+
+
+def _fill_past_window(user_id, session_id):
+    """Save turns until the oldest fall out of the recent window."""
+    answer = "photosynthesis " * (chat_memory.HISTORY_TOKENS // 8)
+    while chat_memory.save_turn(user_id, session_id, "question", answer) is False:
+        pass
+
+
+def _on_other_thread(fn, *args):
+    # Another request or worker: its own thread, so its own database connection
+    thread = threading.Thread(target=fn, args=args)
+    thread.start()
+    thread.join()
+
+
+def test_turn_saved_during_summarization_is_kept(user_id, monkeypatch):
+    _fill_past_window(user_id, "s1")
+    _, before = chat_memory.load_session(user_id, "s1")
+    kept = chat_memory.recent_window(before)
+
+    late_turn = lambda: _on_other_thread(chat_memory.save_turn, user_id, "s1", "late question", "late answer")
+    monkeypatch.setattr(chat_memory, "chat_model", lambda route: _Summarizer(late_turn))
+    chat_memory.summarize_old_turns(user_id, "s1")
+
+    summary, turns = chat_memory.load_session(user_id, "s1")
+    assert summary == "summary of the early turns"
+    assert turns == kept + [{"user": "late question", "assistant": "late answer"}]
+
+
+def test_summary_of_another_worker_is_not_overwritten(user_id, monkeypatch):
+    _fill_past_window(user_id, "s1")
+
+    def fold():
+        chat_memory._db().execute(
+            "UPDATE chat_sessions SET summary = 'folded elsewhere', turns = '[]' WHERE user_id = ?", (user_id,)
+        )
+
+    other_worker_folds = lambda: _on_other_thread(fold)
+    monkeypatch.setattr(chat_memory, "chat_model", lambda route: _Summarizer(other_worker_folds))
+    chat_memory.summarize_old_turns(user_id, "s1")
+
+    summary, _ = chat_memory.load_session(user_id, "s1")
+    assert summary == "folded elsewhere"
+
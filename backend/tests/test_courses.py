@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+
+import app as server
+from tools import course_store
+
+OUTLINE = {"topics": [{"title": "Waves", "summary": "Wave motion.", "subtopics": ["Frequency", "Amplitude"]}]}
+EDITED = {"topics": [
+    {"title": "Waves", "summary": "Wave motion.", "subtopics": ["Frequency", "Amplitude"]},
+    {"title": "Sound", "summary": "Sound waves.", "subtopics": ["Pitch"]},
+]}
+
+
+def test_diff_of_first_version_is_a_bad_request(user_id):
+    course = course_store.create_course(user_id, OUTLINE, ["notes.pdf@0123456789ab"])
+    with TestClient(server.app) as client:
+        response = client.get(f"/courses/{course['course_id']}/diff", params={"user_id": user_id})
+        assert response.status_code == 400
+        assert "no version before version 1" in response.json()["detail"]
+
+        course_store.add_version(course["course_id"], user_id, EDITED, course["source_ids"], "edit", 1)
+        response = client.get(f"/courses/{course['course_id']}/diff", params={"user_id": user_id})
+        assert response.status_code == 200
+        assert [t["title"] for t in response.json()["added_topics"]] == ["Sound"]
+
+        response = client.get(f"/courses/{course['course_id']}/diff", params={"user_id": user_id, "from_version": 7})
+        assert response.status_code == 404
+
+
+def test_edit_of_a_course_deleted_meanwhile_is_not_found(user_id, monkeypatch):
+    course = course_store.create_course(user_id, OUTLINE, ["notes.pdf@0123456789ab"])
+    add_version = course_store.add_version
+
+    def delete_first(course_id, *args):
+        course_store.delete_course(course_id, user_id)
+        return add_version(course_id, *args)
+
+    monkeypatch.setattr(course_store, "add_version", delete_first)
+    with TestClient(server.app) as client:
+        response = client.put(
+            f"/courses/{course['course_id']}", json={"user_id": user_id, "outline": EDITED, "base_version": 1}
+        )
+    assert response.status_code == 404
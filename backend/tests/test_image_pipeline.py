@@ -0,0 +1,58 @@
+import base64
+import json
+
+import fitz  # PyMuPDF
+import numpy as np
+from langchain_core.documents import Document
+
+from tools.image_pipeline import select_images
+
+
+def _picture(width: int, height: int, seed: int) -> fitz.Pixmap:
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width] / max(width, height)
+    fx, fy, phase = rng.uniform(2, 6, 3)
+    pixels = 128 + 80 * np.sin(fx * x * np.pi + phase) * np.cos(fy * y * np.pi)
+    samples = np.repeat(pixels[..., None], 3, axis=2).astype(np.uint8).tobytes()
+    return fitz.Pixmap(fitz.csRGB, width, height, samples, False)
+
+
+def _data_url(pix: fitz.Pixmap, fmt: str = "png") -> str:
+    data = pix.tobytes("jpeg", jpg_quality=70) if fmt == "jpeg" else pix.tobytes("png")
+    return f"data:image/{fmt};base64," + base64.b64encode(data).decode("ascii")
+
+
+def _pages(*images_per_page):
+    return [
+        Document(page_content=f"[Page {i + 1}] text", metadata={"images": json.dumps(images)})
+        for i, images in enumerate(images_per_page)
+    ]
+
+
+def test_same_picture_in_other_bytes_is_sent_once():
+    picture = _picture(640, 480, 0)
+    smaller = fitz.Pixmap(picture, 320, 240, None)
+    docs = _pages([_data_url(picture)], [_data_url(picture, "jpeg")], [_data_url(smaller)])
+
+    selected, report = select_images(docs)
+
+    assert len(selected) == 1
+    assert report["dropped_duplicate"] == 2
+
+
+def test_different_pictures_are_all_sent():
+    docs = _pages([_data_url(_picture(640, 480, seed)) for seed in range(3)])
+
+    selected, report = select_images(docs)
+
+    assert len(selected) == 3
+    assert report["dropped_duplicate"] == 0
+
+
+def test_decorative_images_are_dropped():
+    docs = _pages([_data_url(_picture(24, 24, 1)), _data_url(_picture(640, 480, 2))])
+
+    selected, report = select_images(docs)
+
+    assert len(selected) == 1
+    assert report["dropped_decorative"] == 1
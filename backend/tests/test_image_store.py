@@ -0,0 +1,55 @@
+import base64
+
+from tools import image_store
+from tools.local_db import get_connection
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def _data_url(payload: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(payload).decode()
+
+
+def test_least_recently_used_images_are_evicted_beyond_the_cap(monkeypatch):
+    # After the real clock, so images other tests stored are older than these
+    clock = Clock(1.9e9)
+    monkeypatch.setattr(image_store, "time", clock)
+    monkeypatch.setattr(image_store, "IMAGE_STORE_MAX_BYTES", 2500)
+
+    first = image_store.store_data_url(_data_url(b"a" * 1000))
+    clock.now += 7200
+    second = image_store.store_data_url(_data_url(b"b" * 1000))
+    clock.now += 7200
+    # Serving the first image makes the second the least recently used
+    assert image_store.get_image(first) == ("image/png", b"a" * 1000)
+    clock.now += 7200
+    third = image_store.store_data_url(_data_url(b"c" * 1000))
+
+    assert image_store.get_image(second) is None
+    assert image_store.get_image(first) is not None and image_store.get_image(third) is not None
+
+
+def test_images_unused_past_the_ttl_are_evicted(monkeypatch):
+    clock = Clock(2e9)
+    monkeypatch.setattr(image_store, "time", clock)
+    old = image_store.store_data_url(_data_url(b"old image"))
+    clock.now += image_store.IMAGE_STORE_TTL_SECONDS + 1
+    new = image_store.store_data_url(_data_url(b"new image"))
+    assert image_store.get_image(old) is None
+    assert image_store.get_image(new) == ("image/png", b"new image")
+
+
+def test_images_from_the_old_table_are_kept(monkeypatch):
+    db = get_connection()
+    db.execute("CREATE TABLE IF NOT EXISTS images (image_id TEXT PRIMARY KEY, mime TEXT NOT NULL, "
+               "data BLOB NOT NULL, created_at REAL NOT NULL)")
+    db.execute("INSERT INTO images VALUES ('legacy0123', 'image/jpeg', ?, ?)", (b"jpeg bytes", 3e9))
+    monkeypatch.setattr(image_store, "_schema_ready", False)
+    assert image_store.get_image("legacy0123") == ("image/jpeg", b"jpeg bytes")
+    assert db.execute("SELECT name FROM sqlite_master WHERE name = 'images'").fetchone() is None
@@ -0,0 +1,47 @@
+import json
+
+from pydantic import BaseModel
+
+from tools.json_repair import close_truncated_json, fix_escapes, loads_lenient, repair_structured_output
+
+
+class Quiz(BaseModel):
+    topic_title: str
+    flashcards: list
+
+
+class Deck(BaseModel):
+    flashcards: list
+
+
+def test_fix_escapes_doubles_latex_commands_only():
+    text = r'{"board": "$\frac{a}{b}$ and \theta, \nabla f, \beta, \times, \text{x}, \sqrt{x}, \underline{y}"}'
+    assert json.loads(fix_escapes(text))["board"] == (
+        r"$\frac{a}{b}$ and \theta, \nabla f, \beta, \times, \text{x}, \sqrt{x}, \underline{y}"
+    )
+
+
+def test_fix_escapes_keeps_real_escapes():
+    text = r'{"narration": "Step one.\nThe next\tline says \"hi\" é \\ done\n\n"}'
+    assert fix_escapes(text) == text
+    assert json.loads(fix_escapes(text))["narration"] == 'Step one.\nThe next\tline says "hi" é \\ done\n\n'
+
+
+def test_loads_lenient_handles_fences_commas_and_latex():
+    text = '```json\n{"board": "Use \\sqrt{x} and \\frac{1}{2}", "items": [1, 2,],}\n```'
+    assert loads_lenient(text) == {"board": r"Use \sqrt{x} and \frac{1}{2}", "items": [1, 2]}
+
+
+def test_close_truncated_json_drops_the_dangling_element():
+    closed = close_truncated_json('{"topic_title": "Waves", "flashcards": [{"question": "Q1"}, {"question": "Q')
+    assert json.loads(closed) == {"topic_title": "Waves", "flashcards": [{"question": "Q1"}, {"question": "Q"}]}
+
+
+def test_repair_structured_output_validates_the_repaired_json():
+    repaired = repair_structured_output('{"topic_title": "Waves", "flashcards": [{"question": "Q1"},]}', Quiz)
+    assert repaired.flashcards == [{"question": "Q1"}]
+    assert repair_structured_output('{"topic_title": "Waves", "flashcards_list": []}', Quiz) is None
+
+
+def test_repair_structured_output_wraps_a_bare_list():
+    assert repair_structured_output('Here you go: [{"question": "Q1"},]', Deck).flashcards == [{"question": "Q1"}]
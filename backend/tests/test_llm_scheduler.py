@@ -0,0 +1,16 @@
+from tools.llm_scheduler import worker_count
+
+
+def test_worker_count_reads_uvicorn_workers_option(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "2")
+    assert worker_count(["/usr/local/bin/uvicorn", "app:app", "--workers", "4"]) == 4
+    assert worker_count(["/usr/local/bin/uvicorn", "app:app", "--workers=3"]) == 3
+    assert worker_count(["/usr/lib/python3/site-packages/uvicorn/__main__.py", "app:app", "--workers", "5"]) == 5
+
+
+def test_worker_count_falls_back_to_web_concurrency(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "2")
+    assert worker_count(["/usr/local/bin/uvicorn", "app:app"]) == 2
+    assert worker_count(["scripts/bench_workers.py", "--workers", "4"]) == 2
+    monkeypatch.delenv("WEB_CONCURRENCY")
+    assert worker_count(["pytest"]) == 1
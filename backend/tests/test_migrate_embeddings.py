@@ -0,0 +1,59 @@
+import argparse
+
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+from scripts import migrate_embeddings
+from tools.embeddings import EMBEDDING_MODEL, embedding_size
+from tools.vector_store import COLLECTION_NAME, collection_for_alias, create_collection
+
+NEW_MODEL = "offline-hashing-64"
+
+
+def _args(**overrides):
+    args = dict(model=NEW_MODEL, target=None, batch=3, embed_batch=2, concurrency=1, finalize=False, rollback=False)
+    return argparse.Namespace(**{**args, **overrides})
+
+
+@pytest.fixture
+def legacy_client():
+    """A deployment from before aliases: COLLECTION_NAME is a real collection."""
+    client = QdrantClient(location=":memory:")
+    size = embedding_size(EMBEDDING_MODEL)
+    create_collection(client, COLLECTION_NAME, size)
+    client.upsert(COLLECTION_NAME, points=[
+        PointStruct(id=i, vector=[1.0, float(i)] + [0.0] * (size - 2),
+                    payload={"page_content": f"chunk {i}", "metadata": {"user_id": "u"}})
+        for i in range(7)
+    ])
+    yield client
+    client.close()
+
+
+def test_legacy_collection_is_kept_until_switch_and_restorable(legacy_client):
+    client = legacy_client
+    target = migrate_embeddings.physical_collection_name(NEW_MODEL)
+
+    migrate_embeddings.migrate(client, _args())
+    # Before --finalize nothing the app reads has changed
+    assert collection_for_alias(client, COLLECTION_NAME) is None
+    assert client.count(COLLECTION_NAME, exact=True).count == 7
+    assert client.count(migrate_embeddings.LEGACY_BACKUP, exact=True).count == 7
+
+    # Written while the copy ran: caught up into both copies at the switch
+    client.upsert(COLLECTION_NAME, points=[
+        PointStruct(id=7, vector=[1.0, 7.0] + [0.0] * (embedding_size(EMBEDDING_MODEL) - 2),
+                    payload={"page_content": "chunk 7", "metadata": {"user_id": "u"}})
+    ])
+    original = client.retrieve(COLLECTION_NAME, [7], with_vectors=True)[0].vector
+    migrate_embeddings.migrate(client, _args(finalize=True))
+    assert collection_for_alias(client, COLLECTION_NAME) == target
+    assert client.count(COLLECTION_NAME, exact=True).count == 8
+    # Kept with its original vector, not re-embedded
+    backup = client.retrieve(migrate_embeddings.LEGACY_BACKUP, [7], with_vectors=True)
+    assert backup[0].vector == pytest.approx(original)
+
+    migrate_embeddings.rollback(client, _args(rollback=True))
+    assert collection_for_alias(client, COLLECTION_NAME) == migrate_embeddings.LEGACY_BACKUP
+    assert client.count(COLLECTION_NAME, exact=True).count == 8
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from llm_services import pregen
+from tools import vector_store
+
+OUTLINE = {"topics": [{"title": "Biology", "subtopics": ["Photosynthesis", "Respiration"]}]}
+TEXT = "topic: Biology, subtopic: Photosynthesis"
+
+
+@pytest.fixture
+def pregenerator(monkeypatch):
+    calls = []
+
+    async def fake_tutor(text, adapt, analogy, user_id):
+        calls.append(text)
+        return {"lesson": text, "corpus": vector_store.corpus_version(user_id)}
+
+    monkeypatch.setattr(pregen, "PREGEN_ENABLED", True)
+    monkeypatch.setattr(pregen, "tutor", fake_tutor)
+    worker = pregen.LessonPregenerator()
+    worker.calls = calls
+    return worker
+
+
+async def _pregenerate(worker, user_id):
+    worker.schedule_outline(user_id, OUTLINE)
+    await worker.queue.join()
+
+
+def test_stored_lesson_is_served(pregenerator, user_id):
+    async def run():
+        await _pregenerate(pregenerator, user_id)
+        await pregenerator.stop()
+
+    asyncio.run(run())
+    lesson = pregenerator.lookup(user_id, "  Topic: Biology,  subtopic: photosynthesis ", pregen.DEFAULT_ADAPT, "")
+
+    assert lesson["lesson"] == TEXT
+    assert pregenerator.stats["generated"] == 2
+
+
+def test_source_change_invalidates_stored_lessons(pregenerator, user_id):
+    async def run():
+        await _pregenerate(pregenerator, user_id)
+        assert pregenerator.lookup(user_id, TEXT, pregen.DEFAULT_ADAPT, "") is not None
+
+        # Any source change (upload, replace, delete) bumps the user's corpus version
+        vector_store.delete_user_documents(user_id)
+        assert pregenerator.lookup(user_id, TEXT, pregen.DEFAULT_ADAPT, "") is None
+
+        await _pregenerate(pregenerator, user_id)
+        await pregenerator.stop()
+
+    asyncio.run(run())
+    lesson = pregenerator.lookup(user_id, TEXT, pregen.DEFAULT_ADAPT, "")
+
+    assert lesson["corpus"] == vector_store.corpus_version(user_id)
+    assert len(pregenerator.calls) == 4
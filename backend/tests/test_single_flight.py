@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from tools.single_flight import SingleFlight
+
+
+def test_followers_share_the_leaders_result():
+    async def scenario():
+        flight, calls = SingleFlight("test"), []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"answer": 42}
+
+        results = await asyncio.gather(*(flight.run("k", work) for _ in range(3)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert results[0] is results[1] is results[2]
+    assert flight.stats["leaders"] == 1 and flight.stats["coalesced"] == 2 and flight.stats["in_flight"] == 0
+
+
+def test_work_is_cancelled_when_the_last_caller_leaves():
+    async def scenario():
+        flight, started, cancelled = SingleFlight("test"), asyncio.Event(), asyncio.Event()
+
+        async def work():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        first = asyncio.create_task(flight.run("k", work))
+        second = asyncio.create_task(flight.run("k", work))
+        await started.wait()
+        first.cancel()
+        await asyncio.sleep(0)
+        # One caller is still waiting: the work goes on
+        assert not cancelled.is_set()
+        second.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        return flight
+
+    flight = asyncio.run(scenario())
+    assert flight.stats["cancelled"] == 1 and flight.stats["failed"] == 0 and flight.stats["in_flight"] == 0
+
+
+def test_request_after_cancellation_starts_new_work():
+    async def scenario():
+        flight, runs = SingleFlight("test"), []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return len(runs)
+
+        leaving = asyncio.create_task(flight.run("k", work))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        # The cancelled generation is still unwinding; a re-sent request must not join it
+        result = await flight.run("k", work)
+        return flight, result
+
+    flight, result = asyncio.run(scenario())
+    assert result == 2
+    assert flight.stats["leaders"] == 2 and flight.stats["failed"] == 0 and flight.stats["cancelled"] == 1
@@ -0,0 +1,97 @@
+import asyncio
+
+from loaders.multiple_file import load_directory
+from tools import source_registry
+from tools.vector_store import scroll_vectors_for_user
+
+NOTES_A = [
+    "Photosynthesis converts light energy into chemical energy stored in glucose. " * 20,
+    "Chlorophyll absorbs red and blue light and reflects green light. " * 20,
+]
+NOTES_B = [
+    "Newton's second law relates the net force on a body to its acceleration. " * 20,
+    "Momentum is conserved in every collision without external forces. " * 20,
+]
+
+
+def _load(directory, user_id, replace=None):
+    return asyncio.run(load_directory(directory, [], user_id, replace))
+
+
+def _chunks(user_id, source_id):
+    _, documents = scroll_vectors_for_user(user_id, [source_id])
+    return [d.page_content for d in documents]
+
+
+def test_same_name_different_file_is_a_new_source(tmp_path, user_id, write_pdf):
+    first, second = tmp_path / "biology", tmp_path / "physics"
+    first.mkdir()
+    second.mkdir()
+    write_pdf(str(first / "notes.pdf"), NOTES_A)
+    write_pdf(str(second / "notes.pdf"), NOTES_B)
+
+    [biology] = _load(str(first), user_id)["source_ids"]
+    summary = _load(str(second), user_id)
+    [physics] = summary["source_ids"]
+
+    assert biology != physics
+    assert source_registry.source_name(biology) == source_registry.source_name(physics) == "notes.pdf"
+    assert summary["removed_chunks"] == 0
+    assert {s["source_id"] for s in source_registry.list_sources(user_id)} == {biology, physics}
+    assert any("Photosynthesis" in text for text in _chunks(user_id, biology))
+    assert any("Newton" in text for text in _chunks(user_id, physics))
+
+
+def test_reupload_of_same_content_is_unchanged(tmp_path, user_id, write_pdf):
+    write_pdf(str(tmp_path / "notes.pdf"), NOTES_A)
+    [source_id] = _load(str(tmp_path), user_id)["source_ids"]
+
+    summary = _load(str(tmp_path), user_id)
+
+    assert summary["source_ids"] == [source_id]
+    assert summary["unchanged_sources"] == 1
+    assert summary["added_chunks"] == 0
+
+
+def test_replace_diffs_against_the_named_source(tmp_path, user_id, write_pdf):
+    original, edited = tmp_path / "v1", tmp_path / "v2"
+    original.mkdir()
+    edited.mkdir()
+    write_pdf(str(original / "notes.pdf"), NOTES_A)
+    write_pdf(str(edited / "notes.pdf"), [NOTES_A[0], NOTES_B[1]])
+    [source_id] = _load(str(original), user_id)["source_ids"]
+    before = source_registry.get_source(user_id, source_id)["chunk_count"]
+
+    summary = _load(str(edited), user_id, replace={"notes.pdf": source_id})
+
+    assert summary["source_ids"] == [source_id]
+    assert summary["kept_chunks"] > 0
+    assert summary["removed_chunks"] > 0
+    assert summary["kept_chunks"] + summary["removed_chunks"] == before
+    assert [s["source_id"] for s in source_registry.list_sources(user_id)] == [source_id]
+    texts = _chunks(user_id, source_id)
+    assert not any("Chlorophyll" in text for text in texts)
+    assert any("Momentum" in text for text in texts)
+
+
+def test_put_source_replaces_it_in_place(tmp_path, user_id, write_pdf):
+    from fastapi.testclient import TestClient
+
+    import app as server
+
+    write_pdf(str(tmp_path / "notes.pdf"), NOTES_A)
+    [source_id] = _load(str(tmp_path), user_id)["source_ids"]
+    write_pdf(str(tmp_path / "edited.pdf"), [NOTES_A[0], NOTES_B[1]])
+
+    # The in-memory Qdrant of offline mode is closed with the app
+    with TestClient(server.app) as client, open(tmp_path / "edited.pdf", "rb") as f:
+        response = client.put(
+            f"/sources/{source_id}", data={"user_id": user_id},
+            files={"file": ("edited.pdf", f, "application/pdf")},
+        )
+        texts = _chunks(user_id, source_id)
+
+    assert response.status_code == 200
+    assert response.json()["removed_chunks"] > 0
+    assert [s["source_id"] for s in source_registry.list_sources(user_id)] == [source_id]
+    assert any("Momentum" in text for text in texts)
@@ -0,0 +1,44 @@
+import asyncio
+
+from llm_services import bot
+from loaders.multiple_file import load_directory
+from tools import subtopic_index
+
+BIOLOGY = {"topics": [{"title": "Photosynthesis", "subtopics": ["Light reactions", "Calvin cycle"]}]}
+PHYSICS = {"topics": [{"title": "Mechanics", "subtopics": ["Newton's laws", "Momentum"]}]}
+PAGES = [
+    "Photosynthesis converts light energy into chemical energy stored in glucose. " * 20,
+    "The Calvin cycle fixes carbon dioxide into sugars using ATP and NADPH. " * 20,
+    "Newton's second law relates the net force on a body to its acceleration. " * 20,
+    "Momentum is conserved in every collision without external forces. " * 20,
+]
+
+
+def _ingest(tmp_path, user_id, write_pdf):
+    write_pdf(str(tmp_path / "notes.pdf"), PAGES)
+    asyncio.run(load_directory(str(tmp_path), [], user_id))
+
+
+def test_rebuilding_one_course_keeps_the_others(tmp_path, user_id, write_pdf):
+    _ingest(tmp_path, user_id, write_pdf)
+    subtopic_index.build(user_id, "biology", BIOLOGY)
+    subtopic_index.build(user_id, "physics", PHYSICS)
+    momentum, calvin = subtopic_index.outline_queries(PHYSICS)[1], subtopic_index.outline_queries(BIOLOGY)[1]
+
+    # A new version of the biology outline drops the Calvin cycle
+    subtopic_index.build(user_id, "biology", {"topics": [{"title": "Photosynthesis", "subtopics": ["Light reactions"]}]})
+    assert subtopic_index.lookup(user_id, momentum, 4) is not None
+    assert subtopic_index.lookup(user_id, calvin, 4) is None
+
+    subtopic_index.forget(user_id, "physics")
+    assert subtopic_index.lookup(user_id, momentum, 4) is None
+    assert subtopic_index.lookup(user_id, subtopic_index.outline_queries(BIOLOGY)[0], 4) is not None
+
+
+def test_fallback_search_matches_the_index(tmp_path, user_id, write_pdf):
+    _ingest(tmp_path, user_id, write_pdf)
+    [query, _] = subtopic_index.outline_queries(PHYSICS)
+    searched = bot._retrieve(query, user_id, 4)
+    subtopic_index.build(user_id, "physics", PHYSICS)
+    indexed = bot._retrieve(query, user_id, 4)
+    assert [d.page_content for d in indexed] == [d.page_content for d in searched]
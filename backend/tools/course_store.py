@@ -0,0 +1,252 @@
+"""
+Server-side course store: every outline version of a course and its sources.
+
+/upload_pdfs saves the outline it returns as version 1 of a new course and
+answers with the course ID. /update_outline then merges new sources into the
+stored latest version, instead of the outline the client sends back, and saves
+the result as the next version. Clients read a course, its version history and
+the diff between two versions by ID, and can save their own edits as a new
+version. Writes are checked against the version the change was based on, so a
+concurrent merge or edit fails with CourseVersionConflict instead of silently
+overwriting another one. Only the latest COURSE_MAX_VERSIONS versions of a
+course are kept.
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+from tools.local_db import get_connection, init_schema
+from tools.single_flight import normalize_text
+
+logger = logging.getLogger(__name__)
+
+COURSE_MAX_VERSIONS = int(os.getenv("COURSE_MAX_VERSIONS", "20"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    course_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    latest_version INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS courses_by_user ON courses (user_id, updated_at);
+CREATE TABLE IF NOT EXISTS course_versions (
+    course_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    outline TEXT NOT NULL,
+    source_ids TEXT NOT NULL,
+    change TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (course_id, version)
+);
+"""
+_schema_ready = False
+
+
+def _db():
+    global _schema_ready
+    if not _schema_ready:
+        init_schema(_SCHEMA)
+        _schema_ready = True
+    return get_connection()
+
+
+class CourseVersionConflict(Exception):
+    """The course moved past the version a change was based on."""
+
+    def __init__(self, course_id: str, expected: int, latest: int):
+        super().__init__(f"course {course_id} is at version {latest}, not {expected}")
+        self.course_id = course_id
+        self.expected = expected
+        self.latest = latest
+
+
+def _outline_dict(outline) -> Dict:
+    if hasattr(outline, "model_dump"):
+        outline = outline.model_dump()
+    return {"topics": list((outline or {}).get("topics") or [])}
+
+
+def _write_version(db, course_id: str, version: int, outline, source_ids: Iterable[str], change: str, now: float):
+    db.execute(
+        "INSERT INTO course_versions VALUES (?, ?, ?, ?, ?, ?)",
+        (course_id, version, json.dumps(_outline_dict(outline)), json.dumps(sorted(set(source_ids))), change, now),
+    )
+    db.execute(
+        "DELETE FROM course_versions WHERE course_id = ? AND version <= ?",
+        (course_id, version - COURSE_MAX_VERSIONS),
+    )
+
+
+def create_course(user_id: str, outline, source_ids: Iterable[str], change: str = "upload") -> Dict:
+    """Store `outline` as version 1 of a new course of the user's."""
+    course_id = uuid.uuid4().hex
+    now = time.time()
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute("INSERT INTO courses VALUES (?, ?, 1, ?, ?)", (course_id, user_id, now, now))
+        _write_version(db, course_id, 1, outline, source_ids, change, now)
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    logger.info("created course=%s user=%s", course_id, user_id)
+    return get_course(course_id, user_id)
+
+
+def add_version(course_id: str, user_id: str, outline, source_ids: Iterable[str], change: str, base_version: int) -> Dict:
+    """
+    Store `outline` as the next version of a course. Raises KeyError for an
+    unknown course and CourseVersionConflict when the latest version is no
+    longer `base_version`.
+    """
+    now = time.time()
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute(
+            "SELECT latest_version FROM courses WHERE course_id = ? AND user_id = ?", (course_id, user_id)
+        ).fetchone()
+        if row is None:
+            raise KeyError(course_id)
+        if row[0] != base_version:
+            raise CourseVersionConflict(course_id, base_version, row[0])
+        version = row[0] + 1
+        db.execute(
+            "UPDATE courses SET latest_version = ?, updated_at = ? WHERE course_id = ?", (version, now, course_id)
+        )
+        _write_version(db, course_id, version, outline, source_ids, change, now)
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    logger.info("course=%s version=%d change=%s user=%s", course_id, version, change, user_id)
+    return get_course(course_id, user_id, version)
+
+
+def get_course(course_id: str, user_id: str, version: Optional[int] = None) -> Optional[Dict]:
+    """One version of a user's course (the latest by default), or None if there is no such course or version."""
+    db = _db()
+    course = db.execute(
+        "SELECT latest_version FROM courses WHERE course_id = ? AND user_id = ?", (course_id, user_id)
+    ).fetchone()
+    if course is None:
+        return None
+    row = db.execute(
+        "SELECT version, outline, source_ids, change, created_at FROM course_versions "
+        "WHERE course_id = ? AND version = ?",
+        (course_id, course[0] if version is None else version),
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        "course_id": course_id,
+        "version": row[0],
+        "latest_version": course[0],
+        "outline": json.loads(row[1]),
+        "source_ids": json.loads(row[2]),
+        "change": row[3],
+        "created_at": row[4],
+    }
+
+
+def list_courses(user_id: str) -> List[Dict]:
+    rows = _db().execute(
+        "SELECT course_id, latest_version, created_at, updated_at FROM courses "
+        "WHERE user_id = ? ORDER BY updated_at DESC",
+        (user_id,),
+    ).fetchall()
+    keys = ("course_id", "latest_version", "created_at", "updated_at")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def list_versions(course_id: str, user_id: str) -> Optional[List[Dict]]:
+    """Kept versions of a user's course, oldest first, without their outlines (None for an unknown course)."""
+    db = _db()
+    if db.execute("SELECT 1 FROM courses WHERE course_id = ? AND user_id = ?", (course_id, user_id)).fetchone() is None:
+        return None
+    rows = db.execute(
+        "SELECT version, outline, source_ids, change, created_at FROM course_versions "
+        "WHERE course_id = ? ORDER BY version",
+        (course_id,),
+    ).fetchall()
+    return [
+        {
+            "version": version,
+            "change": change,
+            "created_at": created_at,
+            "topic_count": len(json.loads(outline)["topics"]),
+            "source_count": len(json.loads(source_ids)),
+        }
+        for version, outline, source_ids, change, created_at in rows
+    ]
+
+
+def delete_course(course_id: str, user_id: str) -> bool:
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        deleted = db.execute(
+            "DELETE FROM courses WHERE course_id = ? AND user_id = ?", (course_id, user_id)
+        ).rowcount
+        if deleted:
+            db.execute("DELETE FROM course_versions WHERE course_id = ?", (course_id,))
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    return bool(deleted)
+
+
+def diff_outlines(old: Dict, new: Dict) -> Dict:
+    """
+    Topic-level changes between two outlines. Topics are matched by title
+    (case and spacing ignored); a matched topic is listed as changed when its
+    summary, subtopics or position differ.
+    """
+    old_topics = {normalize_text(t.get("title", "")): (i, t) for i, t in enumerate(old.get("topics", []))}
+    new_topics = {normalize_text(t.get("title", "")): (i, t) for i, t in enumerate(new.get("topics", []))}
+    changed = []
+    for key, (position, topic) in new_topics.items():
+        if key not in old_topics:
+            continue
+        old_position, old_topic = old_topics[key]
+        old_subtopics, subtopics = old_topic.get("subtopics") or [], topic.get("subtopics") or []
+        entry = {"title": topic.get("title", "")}
+        added = [s for s in subtopics if s not in old_subtopics]
+        removed = [s for s in old_subtopics if s not in subtopics]
+        if added:
+            entry["added_subtopics"] = added
+        if removed:
+            entry["removed_subtopics"] = removed
+        if not added and not removed and subtopics != old_subtopics:
+            entry["reordered_subtopics"] = True
+        if (topic.get("summary") or "") != (old_topic.get("summary") or ""):
+            entry["summary"] = topic.get("summary")
+        if position != old_position:
+            entry["moved"] = {"from": old_position, "to": position}
+        if len(entry) > 1:
+            changed.append(entry)
+    return {
+        "added_topics": [t for key, (_, t) in new_topics.items() if key not in old_topics],
+        "removed_topics": [t.get("title", "") for key, (_, t) in old_topics.items() if key not in new_topics],
+        "changed_topics": changed,
+    }
+
+
+def diff_versions(old: Dict, new: Dict) -> Dict:
+    """Changes from one stored version of a course to another, sources included."""
+    old_sources, new_sources = set(old["source_ids"]), set(new["source_ids"])
+    return {
+        "course_id": new["course_id"],
+        "from_version": old["version"],
+        "to_version": new["version"],
+        **diff_outlines(old["outline"], new["outline"]),
+        "added_sources": sorted(new_sources - old_sources),
+        "removed_sources": sorted(old_sources - new_sources),
+    }
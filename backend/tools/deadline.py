@@ -0,0 +1,241 @@
+"""
+Request deadlines and cooperative cancellation.
+
+Each HTTP request gets a RequestBudget: an absolute deadline (per endpoint,
+REQUEST_DEADLINES) and a cancel flag that is set when the deadline passes or
+the client disconnects. The budget travels in a ContextVar, so it reaches
+the worker threads (asyncio.to_thread and the loaders copy the context) and
+the outline agent's model calls.
+
+When a budget is cancelled, the endpoint task is cancelled, which stops all
+async work (retrieval awaits, agent streams, ingest loops). Blocking work
+already running on a thread cannot be interrupted, so it is stopped at
+checkpoints instead. Every chat and embedding call waits for admission in
+tools/llm_scheduler.py, and that wait raises RequestCancelled rather than
+sending the call. Qdrant upserts check before they start. Calls skipped this
+way, and calls that finished after their request was gone, are counted in
+scaffold_cancelled_work. Those counts are the provider capacity saved and
+wasted.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from tools.metrics import CANCELLED_REQUESTS, CANCELLED_TOKENS, CANCELLED_WORK, current_endpoint
+
+logger = logging.getLogger(__name__)
+
+DISCONNECT = "disconnect"
+DEADLINE = "deadline"
+
+# Seconds per route template; routes not listed have no deadline
+DEFAULT_DEADLINES: Dict[str, float] = {
+    "/tutor": 120,
+    "/quizes": 120,
+    "/quizes/batch": 900,
+    "/chatbot": 60,
+    "/upload_pdfs": 1800,
+    "/update_outline": 1800,
+    "/sources/{source_id}": 900,
+}
+
+
+def load_deadlines() -> Dict[str, float]:
+    """DEFAULT_DEADLINES overridden by REQUEST_DEADLINES (JSON, e.g. '{"/tutor": 60}'; 0 disables one)."""
+    deadlines = dict(DEFAULT_DEADLINES)
+    raw = os.getenv("REQUEST_DEADLINES")
+    if raw:
+        overrides = json.loads(raw)
+        if not isinstance(overrides, dict):
+            raise ValueError("REQUEST_DEADLINES must be a JSON object of route -> seconds")
+        deadlines.update({route: float(seconds) for route, seconds in overrides.items()})
+    return {route: seconds for route, seconds in deadlines.items() if seconds > 0}
+
+
+class RequestCancelled(Exception):
+    """The request this work belongs to hit its deadline or lost its client."""
+
+    def __init__(self, reason: str, stage: str):
+        super().__init__(f"request cancelled ({reason}) before {stage}")
+        self.reason = reason
+        self.stage = stage
+
+
+class RequestBudget:
+    """
+    Deadline and cancel flag of one request, shared by all of its tasks and
+    threads. A budget with a `parent` is cancelled along with it and can also
+    be cancelled alone (one attempt of a hedged model call).
+    """
+
+    def __init__(self, seconds: Optional[float] = None, parent: Optional["RequestBudget"] = None):
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.reason: Optional[str] = None
+        self.parent = parent
+        self._cancelled = threading.Event()
+        if parent is not None and parent.deadline is not None:
+            self.deadline = parent.deadline if self.deadline is None else min(self.deadline, parent.deadline)
+
+    def cancel(self, reason: str) -> bool:
+        """Mark the budget cancelled; returns False if it already was."""
+        if self._cancelled.is_set():
+            return False
+        self.reason = reason
+        self._cancelled.set()
+        return True
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._cancelled.is_set():
+            if self.parent is not None and self.parent.cancelled:
+                self.cancel(self.parent.reason)
+            elif self.deadline is not None and time.monotonic() >= self.deadline:
+                self.cancel(DEADLINE)
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+
+request_budget: ContextVar[Optional[RequestBudget]] = ContextVar("request_budget", default=None)
+
+
+def check(work: str) -> None:
+    """Checkpoint before starting a unit of work: raises RequestCancelled (and counts it as skipped) if the request is gone."""
+    budget = request_budget.get()
+    if budget is not None and budget.cancelled:
+        CANCELLED_WORK.labels(current_endpoint.get(), work, "skipped").inc()
+        raise RequestCancelled(budget.reason, work)
+
+
+def record_discarded(work: str) -> bool:
+    """Count a unit of work that finished after its request was cancelled; returns whether it was."""
+    budget = request_budget.get()
+    if budget is None or not budget.cancelled:
+        return False
+    CANCELLED_WORK.labels(current_endpoint.get(), work, "discarded").inc()
+    return True
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline (None without one)."""
+    budget = request_budget.get()
+    return None if budget is None else budget.remaining()
+
+
+class CancelledWorkCallback(BaseCallbackHandler):
+    """Counts model calls that completed after their request was cancelled (results thrown away)."""
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        if not record_discarded("chat"):
+            return
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                CANCELLED_TOKENS.labels(current_endpoint.get()).inc(usage.get("total_tokens", 0))
+
+
+class RequestDeadlineMiddleware:
+    """
+    ASGI middleware that gives each request a RequestBudget and cancels the
+    request when its deadline passes (answering 504 if nothing was sent yet) or
+    when the client disconnects.
+
+    Disconnects are only visible through `receive`, so one pump task reads it
+    for the whole request and hands body messages to the app through a queue
+    of one (uploads keep their backpressure). After the body, the pump waits
+    for http.disconnect.
+    """
+
+    def __init__(self, app, deadlines: Dict[str, float], label: Callable[[dict], str]):
+        self.app = app
+        self.deadlines = deadlines
+        self.label = label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        endpoint = self.label(scope)
+        budget = RequestBudget(self.deadlines.get(endpoint))
+        token = request_budget.set(budget)
+        messages: asyncio.Queue = asyncio.Queue(maxsize=1)
+        disconnected = asyncio.Event()
+        app_task = asyncio.current_task()
+        state = {"finished": False, "started": False, "replaced": False, "complete": False}
+
+        def cancel(reason: str):
+            # Once the response is out, servers report the finished exchange as a disconnect
+            if state["finished"] or state["complete"]:
+                return
+            budget.cancel(reason)
+            logger.info("cancelling request endpoint=%s reason=%s", endpoint, budget.reason)
+            app_task.cancel()
+
+        async def pump():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    cancel(DISCONNECT)
+                    return
+                await messages.put(message)
+
+        async def wrapped_receive():
+            if disconnected.is_set() and messages.empty():
+                return {"type": "http.disconnect"}
+            getter = asyncio.ensure_future(messages.get())
+            waiter = asyncio.ensure_future(disconnected.wait())
+            try:
+                await asyncio.wait({getter, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+                if not getter.done():
+                    getter.cancel()
+            return getter.result() if getter.done() and not getter.cancelled() else {"type": "http.disconnect"}
+
+        async def send_deadline_exceeded():
+            state["started"] = state["replaced"] = True
+            await send({"type": "http.response.start", "status": 504,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": b'{"detail": "Request deadline exceeded."}'})
+
+        async def wrapped_send(message):
+            if budget.reason == DISCONNECT or state["replaced"]:
+                return
+            if message["type"] == "http.response.start":
+                # An endpoint that turned RequestCancelled into an error response still answers 504
+                if budget.cancelled and budget.reason == DEADLINE:
+                    return await send_deadline_exceeded()
+                state["started"] = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["complete"] = True
+            await send(message)
+
+        pump_task = asyncio.create_task(pump())
+        timer = None
+        if budget.deadline is not None:
+            timer = asyncio.get_running_loop().call_later(budget.remaining(), cancel, DEADLINE)
+        try:
+            await self.app(scope, wrapped_receive, wrapped_send)
+        except (asyncio.CancelledError, RequestCancelled):
+            if budget.reason is None:
+                raise
+            # Our own cancellation: the work is stopped; answer if the client is still there
+            if asyncio.current_task().cancelling():
+                asyncio.current_task().uncancel()
+            if budget.reason == DEADLINE and not state["started"]:
+                await send_deadline_exceeded()
+        finally:
+            state["finished"] = True
+            if timer is not None:
+                timer.cancel()
+            pump_task.cancel()
+            if budget.reason is not None:
+                CANCELLED_REQUESTS.labels(endpoint, budget.reason).inc()
+            request_budget.reset(token)
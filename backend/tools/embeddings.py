@@ -1,3 +1,34 @@
+import os
+
+from langchain_core.embeddings import Embeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from tools.llm_scheduler import ScheduledEmbeddings, embedding_scheduler
+from tools.offline import OFFLINE, HashingEmbeddings
+
+# "offline-hashing-<size>" names the local hashing stand-in with that many dimensions
+OFFLINE_MODEL_PREFIX = "offline-hashing-"
+
+# Recorded with every ingested source: vectors from a different model are never reused.
+# Changing it needs a re-embedding migration (scripts/migrate_embeddings.py).
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL") or (
+    f"{OFFLINE_MODEL_PREFIX}768" if OFFLINE else "models/text-embedding-004"
+)
+
+
+def embedding_size(model: str) -> int:
+    """Vector size of a model (EMBEDDING_SIZE for provider models, default 768 for text-embedding-004)."""
+    if model.startswith(OFFLINE_MODEL_PREFIX):
+        return int(model[len(OFFLINE_MODEL_PREFIX):])
+    return int(os.getenv("EMBEDDING_SIZE", "768"))
+
+
+def create_embeddings(model: str) -> Embeddings:
+    """Scheduler-admitted embeddings client for a model name."""
+    if model.startswith(OFFLINE_MODEL_PREFIX):
+        inner = HashingEmbeddings(size=embedding_size(model))
+    else:
+        inner = GoogleGenerativeAIEmbeddings(model=model)
+    return ScheduledEmbeddings(inner, embedding_scheduler)
+
 
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
+embeddings = create_embeddings(EMBEDDING_MODEL)
@@ -0,0 +1,156 @@
+"""
+Local extractive reduction of a source's text before the outline map phase.
+
+Sentences are scored by TF-IDF degree centrality, the first step of TextRank:
+with L2-normalized sentence vectors, a sentence's summed cosine similarity to
+a group of sentences is its dot product with the group's summed vector. Every
+score is therefore O(non-zeros) NumPy work, with no sentence-by-sentence
+similarity matrix. Each sentence gets two scores, one against its own
+section and one against the whole source. Sentences dense with digits and
+symbols (worked examples, exercises, tables) are down-weighted. Every section
+heading is kept, each section keeps its best sentences within its share of
+the token budget, and the text is emitted in document order.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from tools.tokens import estimate_tokens
+
+_CHUNK_HEADER = re.compile(r"^\[(?:Page|Pages) [^\]]*\]\n(?:\[Section: [^\]]*\]\n)?")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])|\n{2,}")
+_WORD = re.compile(r"[a-z][a-z\-]{2,}")
+_STOPWORDS = frozenset(
+    "the and for are but not you all any can had her was one our out has his how its may new now see two who did "
+    "get let put say she too use with this that from they will have been were what when which their there then "
+    "than them these those into also such each more most other some only over very just where while would could "
+    "should about after before being between both does doing during through under until upon"
+    .split()
+)
+# Share of a sentence's characters that are digits or math/table symbols above which it reads as worked material
+_SYMBOL_SHARE = 0.25
+_SYMBOL_PENALTY = 0.3
+# Weight of the section-level score against the source-level score
+SECTION_WEIGHT = 0.6
+# Sentences shorter than this many characters carry too little to score
+MIN_SENTENCE_CHARS = 25
+
+
+def chunk_body(text: str) -> str:
+    """A chunk's text without the page/section header the loader puts in front of it."""
+    return _CHUNK_HEADER.sub("", text)
+
+
+def _sections(chunks: Iterable[Document]) -> Tuple[List[str], List[List[str]]]:
+    """Headings and de-duplicated sentences per section, in document order."""
+    headings: List[str] = []
+    sentences: List[List[str]] = []
+    seen = set()
+    current = None
+    for chunk in chunks:
+        metadata = chunk.metadata or {}
+        # Chunks without a section path are grouped by 5-page window, without a heading
+        key = metadata.get("section") or f"\x00{int(metadata.get('page') or 0) // 5}"
+        if key != current:
+            current = key
+            headings.append("" if key.startswith("\x00") else key)
+            sentences.append([])
+        text = chunk_body(chunk.page_content)
+        for sentence in _SENTENCE_END.split(text):
+            sentence = " ".join(sentence.split())
+            # Chunk overlap repeats sentences; keep the first copy
+            if len(sentence) >= MIN_SENTENCE_CHARS and sentence not in seen:
+                seen.add(sentence)
+                sentences[-1].append(sentence)
+    return headings, sentences
+
+
+def sentence_scores(sentences: List[str], section_of: np.ndarray) -> np.ndarray:
+    """TF-IDF degree centrality of each sentence within its section and within the whole source."""
+    vocabulary: Dict[str, int] = {}
+    rows, cols = [], []
+    for i, sentence in enumerate(sentences):
+        for word in _WORD.findall(sentence.lower()):
+            if word not in _STOPWORDS:
+                rows.append(i)
+                cols.append(vocabulary.setdefault(word, len(vocabulary)))
+    n = len(sentences)
+    scores = np.zeros(n)
+    if not rows:
+        return scores
+    vocab_size = len(vocabulary)
+    # (sentence, term) pairs with their counts
+    pairs, counts = np.unique(np.asarray(rows, dtype=np.int64) * vocab_size + np.asarray(cols, dtype=np.int64),
+                              return_counts=True)
+    rows, cols = pairs // vocab_size, pairs % vocab_size
+    idf = np.log(n / np.bincount(cols, minlength=vocab_size)) + 1.0
+    weights = (1.0 + np.log(counts)) * idf[cols]
+    weights /= np.sqrt(np.bincount(rows, weights * weights, minlength=n))[rows]
+
+    # Source level: similarity to every other sentence = v_i . (sum of all v) - v_i . v_i
+    totals = np.bincount(cols, weights, minlength=vocab_size)
+    global_score = (np.bincount(rows, weights * totals[cols], minlength=n) - 1.0) / max(1, n - 1)
+
+    # Section level: the same against the section's summed vector
+    sections = section_of[rows]
+    keys, inverse = np.unique(sections * vocab_size + cols, return_inverse=True)
+    section_totals = np.bincount(inverse, weights, minlength=len(keys))
+    sizes = np.bincount(section_of, minlength=section_of.max() + 1)[section_of]
+    local_score = (np.bincount(rows, weights * section_totals[inverse], minlength=n) - 1.0) / np.maximum(1, sizes - 1)
+
+    scores = SECTION_WEIGHT * local_score + (1 - SECTION_WEIGHT) * global_score
+    symbols = np.array([sum(not c.isalpha() and not c.isspace() for c in s) / len(s) for s in sentences])
+    scores[symbols > _SYMBOL_SHARE] *= _SYMBOL_PENALTY
+    return scores
+
+
+def reduce_source(chunks: Iterable[Document], token_budget: int, stats: Optional[Dict] = None) -> str:
+    """
+    Shrink one source's chunks to about `token_budget` tokens of headings and
+    central sentences. A source already within the budget is returned whole.
+    """
+    headings, sections = _sections(chunks)
+    sentences = [s for section in sections for s in section]
+    full_tokens = sum(estimate_tokens(s) for s in sentences) + sum(estimate_tokens(h) for h in headings)
+    if stats is not None:
+        stats["input_tokens"] = stats.get("input_tokens", 0) + full_tokens
+    if full_tokens <= token_budget:
+        kept = [set(range(len(section))) for section in sections]
+    else:
+        section_of = np.repeat(np.arange(len(sections)), [len(section) for section in sections])
+        scores = sentence_scores(sentences, section_of) if sentences else np.zeros(0)
+        tokens = np.array([estimate_tokens(s) for s in sentences], dtype=float)
+        # Headings first; the rest is shared by section length (square root, so long
+        # sections of worked examples don't crowd out short conceptual ones)
+        remaining = max(0, token_budget - sum(estimate_tokens(h) for h in headings))
+        section_tokens = np.bincount(section_of, tokens, minlength=len(sections)) if sentences else np.zeros(len(sections))
+        shares = np.sqrt(section_tokens)
+        quotas = remaining * shares / shares.sum() if shares.sum() else shares
+        kept, start = [], 0
+        for s, section in enumerate(sections):
+            end = start + len(section)
+            order = np.argsort(-scores[start:end], kind="stable")
+            chosen, used = set(), 0.0
+            for i in order:
+                # Always keep each section's best sentence so no heading stands alone
+                if chosen and used + tokens[start + i] > quotas[s]:
+                    continue
+                chosen.add(int(i))
+                used += tokens[start + i]
+            kept.append(chosen)
+            start = end
+
+    parts = []
+    for heading, section, chosen in zip(headings, sections, kept):
+        if heading:
+            parts.append(f"\n## {heading}\n")
+        text = " ".join(s for i, s in enumerate(section) if i in chosen)
+        if text:
+            parts.append(text + "\n")
+    reduced = "".join(parts)
+    if stats is not None:
+        stats["output_tokens"] = stats.get("output_tokens", 0) + estimate_tokens(reduced)
+    return reduced
+
@@ -0,0 +1,131 @@
+"""
+Hedged model calls for tail latency.
+
+Most lesson and quiz calls return in a few seconds, but a few take many times
+longer, and the user waits for the slowest one. A route with a `hedge`
+percentile (tools/model.py) therefore sends a backup request when its call has
+not returned after that percentile of the route's recent latencies. The first
+valid answer wins and the other attempt is cancelled. Each attempt runs on its
+own thread under a child RequestBudget (tools/deadline.py), so a loser that is
+still waiting for admission is never sent. A call already sent cannot be
+interrupted; its answer is discarded and counted in scaffold_cancelled_work.
+
+The backup is the same call again unless the caller passes a different one
+(the vision lesson races a text-only lesson). A caller's own backup also
+starts at once when the primary fails, instead of after it. Latency backups
+are only sent for interactive calls, and not while calls are queued for quota,
+where the backup would only wait behind them.
+"""
+import contextvars
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Optional, TypeVar
+
+from tools.deadline import RequestBudget, RequestCancelled, request_budget
+from tools.llm_scheduler import INTERACTIVE, chat_scheduler, llm_priority
+from tools.model import ROUTES, route_metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Cancel reason of the attempt that lost the race
+HEDGE_LOST = "hedge_lost"
+QUEUE_RECHECK_SECONDS = 0.25
+
+
+def hedge_delay(route: str) -> Optional[float]:
+    """Seconds after which a call on `route` gets a backup (None: no latency hedge)."""
+    share = ROUTES[route].hedge
+    if share is None or llm_priority.get() != INTERACTIVE:
+        return None
+    return route_metrics.latency_percentile(route, share)
+
+
+def _start(fn: Callable[[], T], name: str):
+    """Run `fn` on its own thread under a child budget of the current request."""
+    future: Future = Future()
+    budget = RequestBudget(parent=request_budget.get())
+    context = contextvars.copy_context()
+    context.run(request_budget.set, budget)
+
+    def run():
+        try:
+            future.set_result(context.run(fn))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=f"hedge-{name}", daemon=True).start()
+    return future, budget
+
+
+def hedged_call(
+    route: str,
+    primary: Callable[[], T],
+    backup: Optional[Callable[[], T]] = None,
+    is_valid: Callable[[T], bool] = lambda result: result is not None,
+) -> T:
+    """
+    `primary()`, raced against `backup()` (default: `primary` again) once it is
+    slower than the route's hedge percentile. Returns the first result
+    `is_valid` accepts. Without one, returns the last result, or raises the
+    primary's error if no attempt returned.
+    """
+    delay = hedge_delay(route)
+    if backup is None and delay is None:
+        return primary()
+    fallback = backup is not None
+    backup = backup or primary
+
+    future, budget = _start(primary, "primary")
+    attempts = {future: ("primary", budget)}
+    pending = {future}
+    result, error = None, None
+    timeout = delay
+
+    def send_backup(why: str):
+        logger.info("route=%s sending backup call (%s)", route, why)
+        backup_future, backup_budget = _start(backup, "backup")
+        attempts[backup_future] = ("backup", backup_budget)
+        pending.add(backup_future)
+
+    while pending:
+        waiting_for_hedge = len(attempts) == 1 and delay is not None
+        done, pending = wait(pending, timeout=timeout if waiting_for_hedge else None, return_when=FIRST_COMPLETED)
+        if not done:
+            # The primary is late; a backup behind a quota queue would not be any faster, so look again shortly
+            if chat_scheduler.stats["waiting"]:
+                timeout = min(delay, QUEUE_RECHECK_SECONDS)
+            else:
+                send_backup(f"no answer after {delay:.1f}s")
+            continue
+        for finished in done:
+            name, _ = attempts[finished]
+            try:
+                value = finished.result()
+            except RequestCancelled:
+                parent = request_budget.get()
+                if parent is not None and parent.cancelled:
+                    raise
+                continue
+            except Exception as e:
+                logger.warning("route=%s %s call failed: %s", route, name, e)
+                error = error if name == "backup" and error is not None else e
+                value = None
+            else:
+                if is_valid(value):
+                    for other, (_, other_budget) in attempts.items():
+                        if other is not finished:
+                            other_budget.cancel(HEDGE_LOST)
+                    if len(attempts) > 1:
+                        route_metrics.record_hedge(route, name)
+                    return value
+                result = value
+            if name == "primary" and fallback and len(attempts) == 1:
+                send_backup("primary failed")
+    if len(attempts) > 1:
+        route_metrics.record_hedge(route, "none")
+    if result is None and error is not None:
+        raise error
+    return result
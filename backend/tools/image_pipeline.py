@@ -0,0 +1,225 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# Images smaller than this on either side are treated as decorative (bullets, logos, rules)
+MIN_IMAGE_SIDE = int(os.getenv("IMAGE_MIN_SIDE", "64"))
+# Longest side after downscaling, and the JPEG quality used to re-encode
+MAX_IMAGE_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "75"))
+# Total bytes of image data sent with one request, and the max number of images
+IMAGE_BUDGET_BYTES = int(os.getenv("IMAGE_BUDGET_BYTES", str(800 * 1024)))
+MAX_IMAGES = int(os.getenv("IMAGE_MAX_COUNT", "5"))
+CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "512"))
+# Images whose pixel hashes differ in at most this many of their 64 bits are one image
+DUPLICATE_DISTANCE = int(os.getenv("IMAGE_DUPLICATE_DISTANCE", "6"))
+
+_DATA_URL = re.compile(r"^data:(image/[^;]+);base64,(.+)$", re.DOTALL)
+_INLINE_DATA_URL = re.compile(r"(data:image/[^;]+;base64,[A-Za-z0-9+/=]+)")
+
+
+class ProcessedImage:
+    """A downscaled, re-encoded image ready to send to the vision model."""
+
+    __slots__ = (
+        "image_hash", "pixel_hash", "data_url", "original_bytes", "sent_bytes", "processing_seconds", "decorative"
+    )
+
+    def __init__(self, image_hash, data_url, original_bytes, sent_bytes, processing_seconds, decorative, pixel_hash=None):
+        self.image_hash = image_hash
+        self.pixel_hash = pixel_hash
+        self.data_url = data_url
+        self.original_bytes = original_bytes
+        self.sent_bytes = sent_bytes
+        self.processing_seconds = processing_seconds
+        self.decorative = decorative
+
+
+# Processed variants keyed by the hash of the original (base64) image data
+_cache: "OrderedDict[str, ProcessedImage]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Running totals across requests
+pipeline_stats = {
+    "requests": 0,
+    "candidates": 0,
+    "sent_images": 0,
+    "original_bytes": 0,
+    "sent_bytes": 0,
+    "cache_hits": 0,
+    "saved_processing_seconds": 0.0,
+}
+
+
+def _candidate_images(retrieved_docs) -> List[str]:
+    """Image data URLs ranked by the retrieval rank of the chunks they came from.
+
+    Images shared by several retrieved chunks rank higher; order within a chunk
+    (page reading order) breaks ties.
+    """
+    scores: Dict[str, float] = {}
+    first_seen: Dict[str, int] = {}
+    for rank, d in enumerate(retrieved_docs or []):
+        metadata = getattr(d, "metadata", None) or {}
+        images_val = metadata.get("images")
+        if isinstance(images_val, str):
+            try:
+                images_val = json.loads(images_val)
+            except json.JSONDecodeError:
+                images_val = []
+        urls = list(images_val or []) or _INLINE_DATA_URL.findall(getattr(d, "page_content", "") or "")
+        for url in urls:
+            if not isinstance(url, str) or not url.startswith("data:"):
+                continue
+            scores[url] = scores.get(url, 0.0) + 1.0 / (rank + 1)
+            first_seen.setdefault(url, len(first_seen))
+    return sorted(scores, key=lambda u: (-scores[u], first_seen[u]))
+
+
+def _pixel_hash(pix) -> int:
+    """
+    Difference hash of an RGB pixmap: one bit per pixel of a 9x8 grayscale
+    thumbnail, set when it is brighter than its right neighbour. The same
+    picture stored twice (another encoding, size or quality) hashes to the
+    same or a nearby value.
+    """
+    thumb = fitz.Pixmap(fitz.Pixmap(fitz.csGRAY, pix), 9, 8, None)
+    samples, stride = thumb.samples, thumb.stride
+    bits = 0
+    for y in range(8):
+        row = samples[y * stride:y * stride + 9]
+        for x in range(8):
+            bits = (bits << 1) | (row[x] > row[x + 1])
+    return bits
+
+
+def _is_duplicate(image: ProcessedImage, kept: List[ProcessedImage]) -> bool:
+    for other in kept:
+        if image.pixel_hash is None or other.pixel_hash is None:
+            if image.image_hash == other.image_hash:
+                return True
+        elif bin(image.pixel_hash ^ other.pixel_hash).count("1") <= DUPLICATE_DISTANCE:
+            return True
+    return False
+
+
+def _process(image_hash: str, raw: bytes, mime: str) -> ProcessedImage:
+    start = time.perf_counter()
+    try:
+        pix = fitz.Pixmap(raw)
+    except Exception:
+        # Not decodable by MuPDF: send as-is rather than lose it
+        data_url = f"data:{mime};base64,{base64.b64encode(raw).decode('utf-8')}"
+        return ProcessedImage(image_hash, data_url, len(raw), len(raw), time.perf_counter() - start, False)
+    if min(pix.width, pix.height) < MIN_IMAGE_SIDE:
+        return ProcessedImage(image_hash, None, len(raw), 0, time.perf_counter() - start, True)
+    if pix.alpha:
+        pix = fitz.Pixmap(pix, 0)
+    if pix.n > 3:
+        pix = fitz.Pixmap(fitz.csRGB, pix)
+    pixel_hash = _pixel_hash(pix)
+    shrink = 0
+    while max(pix.width, pix.height) >> shrink > MAX_IMAGE_SIDE:
+        shrink += 1
+    if shrink:
+        pix.shrink(shrink)
+    encoded = pix.tobytes("jpeg", jpg_quality=JPEG_QUALITY)
+    # Keep the original when re-encoding would not make it smaller
+    if len(encoded) >= len(raw) and not shrink:
+        encoded = raw
+    else:
+        mime = "image/jpeg"
+    data_url = f"data:{mime};base64,{base64.b64encode(encoded).decode('utf-8')}"
+    return ProcessedImage(image_hash, data_url, len(raw), len(encoded), time.perf_counter() - start, False, pixel_hash)
+
+
+def process_image(data_url: str) -> Tuple[ProcessedImage, bool]:
+    """Return the processed variant of a data URL and whether it came from the cache."""
+    match = _DATA_URL.match(data_url)
+    if not match:
+        return None, False
+    mime, b64 = match.groups()
+    # Hash the encoded form so cache hits skip base64 decoding entirely
+    image_hash = hashlib.sha256(b64.encode("ascii")).hexdigest()
+    with _cache_lock:
+        cached = _cache.get(image_hash)
+        if cached is not None:
+            _cache.move_to_end(image_hash)
+            return cached, True
+    processed = _process(image_hash, base64.b64decode(b64), mime)
+    with _cache_lock:
+        _cache[image_hash] = processed
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return processed, False
+
+
+def select_images(retrieved_docs, max_images: int = MAX_IMAGES, budget_bytes: int = IMAGE_BUDGET_BYTES) -> Tuple[List[str], Dict]:
+    """
+    Rank, filter, downscale and budget the images attached to retrieved chunks.
+    Returns (data_urls, report) where report has the per-request byte and cache numbers.
+    """
+    report = {
+        "candidates": 0,
+        "dropped_decorative": 0,
+        "dropped_duplicate": 0,
+        "dropped_budget": 0,
+        "original_bytes": 0,
+        "sent_bytes": 0,
+        "cache_hits": 0,
+        "processing_seconds": 0.0,
+        "saved_processing_seconds": 0.0,
+    }
+    selected: List[str] = []
+    # URLs are already unique; the same picture under other bytes is caught by its pixels
+    kept: List[ProcessedImage] = []
+    for url in _candidate_images(retrieved_docs):
+        report["candidates"] += 1
+        if len(selected) >= max_images:
+            report["dropped_budget"] += 1
+            continue
+        try:
+            processed, hit = process_image(url)
+        except Exception as e:
+            logger.warning("Image processing error: %s", e)
+            continue
+        if processed is None:
+            continue
+        if hit:
+            report["cache_hits"] += 1
+            report["saved_processing_seconds"] += processed.processing_seconds
+        else:
+            report["processing_seconds"] += processed.processing_seconds
+        if processed.decorative:
+            report["dropped_decorative"] += 1
+            continue
+        if _is_duplicate(processed, kept):
+            report["dropped_duplicate"] += 1
+            continue
+        if report["sent_bytes"] + processed.sent_bytes > budget_bytes:
+            report["dropped_budget"] += 1
+            continue
+        kept.append(processed)
+        selected.append(processed.data_url)
+        report["original_bytes"] += processed.original_bytes
+        report["sent_bytes"] += processed.sent_bytes
+
+    pipeline_stats["requests"] += 1
+    pipeline_stats["candidates"] += report["candidates"]
+    pipeline_stats["sent_images"] += len(selected)
+    pipeline_stats["original_bytes"] += report["original_bytes"]
+    pipeline_stats["sent_bytes"] += report["sent_bytes"]
+    pipeline_stats["cache_hits"] += report["cache_hits"]
+    pipeline_stats["saved_processing_seconds"] += report["saved_processing_seconds"]
+    return selected, report
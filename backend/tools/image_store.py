@@ -0,0 +1,126 @@
+"""
+Content-addressed store for the images shown in lessons.
+
+/tutor responses refer to images by ID instead of inlining their data URLs in
+every lesson phase; the browser loads each image once from GET /images/{id}
+and, since an ID is the hash of the image bytes, can cache it forever.
+
+The store is a cache, bounded by IMAGE_STORE_MAX_MB and IMAGE_STORE_TTL_DAYS:
+each image records when it was last stored or served, and adding an image
+evicts the least recently used ones beyond the cap and those unused for
+longer than the TTL. A lesson generated again stores its images again.
+"""
+import base64
+import hashlib
+import os
+import re
+import time
+from typing import Optional, Tuple
+
+from tools.local_db import get_connection, init_schema
+
+IMAGE_STORE_MAX_BYTES = int(float(os.getenv("IMAGE_STORE_MAX_MB", "512")) * 1024 * 1024)
+IMAGE_STORE_TTL_SECONDS = float(os.getenv("IMAGE_STORE_TTL_DAYS", "30")) * 86400
+# Serving an image refreshes its last use at most this often, so cached reads don't all write
+_TOUCH_INTERVAL_SECONDS = 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lesson_images (
+    image_id TEXT PRIMARY KEY,
+    mime TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lesson_images_last_used ON lesson_images (last_used);
+-- Images stored before the cap move over; the old table is dropped
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS images (
+    image_id TEXT PRIMARY KEY,
+    mime TEXT NOT NULL,
+    data BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+INSERT OR IGNORE INTO lesson_images
+    SELECT image_id, mime, length(data), created_at, created_at, data FROM images;
+DROP TABLE images;
+COMMIT;
+"""
+_schema_ready = False
+
+_DATA_URL = re.compile(r"^data:(image/[^;]+);base64,(.+)$", re.DOTALL)
+
+
+def _db():
+    global _schema_ready
+    if not _schema_ready:
+        init_schema(_SCHEMA)
+        _schema_ready = True
+    return get_connection()
+
+
+def image_url(image_id: str) -> str:
+    return f"/images/{image_id}"
+
+
+def _touch(db, image_id: str, now: float):
+    db.execute(
+        "UPDATE lesson_images SET last_used = ? WHERE image_id = ? AND last_used < ?",
+        (now, image_id, now - _TOUCH_INTERVAL_SECONDS),
+    )
+
+
+def _evict(db, now: float, keep: str) -> int:
+    """Drop images unused for longer than the TTL, then the least recently used beyond the size cap."""
+    evicted = db.execute("DELETE FROM lesson_images WHERE last_used < ?", (now - IMAGE_STORE_TTL_SECONDS,)).rowcount
+    excess = db.execute("SELECT COALESCE(SUM(size), 0) FROM lesson_images").fetchone()[0] - IMAGE_STORE_MAX_BYTES
+    if excess <= 0:
+        return evicted
+    doomed = []
+    # The image just stored stays even when it alone exceeds the cap: its ID is about to be served
+    rows = db.execute("SELECT image_id, size FROM lesson_images WHERE image_id != ? ORDER BY last_used", (keep,))
+    for image_id, size in rows:
+        if excess <= 0:
+            break
+        doomed.append((image_id,))
+        excess -= size
+    db.executemany("DELETE FROM lesson_images WHERE image_id = ?", doomed)
+    return evicted + len(doomed)
+
+
+def store_data_url(data_url: str) -> Optional[str]:
+    """Store a base64 data URL's image and return its ID (None if it is not a data URL)."""
+    match = _DATA_URL.match(data_url)
+    if not match:
+        return None
+    mime, b64 = match.groups()
+    data = base64.b64decode(b64)
+    image_id = hashlib.sha256(data).hexdigest()[:32]
+    now = time.time()
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        added = db.execute(
+            "INSERT OR IGNORE INTO lesson_images VALUES (?, ?, ?, ?, ?, ?)",
+            (image_id, mime, len(data), now, now, data),
+        ).rowcount
+        if added:
+            _evict(db, now, image_id)
+        else:
+            _touch(db, image_id, now)
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+    return image_id
+
+
+def get_image(image_id: str) -> Optional[Tuple[str, bytes]]:
+    """(mime type, bytes) of a stored image, or None."""
+    db = _db()
+    row = db.execute("SELECT mime, data FROM lesson_images WHERE image_id = ?", (image_id,)).fetchone()
+    if row is None:
+        return None
+    _touch(db, image_id, time.time())
+    return row[0], bytes(row[1])
@@ -0,0 +1,160 @@
+import json
+import logging
+import re
+from typing import Any, Optional, Type
+from pydantic import BaseModel, ValidationError
+
+logger = logging.getLogger(__name__)
+
+# Every escape sequence, consumed pairwise so "\\\\" is never split
+_ESCAPE = re.compile(r'\\(.)', re.DOTALL)
+_TRAILING_COMMA = re.compile(r',\s*([\]}])')
+_LETTERS = re.compile(r'[A-Za-z]*')
+_UNICODE_ESCAPE = re.compile(r'[0-9A-Fa-f]{4}')
+
+# LaTeX commands whose backslash also starts a valid JSON escape (\b \f \n \r \t);
+# anything else after one of those letters ("\nThe", "\tx") is a real escape
+_LATEX_COMMANDS = frozenset("""
+    backslash bar because begin beta big Big bigcap bigcup bigg Bigg bigl bigr binom bmatrix bmod bold boldsymbol bot
+    boxed bullet
+    fbox flat forall frac frown
+    nabla natural ne nearrow neg neq newline nexists ngeq ni nleq not notin nparallel nsubseteq nu nwarrow
+    rangle rbrace rceil rfloor rho right rightarrow rightharpoonup rightleftharpoons rm rVert rvert
+    tan tanh tau text textbf textit textrm textsf texttt tfrac therefore theta tilde times to top triangle triangleq
+""".split())
+
+
+def _fix_escape(match: re.Match) -> str:
+    ch = match.group(1)
+    if ch in '\\/"':
+        return match.group(0)
+    if ch == "u":
+        # "\u00e9" is an escape; "\underline", "\uparrow" are LaTeX
+        if _UNICODE_ESCAPE.match(match.string, match.end()):
+            return match.group(0)
+    elif ch in "bfnrt":
+        if ch + _LETTERS.match(match.string, match.end()).group(0) not in _LATEX_COMMANDS:
+            return match.group(0)
+    return "\\\\" + ch
+
+
+def fix_escapes(text: str) -> str:
+    """Double backslashes that start LaTeX commands or are not valid JSON escapes."""
+    return _ESCAPE.sub(_fix_escape, text)
+
+
+def extract_json_text(text: str) -> str:
+    """Strip markdown fences and surrounding prose, returning the JSON body."""
+    clean = text.replace("```json", "").replace("```", "").strip()
+    starts = [i for i in (clean.find("{"), clean.find("[")) if i != -1]
+    if not starts:
+        return clean
+    clean = clean[min(starts):]
+    end = max(clean.rfind("}"), clean.rfind("]"))
+    # Keep truncated tails so close_truncated_json can finish them
+    if end != -1 and _is_balanced(clean[:end + 1]):
+        clean = clean[:end + 1]
+    return clean
+
+
+def _is_balanced(text: str) -> bool:
+    stack, in_string, _ = _scan(text)
+    return not stack and not in_string
+
+
+def _scan(text: str):
+    """Return (unclosed brackets, inside_string, element boundaries) after scanning text."""
+    stack = []
+    boundaries = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+            boundaries.append(i + 1)
+        elif ch == ",":
+            boundaries.append(i)
+        elif ch in "}]" and stack:
+            stack.pop()
+    return stack, in_string, boundaries
+
+
+def _close(text: str) -> str:
+    stack, in_string, _ = _scan(text)
+    if in_string:
+        if text.endswith("\\"):
+            text = text[:-1]
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    for opener in reversed(stack):
+        text += "}" if opener == "{" else "]"
+    return text
+
+
+def close_truncated_json(text: str, max_cuts: int = 64) -> str:
+    """Close an output that was cut off mid-object (e.g. by the output token limit).
+
+    If the tail is a dangling key or half-written value, cut back to the last
+    complete element before closing the open brackets.
+    """
+    stack, in_string, boundaries = _scan(text)
+    if not stack and not in_string:
+        return text
+    for end in [len(text)] + boundaries[::-1][:max_cuts]:
+        candidate = _close(text[:end])
+        try:
+            json.loads(candidate)
+            return candidate
+        except json.JSONDecodeError:
+            continue
+    return _close(text)
+
+
+def loads_lenient(text: str) -> Optional[Any]:
+    """json.loads with progressively more aggressive local repairs. Returns None if unrecoverable."""
+    if not text:
+        return None
+    candidate = extract_json_text(text)
+    repairs = (
+        lambda s: s,
+        lambda s: _TRAILING_COMMA.sub(r"\1", s),
+        fix_escapes,
+        close_truncated_json,
+    )
+    # Repairs are cumulative: each step also keeps the previous fixes
+    for repair in repairs:
+        candidate = repair(candidate)
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", candidate))
+    except json.JSONDecodeError:
+        return None
+
+
+def repair_structured_output(raw_text: str, schema: Type[BaseModel]) -> Optional[BaseModel]:
+    """Recover a schema instance from a malformed model response without re-generating it."""
+    data = loads_lenient(raw_text)
+    if data is None:
+        return None
+    if isinstance(data, list):
+        # Some responses drop the wrapper object and return only the list field
+        list_fields = [name for name, f in schema.model_fields.items() if f.is_required()]
+        if len(list_fields) == 1:
+            data = {list_fields[0]: data}
+    try:
+        return schema.model_validate(data)
+    except ValidationError as e:
+        logger.warning("Structured output repair failed: %d validation errors", e.error_count())
+        return None
@@ -0,0 +1,101 @@
+from typing import Any
+from pydantic import BaseModel, Field, model_validator
+
+OPTION_LETTERS = "ABCDEFGH"
+
+# 1. Lesson schema (used by /tutor)
+class LessonStep(BaseModel):
+    narration: str = Field("", description="Conversational, explaining the 'why'")
+    board: str = Field("", description="Academic content. Use LaTeX inside $$")
+
+    @model_validator(mode="before")
+    @classmethod
+    def _coerce(cls, data: Any):
+        # A bare string step is treated as narration only
+        if isinstance(data, str):
+            return {"narration": data, "board": ""}
+        if isinstance(data, dict):
+            return {k: ("" if v is None else str(v)) for k, v in data.items() if k in ("narration", "board")}
+        return data
+
+
+class LessonPhase(BaseModel):
+    phase_name: str = Field(
+        description="One of: 1. Concept (Analogy), 2. Toolkit (Formulas), 3. Simple Example, 4. Complex Example, 5. Summary"
+    )
+    steps: list[LessonStep] = Field(default_factory=list, description="Ordered narration/board steps")
+    source: str = Field("", description="The exact pages and source the info was gotten from")
+
+    @model_validator(mode="before")
+    @classmethod
+    def _coerce(cls, data: Any):
+        if isinstance(data, dict):
+            data = dict(data)
+            data.setdefault("phase_name", "Lesson")
+            if data.get("source") is None:
+                data["source"] = ""
+            if isinstance(data.get("steps"), (str, dict)):
+                data["steps"] = [data["steps"]]
+            if isinstance(data.get("steps"), list):
+                data["steps"] = [s for s in data["steps"] if isinstance(s, (str, dict))]
+        return data
+
+
+class Lesson(BaseModel):
+    topic_title: str = Field("", description="Topic Name")
+    lesson_phases: list[LessonPhase] = Field(description="The five lesson phases in order")
+
+    @model_validator(mode="before")
+    @classmethod
+    def _coerce(cls, data: Any):
+        # Drop phases that are not objects instead of failing the whole lesson
+        if isinstance(data, dict) and isinstance(data.get("lesson_phases"), list):
+            data = dict(data)
+            data["lesson_phases"] = [p for p in data["lesson_phases"] if isinstance(p, dict)]
+        return data
+
+
+# 2. Quiz schema (used by /quizes)
+class Flashcard(BaseModel):
+    question: str = Field(description="Question text")
+    options: list[str] = Field(description="Exactly 4 answer options")
+    answer: str = Field(description="Correct option letter (A, B, C or D)")
+
+    @model_validator(mode="before")
+    @classmethod
+    def _normalize_answer(cls, data: Any):
+        if not isinstance(data, dict):
+            return data
+        data = dict(data)
+        options = [str(o) for o in data.get("options") or [] if o is not None]
+        data["options"] = options
+        answer = str(data.get("answer") or "").strip()
+        # Accept "B", "b)", "B. text", or the full option text
+        if answer[:1].upper() in OPTION_LETTERS[:len(options)] and (len(answer) == 1 or not answer[1].isalnum()):
+            answer = answer[0].upper()
+        elif answer in options:
+            answer = OPTION_LETTERS[options.index(answer)]
+        data["answer"] = answer
+        return data
+
+
+class FlashcardSet(BaseModel):
+    topic_title: str = Field("", description="Topic Name")
+    flashcards: list[Flashcard] = Field(description="Multiple choice questions")
+
+    @model_validator(mode="before")
+    @classmethod
+    def _drop_invalid_cards(cls, data: Any):
+        # Keep every usable card rather than rejecting the set over one bad item
+        if isinstance(data, dict) and isinstance(data.get("flashcards"), list):
+            data = dict(data)
+            cards = []
+            for card in data["flashcards"]:
+                try:
+                    card = Flashcard.model_validate(card)
+                except Exception:
+                    continue
+                if card.question and len(card.options) >= 2 and card.answer in OPTION_LETTERS[:len(card.options)]:
+                    cards.append(card)
+            data["flashcards"] = cards
+        return data
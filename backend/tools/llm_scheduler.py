@@ -0,0 +1,295 @@
+"""
+Central admission control for Gemini chat and embedding calls.
+
+Every chat model in tools/model.py is built with `rate_limiter=chat_scheduler`,
+so each call (direct invoke, structured output, outline agent turns) waits here
+before it is sent. Embeddings go through ScheduledEmbeddings.
+
+- Request and token budgets: token buckets refilled at RPM/60 and TPM/60 per
+  second. Request cost is taken on admission, token cost is charged after the
+  response from its usage_metadata (so long prompts slow later admissions).
+- Priority classes: "interactive" (/tutor, /quizes, /chatbot) is always admitted
+  before "bulk" (uploads, outline map/reduce, pre-generation), and bulk may not
+  dip into the last BULK_RESERVE fraction of either bucket.
+- Per-user fair queuing: within a class, waiting users are served round-robin,
+  so one user's large upload can't starve another's.
+- Adaptive backoff: a 429 / quota error halves the admission rate and pauses
+  new admissions with exponential backoff; successes recover the rate slowly.
+
+Budgets are per deployment: with N worker processes (uvicorn --workers, else
+WEB_CONCURRENCY; see worker_count) each worker admits its 1/N share.
+
+Priority and user come from ContextVars set by the HTTP middleware and the
+endpoints (asyncio.to_thread copies them into worker threads). Admission is
+also the cancellation checkpoint: a call whose request has passed its deadline
+or lost its client (tools/deadline.py) raises RequestCancelled instead of being
+sent, including while it waits in the queue.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.rate_limiters import BaseRateLimiter
+from tools import deadline
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+llm_priority: ContextVar[str] = ContextVar("llm_priority", default=BULK)
+llm_user: ContextVar[str] = ContextVar("llm_user", default="anonymous")
+
+# Fraction of each bucket only interactive traffic may use
+BULK_RESERVE = float(os.getenv("LLM_BULK_RESERVE", "0.25"))
+MIN_RATE_SCALE = 0.05
+MAX_BACKOFF_SECONDS = 60.0
+
+
+def worker_count(argv: List[str] = None) -> int:
+    """
+    Worker processes sharing the provider quota, found the way uvicorn finds
+    them: its --workers option, else WEB_CONCURRENCY. uvicorn's workers are
+    spawned with the server's command line, so they see the option too.
+    """
+    argv = sys.argv if argv is None else argv
+    program = argv[0] if argv else ""
+    if os.path.basename(program).startswith("uvicorn") or os.path.basename(os.path.dirname(program)) == "uvicorn":
+        for i, arg in enumerate(argv[1:], 1):
+            if arg == "--workers" and i + 1 < len(argv):
+                return max(1, int(argv[i + 1]))
+            if arg.startswith("--workers="):
+                return max(1, int(arg.split("=", 1)[1]))
+    return max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+
+# Number of worker processes sharing the provider quota
+WORKERS = worker_count()
+
+
+def set_llm_user(user_id: str) -> None:
+    """Attribute model calls made from the current request/task to a user (for fair queuing)."""
+    llm_user.set(user_id or "anonymous")
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    text = f"{type(error).__name__} {error}".lower()
+    return "429" in text or "resource_exhausted" in text or "resourceexhausted" in text or "quota" in text
+
+
+class LLMScheduler(BaseRateLimiter):
+    """Priority-aware, per-user fair token-bucket admission control."""
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float = 0, burst_seconds: float = 2.0):
+        self.name = name
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.request_capacity = max(1.0, requests_per_minute / 60 * burst_seconds)
+        self.token_capacity = tokens_per_minute / 60 * burst_seconds * 10 if tokens_per_minute else 0
+        self._requests = self.request_capacity
+        self._tokens = self.token_capacity
+        self._last_refill = time.monotonic()
+        self._rate_scale = 1.0
+        self._paused_until = 0.0
+        self._consecutive_429 = 0
+        self._cond = threading.Condition()
+        self._tickets = itertools.count()
+        # priority -> user -> deque of waiting tickets (OrderedDict order = round-robin order)
+        self._waiting: Dict[str, "OrderedDict[str, deque]"] = {p: OrderedDict() for p in PRIORITIES}
+        self.stats = {
+            "admitted_interactive": 0,
+            "admitted_bulk": 0,
+            "wait_seconds_interactive": 0.0,
+            "wait_seconds_bulk": 0.0,
+            "rate_limited": 0,
+            "waiting": 0,
+            "rate_scale": 1.0,
+        }
+
+    # --- bucket bookkeeping (call with self._cond held) ---
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        scale = self._rate_scale
+        if self.rpm:
+            self._requests = min(self.request_capacity, self._requests + elapsed * self.rpm / 60 * scale)
+        if self.tpm:
+            self._tokens = min(self.token_capacity, self._tokens + elapsed * self.tpm / 60 * scale)
+
+    def _has_budget(self, priority: str, now: float) -> bool:
+        if now < self._paused_until:
+            return False
+        reserve = BULK_RESERVE if priority == BULK else 0.0
+        if self.rpm and self._requests < 1 + reserve * self.request_capacity:
+            return False
+        if self.tpm and self._tokens <= reserve * self.token_capacity:
+            return False
+        return True
+
+    def _next_ticket(self):
+        """(priority, user, ticket) that should be admitted next, or None."""
+        for priority in PRIORITIES:
+            queue = self._waiting[priority]
+            if queue:
+                user, tickets = next(iter(queue.items()))
+                return priority, user, tickets[0]
+        return None
+
+    def _wait_hint(self, now: float) -> float:
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.rpm and self._requests < 1:
+            return max(0.005, (1 - self._requests) / (self.rpm / 60 * self._rate_scale))
+        return 0.05
+
+    # --- BaseRateLimiter interface ---
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        priority = llm_priority.get()
+        priority = priority if priority in PRIORITIES else BULK
+        user = llm_user.get()
+        # Calls of a request that is past its deadline or lost its client are never sent
+        deadline.check(self.name)
+        start = time.monotonic()
+        with self._cond:
+            ticket = next(self._tickets)
+            self._waiting[priority].setdefault(user, deque()).append(ticket)
+            self.stats["waiting"] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    head = self._next_ticket()
+                    if head is not None and head[2] == ticket and self._has_budget(priority, now):
+                        break
+                    if not blocking:
+                        return False
+                    deadline.check(self.name)
+                    left = deadline.remaining()
+                    hint = self._wait_hint(now)
+                    self._cond.wait(timeout=hint if left is None else max(0.01, min(hint, left)))
+                if self.rpm:
+                    self._requests -= 1
+                self.stats[f"admitted_{priority}"] += 1
+                self.stats[f"wait_seconds_{priority}"] += time.monotonic() - start
+                return True
+            finally:
+                self._remove(priority, user, ticket)
+                self.stats["waiting"] -= 1
+                self._cond.notify_all()
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        # Waiting happens on a worker thread so the event loop keeps serving requests
+        return await asyncio.to_thread(self.acquire, blocking=blocking)
+
+    def _remove(self, priority: str, user: str, ticket: int):
+        queue = self._waiting[priority]
+        tickets = queue.get(user)
+        if tickets is None:
+            return
+        try:
+            tickets.remove(ticket)
+        except ValueError:
+            pass
+        # Round-robin: the user goes to the back of the line after each admission
+        queue.pop(user)
+        if tickets:
+            queue[user] = tickets
+
+    # --- feedback from responses ---
+
+    def charge_tokens(self, tokens: int):
+        if not self.tpm or not tokens:
+            return
+        with self._cond:
+            self._tokens -= tokens
+
+    def record_success(self):
+        with self._cond:
+            self._consecutive_429 = 0
+            self._rate_scale = min(1.0, self._rate_scale + 0.05)
+            self.stats["rate_scale"] = self._rate_scale
+
+    def record_rate_limited(self):
+        with self._cond:
+            self._consecutive_429 += 1
+            self._rate_scale = max(MIN_RATE_SCALE, self._rate_scale * 0.5)
+            backoff = min(MAX_BACKOFF_SECONDS, 0.5 * 2 ** (self._consecutive_429 - 1))
+            self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+            self.stats["rate_limited"] += 1
+            self.stats["rate_scale"] = self._rate_scale
+            self._cond.notify_all()
+        logger.warning("%s rate limited; backing off %.1fs (rate scale %.2f)", self.name, backoff, self._rate_scale)
+
+    def report(self) -> Dict:
+        return dict(self.stats)
+
+
+class SchedulerFeedback(BaseCallbackHandler):
+    """Feeds token usage and 429s from chat model calls back into a scheduler."""
+
+    def __init__(self, scheduler: LLMScheduler):
+        self.scheduler = scheduler
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                self.scheduler.charge_tokens(usage.get("total_tokens", 0))
+        self.scheduler.record_success()
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        if is_rate_limit_error(error):
+            self.scheduler.record_rate_limited()
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Wrap an Embeddings backend so every provider request is admitted by a scheduler."""
+
+    def __init__(self, inner: Embeddings, scheduler: LLMScheduler, batch_size: int = 100):
+        self.inner = inner
+        self.scheduler = scheduler
+        self.batch_size = batch_size
+
+    def _call(self, fn, texts: List[str], *args, **kwargs):
+        for _ in range(max(1, -(-len(texts) // self.batch_size))):
+            self.scheduler.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.scheduler.record_rate_limited()
+            raise
+        self.scheduler.charge_tokens(sum(len(t) for t in texts) // 4)
+        self.scheduler.record_success()
+        deadline.record_discarded(self.scheduler.name)
+        return result
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        return self._call(self.inner.embed_documents, texts, texts, **kwargs)
+
+    def embed_query(self, text: str, **kwargs) -> List[float]:
+        return self._call(self.inner.embed_query, [text], text, **kwargs)
+
+
+chat_scheduler = LLMScheduler(
+    "chat",
+    requests_per_minute=float(os.getenv("LLM_RPM", "300")) / WORKERS,
+    tokens_per_minute=float(os.getenv("LLM_TPM", "1000000")) / WORKERS,
+)
+embedding_scheduler = LLMScheduler(
+    "embeddings",
+    requests_per_minute=float(os.getenv("EMBED_RPM", "1500")) / WORKERS,
+    tokens_per_minute=float(os.getenv("EMBED_TPM", "0")) / WORKERS,
+)
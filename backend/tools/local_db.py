@@ -0,0 +1,27 @@
+import os
+import sqlite3
+import threading
+
+# Embedded database for server-side state (pre-generated lessons, caches, ...).
+# One file per deployment; safe to share between threads and worker processes.
+DB_PATH = os.getenv("SCAFFOLD_DB_PATH", os.path.join("scaffold_data", "scaffold.db"))
+
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's connection to the local database, creating it on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        if os.path.dirname(DB_PATH):
+            os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+
+def init_schema(ddl: str) -> None:
+    """Create the tables a module needs (idempotent CREATE ... IF NOT EXISTS statements)."""
+    get_connection().executescript(ddl)
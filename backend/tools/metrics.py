@@ -0,0 +1,153 @@
+"""
+Request instrumentation: per-endpoint / per-stage latency histograms, LLM token
+counters, retrieval hit counts and payload sizes, exposed in Prometheus format
+at GET /metrics.
+
+The current endpoint is carried in a ContextVar set by the HTTP middleware in
+app.py; asyncio.to_thread copies the context, so stages timed in worker threads
+are still attributed to the request that started them.
+"""
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="background")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+REQUEST_SECONDS = Histogram(
+    "scaffold_request_seconds", "End-to-end request latency", ["endpoint", "status"], buckets=LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "scaffold_stage_seconds", "Latency of one pipeline stage", ["endpoint", "stage"], buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "scaffold_llm_tokens", "LLM tokens by direction (input/output)", ["endpoint", "stage", "direction"]
+)
+RETRIEVAL_HITS = Histogram(
+    "scaffold_retrieval_hits", "Documents returned per vector search", ["endpoint"],
+    buckets=(0, 1, 2, 4, 8, 16, 32, 64),
+)
+PAYLOAD_BYTES = Histogram(
+    "scaffold_payload_bytes", "Payload sizes (responses, prompts, images, ingested text)", ["endpoint", "kind"],
+    buckets=SIZE_BUCKETS,
+)
+
+LLM_ROUTE_SECONDS = Histogram(
+    "scaffold_llm_route_seconds", "Latency of one model call per route (tools/model.py)", ["route", "model"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_ROUTE_CALLS = Counter(
+    "scaffold_llm_route_calls", "Model calls per route by outcome (ok/error)", ["route", "model", "outcome"]
+)
+LLM_ROUTE_COST = Counter(
+    "scaffold_llm_route_cost_usd", "Estimated model cost per route in USD", ["route", "model"]
+)
+LLM_ROUTE_CASCADES = Counter(
+    "scaffold_llm_route_cascades", "Calls retried on a route's stronger cascade model", ["route"]
+)
+LLM_ROUTE_HEDGES = Counter(
+    "scaffold_llm_route_hedges", "Backup calls sent for slow or failed model calls, by the attempt that won", ["route", "winner"]
+)
+REQUEST_PROFILES = Counter(
+    "scaffold_request_profiles", "Requests profiled on demand (tools/profiling.py)", ["endpoint", "trigger"]
+)
+CANCELLED_REQUESTS = Counter(
+    "scaffold_cancelled_requests", "Requests cancelled by their deadline or a client disconnect", ["endpoint", "reason"]
+)
+CANCELLED_WORK = Counter(
+    "scaffold_cancelled_work",
+    "Units of work (chat, embeddings, qdrant_upsert) skipped after their request was cancelled, "
+    "or finished and thrown away (discarded)", ["endpoint", "work", "outcome"]
+)
+CANCELLED_TOKENS = Counter(
+    "scaffold_cancelled_tokens", "Tokens of model calls that finished after their request was cancelled", ["endpoint"]
+)
+SUBTOPIC_INDEX_LOOKUPS = Counter(
+    "scaffold_subtopic_index_lookups",
+    "Retrievals served from the subtopic index (hit) or by vector search (unknown/stale/short)", ["outcome"]
+)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time a stage of the current request and log it at DEBUG level."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        endpoint = current_endpoint.get()
+        STAGE_SECONDS.labels(endpoint, stage).observe(elapsed)
+        logger.debug("stage=%s endpoint=%s seconds=%.3f", stage, endpoint, elapsed)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration measured piecewise (e.g. summed over a streamed file's pages)."""
+    STAGE_SECONDS.labels(current_endpoint.get(), stage).observe(seconds)
+
+
+def record_tokens(stage: str, message) -> None:
+    """Count input/output tokens from a LangChain AIMessage's usage_metadata, if present."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    endpoint = current_endpoint.get()
+    for direction in ("input", "output"):
+        tokens = usage.get(f"{direction}_tokens")
+        if tokens:
+            LLM_TOKENS.labels(endpoint, stage, direction).inc(tokens)
+
+
+def record_hits(count: int) -> None:
+    RETRIEVAL_HITS.labels(current_endpoint.get()).observe(count)
+
+
+def record_payload(kind: str, size: int) -> None:
+    PAYLOAD_BYTES.labels(current_endpoint.get(), kind).observe(size)
+
+
+class _StatsCollector:
+    """Expose a module's running-stats dict (e.g. pre-generation, image cache) as gauges."""
+
+    def __init__(self, prefix: str, source: Callable[[], Dict]):
+        self.prefix = prefix
+        self.source = source
+
+    def collect(self):
+        for key, value in self.source().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            yield GaugeMetricFamily(f"scaffold_{self.prefix}_{key}", f"{self.prefix} {key.replace('_', ' ')}", value=value)
+
+
+_stats_collectors = []
+
+
+def register_stats(prefix: str, source: Callable[[], Dict]) -> None:
+    collector = _StatsCollector(prefix, source)
+    _stats_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def render_latest():
+    """Return (body, content_type) for the /metrics endpoint.
+
+    With several worker processes, set PROMETHEUS_MULTIPROC_DIR (an empty
+    directory) so histograms and counters are aggregated across workers; the
+    register_stats gauges then only cover the worker serving the scrape.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in _stats_collectors:
+            registry.register(collector)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
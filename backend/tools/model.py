@@ -1,15 +1,249 @@
+"""
+Chat models per workload route.
 
-# from langchain.chat_models import init_chat_model
+Each workload class (outline map scans, outline reduce, lessons, quizzes, chat,
+chat-memory upkeep) has a route: a model, temperature, max output tokens and
+timeout, plus an optional stronger `cascade` model that callers retry on when
+the route's answer fails validation, and an optional `hedge` percentile after
+which a slow call gets a backup request (tools/hedging.py). Call sites ask for `chat_model(route)` and
+run the call inside `use_route(route)`, which attributes its latency, outcome
+and estimated cost to the route in /metrics and GET /models/routes.
 
+Routes are overridden with MODEL_ROUTES (a JSON object, or MODEL_ROUTES_FILE
+naming a JSON file) mapping route names to the fields to change, e.g.
+  MODEL_ROUTES='{"outline_map": {"model": "gemini-2.0-flash-lite"}, "lesson": {"cascade": null}}'
+Prices per million tokens come from MODEL_PRICES in the same format.
+"""
 import dotenv
 dotenv.load_dotenv()
 
-
+import json
+import logging
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_google_genai import ChatGoogleGenerativeAI
+from tools.deadline import CancelledWorkCallback
+from tools.llm_scheduler import SchedulerFeedback, chat_scheduler
+from tools.metrics import LLM_ROUTE_CALLS, LLM_ROUTE_CASCADES, LLM_ROUTE_COST, LLM_ROUTE_HEDGES, LLM_ROUTE_SECONDS
+from tools.offline import OFFLINE, FakeChatModel
+
+logger = logging.getLogger(__name__)
+
+# Recent call latencies kept per route, and how many a hedge percentile needs
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "200"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+
+@dataclass(frozen=True)
+class Route:
+    model: str
+    temperature: float
+    max_output_tokens: int
+    timeout: float
+    cascade: Optional[str] = None
+    # Percentile of the route's recent latencies after which a backup request is sent
+    hedge: Optional[float] = None
+
+
+DEFAULT_ROUTES: Dict[str, Route] = {
+    # Bulk topic scans over raw text: fastest tier, short answers
+    "outline_map": Route("gemini-2.5-flash-lite", 0.2, 2048, 60),
+    "outline_reduce": Route("gemini-2.5-flash-lite", 0.2, 8192, 120, cascade="gemini-2.5-flash"),
+    # Naming embedding clusters from representative chunks (OUTLINE_MODE=cluster)
+    "outline_names": Route("gemini-2.5-flash-lite", 0.2, 4096, 90, cascade="gemini-2.5-flash"),
+    "lesson": Route("gemini-2.5-flash-lite", 0.7, 8192, 90, cascade="gemini-2.5-flash", hedge=0.9),
+    "lesson_vision": Route("gemini-2.5-flash-lite", 0.7, 8192, 90, cascade="gemini-2.5-flash", hedge=0.9),
+    "quiz": Route("gemini-2.5-flash-lite", 0.7, 8192, 90, cascade="gemini-2.5-flash", hedge=0.9),
+    "chat": Route("gemini-2.5-flash-lite", 0.7, 2048, 60),
+    # Question condensing and rolling chat summaries
+    "chat_memory": Route("gemini-2.5-flash-lite", 0.0, 512, 30),
+}
+
+# USD per million input / output tokens
+DEFAULT_PRICES: Dict[str, Dict[str, float]] = {
+    "gemini-2.5-flash-lite": {"input": 0.10, "output": 0.40},
+    "gemini-2.0-flash-lite": {"input": 0.075, "output": 0.30},
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50},
+    "gemini-2.5-pro": {"input": 1.25, "output": 10.00},
+}
+
+
+def _json_setting(name: str) -> Dict:
+    path = os.getenv(f"{name}_FILE")
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    return json.loads(os.getenv(name) or "{}")
+
+
+def load_routes(overrides: Optional[Dict] = None) -> Dict[str, Route]:
+    """Default routes with MODEL_ROUTES (or `overrides`) applied; unknown routes or fields are errors."""
+    overrides = _json_setting("MODEL_ROUTES") if overrides is None else overrides
+    routes = dict(DEFAULT_ROUTES)
+    for name, fields in overrides.items():
+        if name not in routes:
+            raise ValueError(f"Unknown model route '{name}' (known: {', '.join(routes)})")
+        unknown = set(fields) - set(Route.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"Unknown field(s) {sorted(unknown)} for model route '{name}'")
+        routes[name] = replace(routes[name], **fields)
+    return routes
+
+
+ROUTES = load_routes()
+PRICES = {**DEFAULT_PRICES, **_json_setting("MODEL_PRICES")}
+
+current_route: ContextVar[str] = ContextVar("current_route", default="unrouted")
+
+
+@contextmanager
+def use_route(route: str):
+    """Attribute the model calls made inside the block to `route`."""
+    token = current_route.set(route)
+    try:
+        yield ROUTES[route]
+    finally:
+        current_route.reset(token)
+
+
+def _model_label(params: Dict[str, Any]) -> str:
+    name = params.get("model") or params.get("model_name") or params.get("_type") or "unknown"
+    return str(name).split("/")[-1]
+
+
+class RouteMetrics(BaseCallbackHandler):
+    """Records latency, outcome and estimated cost of every chat model call per route."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started: Dict[Any, tuple] = {}
+        self._recent: Dict[str, deque] = {}
+        self.totals: Dict[str, Dict[str, float]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, invocation_params=None, **kwargs: Any) -> None:
+        with self._lock:
+            self._started[run_id] = (current_route.get(), _model_label(invocation_params or {}), time.perf_counter())
+
+    def _finish(self, run_id, outcome: str, usage: Dict[str, int]):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        route, model_name, start = started
+        elapsed = time.perf_counter() - start
+        price = PRICES.get(model_name, {})
+        cost = (usage.get("input_tokens", 0) * price.get("input", 0.0)
+                + usage.get("output_tokens", 0) * price.get("output", 0.0)) / 1e6
+        LLM_ROUTE_SECONDS.labels(route, model_name).observe(elapsed)
+        LLM_ROUTE_CALLS.labels(route, model_name, outcome).inc()
+        LLM_ROUTE_COST.labels(route, model_name).inc(cost)
+        with self._lock:
+            totals = self._totals(route)
+            totals["calls"] += 1
+            totals["errors"] += outcome == "error"
+            totals["seconds"] += elapsed
+            totals["cost_usd"] += cost
+            totals["input_tokens"] += usage.get("input_tokens", 0)
+            totals["output_tokens"] += usage.get("output_tokens", 0)
+            if outcome == "ok":
+                self._recent.setdefault(route, deque(maxlen=HEDGE_WINDOW)).append(elapsed)
+
+    def on_llm_end(self, response, *, run_id, **kwargs: Any) -> None:
+        usage = {"input_tokens": 0, "output_tokens": 0}
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                for key in usage:
+                    usage[key] += metadata.get(key, 0)
+        self._finish(run_id, "ok", usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id, **kwargs: Any) -> None:
+        self._finish(run_id, "error", {})
+
+    def _totals(self, route: str) -> Dict[str, float]:
+        return self.totals.setdefault(route, {
+            "calls": 0, "errors": 0, "seconds": 0.0, "cost_usd": 0.0, "cascades": 0, "hedges": 0, "hedges_won": 0,
+            "input_tokens": 0, "output_tokens": 0,
+        })
+
+    def record_cascade(self, route: str):
+        LLM_ROUTE_CASCADES.labels(route).inc()
+        with self._lock:
+            self._totals(route)["cascades"] += 1
+
+    def record_hedge(self, route: str, winner: str):
+        LLM_ROUTE_HEDGES.labels(route, winner).inc()
+        with self._lock:
+            totals = self._totals(route)
+            totals["hedges"] += 1
+            totals["hedges_won"] += winner == "backup"
+
+    def latency_percentile(self, route: str, share: float) -> Optional[float]:
+        """The `share` percentile of the route's recent successful call latencies (None until HEDGE_MIN_SAMPLES)."""
+        with self._lock:
+            recent = sorted(self._recent.get(route, ()))
+        if len(recent) < max(1, HEDGE_MIN_SAMPLES):
+            return None
+        return recent[min(len(recent) - 1, int(share * len(recent)))]
+
+    def report(self) -> Dict:
+        with self._lock:
+            usage = {name: dict(totals) for name, totals in self.totals.items()}
+        return {
+            name: {**asdict(route), **usage.get(name, {})}
+            for name, route in ROUTES.items()
+        }
+
+
+route_metrics = RouteMetrics()
+
+# Every call waits for admission from the shared scheduler (priority, fairness, quota)
+_scheduling = dict(
+    rate_limiter=chat_scheduler,
+    callbacks=[SchedulerFeedback(chat_scheduler), route_metrics, CancelledWorkCallback()],
+)
+
+_models: Dict[tuple, Any] = {}
+_models_lock = threading.Lock()
 
+def chat_model(route: str, cascade: bool = False):
+    """The chat model for a route (or for its cascade tier); instances are shared between routes with the same settings."""
+    settings = ROUTES[route]
+    name = settings.cascade if cascade else settings.model
+    if name is None:
+        raise ValueError(f"Model route '{route}' has no cascade model")
+    # Offline: one local fake per model name (SCAFFOLD_OFFLINE=1, benchmarks and CI)
+    key = name if OFFLINE else (name, settings.temperature, settings.max_output_tokens, settings.timeout)
+    with _models_lock:
+        if OFFLINE and key not in _models:
+            _models[key] = FakeChatModel(
+                model_name=name,
+                latency=float(os.getenv("FAKE_MODEL_LATENCY", "0")),
+                cpu_seconds=float(os.getenv("FAKE_MODEL_CPU_MS", "0")) / 1000,
+                **_scheduling,
+            )
+        elif key not in _models:
+            # No client-side retries: they would skip admission, so a 429 reaches the
+            # scheduler's backoff (and the caller) instead of hammering the quota
+            _models[key] = ChatGoogleGenerativeAI(
+                model=name,
+                temperature=settings.temperature,
+                max_output_tokens=settings.max_output_tokens,
+                timeout=settings.timeout,
+                max_retries=0,
+                **_scheduling,
+            )
+        return _models[key]
 
-model = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite")
 
-# Vision-capable model for processing images
-vision_model = ChatGoogleGenerativeAI(model="gemini-2.5-flash-lite")
\ No newline at end of file
+# Default-route models for callers outside the routed workloads
+model = chat_model("chat")
+vision_model = chat_model("lesson_vision")
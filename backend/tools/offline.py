@@ -0,0 +1,305 @@
+"""
+Offline stand-ins for Gemini chat and embeddings.
+
+Enabled with SCAFFOLD_OFFLINE=1 (see tools/model.py and tools/embeddings.py) so the
+service, the benchmarks in scripts/ and CI can run without API keys or network access.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import CallbackManager
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult, LLMResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import PrivateAttr
+from tools.tokens import estimate_tokens
+import dotenv
+dotenv.load_dotenv()
+
+OFFLINE = os.getenv("SCAFFOLD_OFFLINE", "").lower() in ("1", "true", "yes")
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z0-9\-]{2,}")
+
+
+def _message_text(messages: List[BaseMessage]) -> str:
+    parts = []
+    for m in messages:
+        if isinstance(m.content, str):
+            parts.append(m.content)
+        else:
+            parts.extend(p.get("text", "") for p in m.content if isinstance(p, dict))
+    return "\n".join(parts)
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model that answers lesson, quiz, outline and chat prompts.
+
+    latency + per_token_latency * output_tokens simulates generation time;
+    cpu_seconds is spent busy (holding the GIL) per call, standing in for the
+    CPU-bound share of request handling in worker-scaling benchmarks.
+    malformed_rate is the fraction of free-text JSON answers that come back broken
+    (fences, trailing commas, bad escapes, truncation); truncated_rate applies even
+    under schema-constrained output, mirroring the output token limit.
+    structured_malformed_rate is the fraction of schema-constrained answers that
+    still fail to validate the way provider JSON modes do: raw LaTeX backslashes,
+    a trailing comma, a fenced answer with a preamble, or a renamed field.
+    Latency tails: jitter is the sigma of a lognormal factor on the delay, a
+    slow_rate share of calls takes slow_latency seconds longer, and an
+    error_rate share fails (like a 503) after its delay.
+    """
+
+    model_name: str = "fake-chat"
+    latency: float = 0.0
+    per_token_latency: float = 0.0
+    cpu_seconds: float = 0.0
+    malformed_rate: float = 0.0
+    truncated_rate: float = 0.0
+    structured_malformed_rate: float = 0.0
+    jitter: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    error_rate: float = 0.0
+    seed: Optional[int] = None
+    _rng: Any = PrivateAttr(default=None)
+    _tool_names: List[str] = PrivateAttr(default_factory=list)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name}
+
+    def bind_tools(self, tools, **kwargs):
+        bound = self.model_copy()
+        bound._rng = self._rng
+        bound._tool_names = [getattr(t, "name", getattr(t, "__name__", str(t))) for t in tools]
+        return bound
+
+    def _sleep_for(self, text: str):
+        if self.cpu_seconds > 0:
+            deadline = time.thread_time() + self.cpu_seconds
+            while time.thread_time() < deadline:
+                pass
+        delay = self.latency + self.per_token_latency * estimate_tokens(text)
+        if self.jitter > 0:
+            delay *= self._rng.lognormvariate(0.0, self.jitter)
+        if self.slow_rate > 0 and self._rng.random() < self.slow_rate:
+            delay += self.slow_latency
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate > 0 and self._rng.random() < self.error_rate:
+            raise RuntimeError(f"503 {self.model_name} is overloaded (offline fake)")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = _message_text(messages)
+        if "submit_outline" in self._tool_names and "submit_outline" in prompt and not isinstance(messages[-1], ToolMessage):
+            args = {"topics": _fake_topics(prompt)}
+            text = json.dumps(args)
+            message = AIMessage(content="", tool_calls=[{"name": "submit_outline", "args": args, "id": f"call_{uuid.uuid4().hex[:8]}"}])
+        else:
+            text = self._free_text(prompt)
+            message = AIMessage(content=text)
+        message.usage_metadata = {
+            "input_tokens": estimate_tokens(prompt),
+            "output_tokens": estimate_tokens(text),
+            "total_tokens": estimate_tokens(prompt) + estimate_tokens(text),
+        }
+        self._sleep_for(text)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _free_text(self, prompt: str) -> str:
+        if "lesson_phases" in prompt:
+            return self._maybe_break(json.dumps(_fake_lesson(prompt)))
+        if "flashcards" in prompt:
+            return self._maybe_break(json.dumps(_fake_quiz(prompt)))
+        words = _keywords(prompt, 12)
+        return "Key topics: " + ", ".join(words) if words else "No content."
+
+    def _maybe_break(self, text: str) -> str:
+        roll = self._rng.random()
+        if roll < self.truncated_rate:
+            return text[: int(len(text) * self._rng.uniform(0.6, 0.95))]
+        if roll < self.truncated_rate + self.malformed_rate:
+            kind = self._rng.randrange(3)
+            if kind == 0:
+                return text.replace("}]", "},]", 1)
+            if kind == 1:
+                return text.replace("Use \\\\sqrt", "Use \\sqrt", 1).replace('": "', '": "Say \\"hi\\" ', 1)
+            return "```json\n" + text.replace("]}", "],}", 1) + "\n```"
+        return text
+
+    def _break_structured(self, text: str) -> str:
+        kind = self._rng.randrange(4)
+        if kind == 0 and "\\\\" in text:
+            # LaTeX written with single backslashes: "\sqrt" is an invalid escape, "\frac" reads as a form feed
+            return text.replace("\\\\", "\\")
+        if kind <= 1:
+            return text.replace("}]", "},]", 1)
+        if kind == 2:
+            return "Here is the requested JSON:\n```json\n" + text + "\n```"
+        # Schema drift: a required list under another name, which no local repair recovers
+        return re.sub(r'"(lesson_phases|flashcards|clusters)"', r'"\1_list"', text, count=1)
+
+    def with_structured_output(self, schema, method: str = "json_schema", *, include_raw: bool = False, **kwargs):
+        """Mimic provider-side constrained decoding: output is schema-shaped JSON, but can
+        still be cut off by the output token limit or come back malformed."""
+
+        def _run(value):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(blocking=True)
+            messages = value.to_messages() if hasattr(value, "to_messages") else value
+            if isinstance(messages, str):
+                messages = [AIMessage(content=messages)]
+            # Report the call to the model's callbacks (scheduler feedback, route metrics) like a real one
+            run_manager = CallbackManager.configure(inheritable_callbacks=self.callbacks).on_chat_model_start(
+                {}, [messages], invocation_params=self._get_invocation_params()
+            )[0]
+            prompt = _message_text(messages)
+            fields = getattr(schema, "model_fields", {})
+            if "clusters" in fields:
+                text = json.dumps(_fake_cluster_names(prompt))
+            else:
+                text = json.dumps(_fake_quiz(prompt) if "flashcards" in fields else _fake_lesson(prompt))
+            roll = self._rng.random()
+            if roll < self.truncated_rate:
+                text = text[: int(len(text) * self._rng.uniform(0.6, 0.95))]
+            elif roll < self.truncated_rate + self.structured_malformed_rate:
+                text = self._break_structured(text)
+            raw = AIMessage(content=text)
+            raw.usage_metadata = {
+                "input_tokens": estimate_tokens(prompt),
+                "output_tokens": estimate_tokens(text),
+                "total_tokens": estimate_tokens(prompt) + estimate_tokens(text),
+            }
+            try:
+                self._sleep_for(text)
+            except Exception as e:
+                run_manager.on_llm_error(e)
+                raise
+            run_manager.on_llm_end(LLMResult(generations=[[ChatGeneration(message=raw)]]))
+            parsed, error = None, None
+            try:
+                parsed = schema.model_validate_json(text)
+            except Exception as e:
+                error = e
+                if not include_raw:
+                    raise
+            if include_raw:
+                return {"raw": raw, "parsed": parsed, "parsing_error": error}
+            return parsed
+
+        return RunnableLambda(_run)
+
+
+def _keywords(text: str, n: int) -> List[str]:
+    seen = {}
+    for w in _WORD.findall(text):
+        lw = w.lower()
+        if lw not in seen:
+            seen[lw] = w
+    return list(seen.values())[:n]
+
+
+def _context(prompt: str) -> str:
+    return prompt.split("Context:", 1)[-1]
+
+
+def _fake_lesson(prompt: str) -> dict:
+    words = _keywords(_context(prompt), 25) or ["concept"]
+    phases = ["Concept (Analogy)", "Toolkit (Formulas)", "Simple Example", "Complex Example", "Summary"]
+    return {
+        "topic_title": words[0].title(),
+        "lesson_phases": [
+            {
+                "phase_name": name,
+                "steps": [
+                    {
+                        "narration": f"Let's look at {words[(i + j) % len(words)]} and why it matters.",
+                        "board": f"$$\\frac{{{words[(i + j) % len(words)]}}}{{2}}$$ Use \\sqrt{{x}}",
+                    }
+                    for j in range(2)
+                ],
+                "source": "[Page 1]",
+            }
+            for i, name in enumerate(phases)
+        ],
+    }
+
+
+def _fake_quiz(prompt: str) -> dict:
+    match = re.search(r"Generate exactly (\d+)", prompt)
+    count = int(match.group(1)) if match else 5
+    words = _keywords(_context(prompt), 40) or ["concept"]
+    return {
+        "topic_title": words[0].title(),
+        "flashcards": [
+            {
+                "question": f"Which statement best describes {words[i % len(words)]}?",
+                "options": [f"{words[(i + k) % len(words)]} option" for k in range(4)],
+                "answer": "ABCD"[i % 4],
+            }
+            for i in range(count)
+        ],
+    }
+
+
+def _fake_topics(prompt: str) -> List[dict]:
+    words = _keywords(prompt.split("SUMMARIES", 1)[-1], 24) or ["General"]
+    return [
+        {"title": words[i].title(), "summary": f"Covers {words[i]}.", "subtopics": [w.title() for w in words[i + 1:i + 4]]}
+        for i in range(0, min(len(words), 16), 4)
+    ]
+
+
+def _fake_cluster_names(prompt: str) -> dict:
+    clusters = []
+    for number, block in re.findall(r"=== CLUSTER (\d+) [^\n]*\n(.*?)(?=\n=== CLUSTER |\Z)", prompt, re.S):
+        topic, *subclusters = re.split(r"\n  Subcluster \d+:", block)
+        words = _keywords(topic, 3) or ["General"]
+        clusters.append({
+            "cluster": int(number),
+            "title": " ".join(w.title() for w in words),
+            "summary": f"Covers {words[0]}.",
+            "subtopics": [" ".join(w.title() for w in _keywords(sub, 2)) or "Overview" for sub in subclusters],
+        })
+    return {"clusters": clusters}
+
+
+class HashingEmbeddings(Embeddings):
+    """Feature-hashed bag-of-words embeddings: deterministic, lexical, no network."""
+
+    def __init__(self, size: int = 768, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vec = [0.0] * self.size
+        for w in _WORD.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(w.encode(), digest_size=8).digest(), "little")
+            vec[h % self.size] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str, **kwargs) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
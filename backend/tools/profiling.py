@@ -0,0 +1,293 @@
+"""
+On-demand sampling profiler for single requests.
+
+When a request is slow in production, the profile of that request shows which
+Python code was hot. Examples are PDF extraction, base64 encoding, the
+splitter, JSON repair and the agent stream loop. A request is profiled when it
+carries `X-Profile: <PROFILE_TOKEN>`, or when it is drawn at PROFILE_SAMPLE_RATE
+(limited to the PROFILE_PATHS route templates when set). The middleware is
+only installed when one of the two is configured, so with profiling off
+requests pay nothing.
+
+While at least one profiled request is in flight, a sampler thread reads every
+thread's stack PROFILE_HZ times a second (sys._current_frames). The request's
+work runs on the event loop and on worker threads, so all busy threads are
+sampled. Idle pool workers and the event loop waiting in select are skipped.
+A sample also counts as on-CPU when the thread's CPU clock advanced since the
+previous sample. Samples go to every profile in flight, and a profile records
+how many requests overlapped it. Profiles are written to PROFILE_DIR as JSON:
+request metadata plus `wall` and `cpu` stacks in the collapsed format that
+flamegraph.pl and speedscope read. scripts/profile_report.py summarizes them.
+"""
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+from tools.local_db import DB_PATH
+from tools.metrics import REQUEST_PROFILES
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Route templates sampled requests are drawn from (empty: all); X-Profile works on every route
+PROFILE_PATHS = {p.strip() for p in os.getenv("PROFILE_PATHS", "").split(",") if p.strip()}
+PROFILE_HZ = float(os.getenv("PROFILE_HZ", "100"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(DB_PATH) or ".", "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "500"))
+# Sampling of one request stops after this long (its profile is still saved)
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "900"))
+
+PROFILING_ENABLED = bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+PROFILE_HEADER = b"x-profile"
+# Frames shown relative to these roots: the backend package and the installed libraries
+_BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+_LIBRARY_MARKERS = (os.sep + "site-packages" + os.sep, os.sep + "dist-packages" + os.sep)
+_THREAD_NUMBER = re.compile(r"[-_]?\d+")
+# Loops of pool threads that block on a queue between jobs
+_IDLE_LOOPS = (
+    ("_worker", os.path.join("concurrent", "futures", "thread.py")),
+    ("run", os.path.join("anyio", "_backends", "_asyncio.py")),
+)
+_WAIT_FILES = (os.sep + "queue.py", os.sep + "threading.py")
+
+
+def _short_path(path: str) -> str:
+    if path.startswith(_BACKEND_ROOT):
+        return path[len(_BACKEND_ROOT):]
+    for marker in _LIBRARY_MARKERS:
+        if marker in path:
+            return path.split(marker, 1)[1]
+    return os.path.basename(path)
+
+
+_labels: Dict[object, str] = {}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+        _labels[code] = label
+    return label
+
+
+def _thread_group(name: str) -> str:
+    """Thread name without its number ("asyncio_3" -> "asyncio", "Thread-2 (run)" -> "Thread (run)")."""
+    return _THREAD_NUMBER.sub("", name) or name
+
+
+def _is_idle(frame) -> bool:
+    """A pool worker waiting for its next job, or the event loop waiting for I/O."""
+    code = frame.f_code
+    if code.co_name == "select" and code.co_filename.endswith("selectors.py"):
+        return True
+    # Skip the queue and lock frames of the wait (SimpleQueue.get has none)
+    while frame is not None and frame.f_code.co_filename.endswith(_WAIT_FILES):
+        frame = frame.f_back
+    if frame is None:
+        return False
+    code = frame.f_code
+    return any(code.co_name == name and code.co_filename.endswith(path) for name, path in _IDLE_LOOPS)
+
+
+def _stack(frame) -> Optional[list]:
+    """Frame labels from the thread's root to the running frame, or None for an idle thread."""
+    if _is_idle(frame):
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class RequestProfile:
+    """Samples and metadata of one profiled request."""
+
+    def __init__(self, endpoint: str, scope: dict, trigger: str):
+        self.profile_id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.metadata = {
+            "profile_id": self.profile_id,
+            "endpoint": endpoint,
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "trigger": trigger,
+            "started_at": self.started_at,
+            "hz": PROFILE_HZ,
+            "pid": os.getpid(),
+        }
+        self.wall: Counter = Counter()
+        self.cpu: Counter = Counter()
+        self.samples = 0
+        self.max_concurrent_requests = 0
+
+    def save(self, status: Optional[int]) -> str:
+        self.metadata.update({
+            "status": status,
+            "seconds": round(time.perf_counter() - self.start, 3),
+            "samples": self.samples,
+            "max_concurrent_requests": self.max_concurrent_requests,
+        })
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(self.started_at))
+        slug = self.metadata["endpoint"].strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        path = os.path.join(PROFILE_DIR, f"{stamp}-{slug}-{self.profile_id}.json")
+        with open(path, "w") as f:
+            json.dump({"metadata": self.metadata, "wall": dict(self.wall), "cpu": dict(self.cpu)}, f)
+        _prune()
+        return path
+
+
+def _prune():
+    files = sorted(f for f in os.listdir(PROFILE_DIR) if f.endswith(".json"))
+    for name in files[:max(0, len(files) - PROFILE_MAX_FILES)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+class Sampler:
+    """One background thread that samples all threads while any profile is active."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active: Dict[str, RequestProfile] = {}
+        self._thread: Optional[threading.Thread] = None
+        self.in_flight = 0  # requests in flight through the profiling middleware
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._active[profile.profile_id] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: RequestProfile):
+        with self._lock:
+            self._active.pop(profile.profile_id, None)
+
+    def _run(self):
+        interval = 1.0 / PROFILE_HZ
+        cpu_clocks: Dict[int, float] = {}
+        while True:
+            with self._lock:
+                now = time.perf_counter()
+                profiles = [p for p in self._active.values() if now - p.start < PROFILE_MAX_SECONDS]
+                if not self._active:
+                    self._thread = None
+                    return
+            if profiles:
+                self._sample(profiles, cpu_clocks)
+            time.sleep(interval)
+
+    def _sample(self, profiles, cpu_clocks: Dict[int, float]):
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        wall, cpu = Counter(), Counter()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = _stack(frame)
+            if stack is None:
+                continue
+            key = ";".join([_thread_group(names.get(ident, "thread"))] + stack)
+            wall[key] += 1
+            if self._on_cpu(ident, cpu_clocks):
+                cpu[key] += 1
+        with self._lock:
+            # A profile removed meanwhile is being saved and takes no more samples
+            for profile in profiles:
+                if profile.profile_id not in self._active:
+                    continue
+                profile.samples += 1
+                profile.max_concurrent_requests = max(profile.max_concurrent_requests, self.in_flight)
+                profile.wall.update(wall)
+                profile.cpu.update(cpu)
+
+    @staticmethod
+    def _on_cpu(ident: int, cpu_clocks: Dict[int, float]) -> bool:
+        """Whether the thread used CPU since the previous sample (per-thread CPU clock)."""
+        try:
+            used = time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except (AttributeError, OSError):
+            return False
+        previous = cpu_clocks.get(ident)
+        cpu_clocks[ident] = used
+        return previous is not None and used > previous
+
+
+sampler = Sampler()
+
+
+def _trigger(scope: dict, endpoint: str) -> Optional[str]:
+    if PROFILE_TOKEN:
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER:
+                return "header" if hmac.compare_digest(value.decode("latin-1"), PROFILE_TOKEN) else None
+    if PROFILE_SAMPLE_RATE > 0 and (not PROFILE_PATHS or endpoint in PROFILE_PATHS):
+        if random.random() < PROFILE_SAMPLE_RATE:
+            return "sampled"
+    return None
+
+
+class RequestProfilerMiddleware:
+    """
+    ASGI middleware that profiles requests selected by the X-Profile header or
+    the sample rate, and answers them with an X-Profile-Id header.
+    """
+
+    def __init__(self, app, label: Callable[[dict], str]):
+        self.app = app
+        self.label = label
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        sampler.in_flight += 1
+        try:
+            endpoint = self.label(scope)
+            trigger = _trigger(scope, endpoint)
+            if trigger is None:
+                return await self.app(scope, receive, send)
+            await self._profiled(scope, receive, send, endpoint, trigger)
+        finally:
+            sampler.in_flight -= 1
+
+    async def _profiled(self, scope, receive, send, endpoint: str, trigger: str):
+        profile = RequestProfile(endpoint, scope, trigger)
+        status = {"code": None}
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message = {**message, "headers": [
+                    *message.get("headers", []), (b"x-profile-id", profile.profile_id.encode()),
+                ]}
+            await send(message)
+
+        sampler.add(profile)
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            sampler.remove(profile)
+            path = profile.save(status["code"])
+            REQUEST_PROFILES.labels(endpoint, trigger).inc()
+            logger.info(
+                "profiled request endpoint=%s trigger=%s samples=%d path=%s",
+                endpoint, trigger, profile.samples, path,
+            )
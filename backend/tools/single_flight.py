@@ -0,0 +1,101 @@
+"""
+Single-flight coalescing for expensive generation requests.
+
+Concurrent callers with the same key share one in-flight computation: the
+first caller (leader) starts it, later callers (followers) await the same
+result or exception. Nothing is cached once the computation finishes.
+
+The computation runs in its own task with its own request budget (see
+tools/deadline.py), so a leader whose client disconnects or times out does not
+cancel the work the followers are waiting on. It is cancelled once every
+caller waiting for it has gone, and its key is released at that moment, so a
+request arriving while the cancellation unwinds starts a new computation
+instead of joining the dying one.
+"""
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Dict, Hashable
+
+from tools.deadline import DISCONNECT, RequestBudget, request_budget
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text) -> str:
+    """Case- and whitespace-insensitive form of a request field."""
+    return re.sub(r"\s+", " ", str(text or "").strip().lower())
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self._budgets: Dict[asyncio.Task, RequestBudget] = {}
+        self.stats = {
+            "leaders": 0,
+            "coalesced": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "in_flight": 0,
+        }
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable]):
+        """Return factory()'s result, sharing it with concurrent calls for the same key.
+
+        Callers get the same result object and must not mutate it.
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            self.stats["leaders"] += 1
+            budget = RequestBudget()
+
+            async def shared():
+                # Bounded by its callers' deadlines instead of the leader's
+                request_budget.set(budget)
+                return await factory()
+
+            task = asyncio.create_task(shared())
+            self._in_flight[key] = task
+            self._budgets[task] = budget
+            self.stats["in_flight"] = len(self._in_flight)
+            task.add_done_callback(lambda t, key=key: self._finish(key, t))
+        else:
+            self.stats["coalesced"] += 1
+            logger.debug("%s coalesced duplicate request", self.name)
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters.get(task) == 1:
+                # The last caller left: stop the work nobody is waiting for
+                logger.info("%s cancelling generation without callers", self.name)
+                self._budgets[task].cancel(DISCONNECT)
+                task.cancel()
+                self._release(key, task)
+            raise
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
+
+    def _release(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        self.stats["in_flight"] = len(self._in_flight)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        self._release(key, task)
+        self._waiters.pop(task, None)
+        self._budgets.pop(task, None)
+        if task.cancelled():
+            self.stats["cancelled"] += 1
+        elif task.exception() is not None:
+            self.stats["failed"] += 1
+
+    def report(self) -> Dict:
+        total = self.stats["leaders"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "coalesced_rate": self.stats["coalesced"] / total if total else 0.0,
+        }
@@ -0,0 +1,213 @@
+"""
+Registry of every source (PDF file, YouTube video) ingested for a user.
+
+For each source it records the content hash, the embedding model and the Qdrant
+point IDs of its chunks. Point IDs are derived from the chunk content, so
+re-ingesting a source gives unchanged chunks the same ID: only new or edited
+chunks are embedded, and only chunks that disappeared are deleted.
+
+A file's source ID is its name plus a prefix of the hash of the content it was
+first uploaded with ("notes.pdf@3f2a9c01d4e5"). Uploading the same content
+again finds the existing source; a different file with the same name (another
+course's notes.pdf) becomes a source of its own. Only an explicit replace
+(PUT /sources/{source_id}) puts new content under an existing source ID.
+"""
+import hashlib
+import json
+import re
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+from langchain_core.documents import Document
+from tools.embeddings import EMBEDDING_MODEL
+from tools.local_db import get_connection, init_schema
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    user_id TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    embedding_model TEXT NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (user_id, source_id)
+);
+CREATE TABLE IF NOT EXISTS source_chunks (
+    user_id TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    point_id TEXT NOT NULL,
+    PRIMARY KEY (user_id, source_id, point_id)
+);
+"""
+_schema_ready = False
+
+# Fixed namespace so point IDs are stable across processes and deployments
+_POINT_NAMESPACE = uuid.UUID("3c1f9a5e-2b7d-4f61-9e0a-6d8b4c2a7f15")
+# Metadata that differs between uploads of identical content
+_VOLATILE_METADATA = ("source", "user_id")
+# Hex digits of the content hash in a file's source ID
+_ID_HASH_CHARS = 12
+_FILE_SOURCE_ID = re.compile(rf"(.+)@[0-9a-f]{{{_ID_HASH_CHARS}}}")
+
+
+def _db():
+    global _schema_ready
+    if not _schema_ready:
+        init_schema(_SCHEMA)
+        _schema_ready = True
+    return get_connection()
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_hash(chunk: Document) -> str:
+    metadata = {k: v for k, v in chunk.metadata.items() if k not in _VOLATILE_METADATA}
+    return text_hash(chunk.page_content + "\x00" + json.dumps(metadata, sort_keys=True, default=str))
+
+
+def list_sources(user_id: str) -> List[Dict]:
+    rows = _db().execute(
+        "SELECT source_id, kind, content_hash, embedding_model, chunk_count, updated_at "
+        "FROM sources WHERE user_id = ? ORDER BY source_id",
+        (user_id,),
+    ).fetchall()
+    keys = ("source_id", "kind", "content_hash", "embedding_model", "chunk_count", "updated_at")
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def get_source(user_id: str, source_id: str) -> Optional[Dict]:
+    return next((s for s in list_sources(user_id) if s["source_id"] == source_id), None)
+
+
+def source_name(source_id: str) -> str:
+    """The file name in a file's source ID (IDs recorded before they were content-scoped are bare names)."""
+    match = _FILE_SOURCE_ID.fullmatch(source_id)
+    return match.group(1) if match else source_id
+
+
+def file_source_id(user_id: str, filename: str, content_hash: str) -> str:
+    """The user's source holding this file name and content, or a new ID for it."""
+    rows = _db().execute(
+        "SELECT source_id FROM sources WHERE user_id = ? AND kind = 'file' AND content_hash = ? ORDER BY source_id",
+        (user_id, content_hash),
+    ).fetchall()
+    for (source_id,) in rows:
+        if source_name(source_id) == filename:
+            return source_id
+    return f"{filename}@{content_hash[:_ID_HASH_CHARS]}"
+
+
+def is_current(user_id: str, source_id: str, content_hash: str) -> bool:
+    """True when this exact content is already indexed with the current embedding model."""
+    row = _db().execute(
+        "SELECT content_hash, embedding_model FROM sources WHERE user_id = ? AND source_id = ?",
+        (user_id, source_id),
+    ).fetchone()
+    return row is not None and row == (content_hash, EMBEDDING_MODEL)
+
+
+def point_ids(user_id: str, source_id: str) -> Set[str]:
+    rows = _db().execute(
+        "SELECT point_id FROM source_chunks WHERE user_id = ? AND source_id = ?", (user_id, source_id)
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def record_source(user_id: str, source_id: str, kind: str, content_hash: str, ids: List[str]) -> None:
+    """Replace a source's registry entry and chunk list in one transaction."""
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute(
+            "INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (user_id, source_id, kind, content_hash, EMBEDDING_MODEL, len(ids), time.time()),
+        )
+        db.execute("DELETE FROM source_chunks WHERE user_id = ? AND source_id = ?", (user_id, source_id))
+        db.executemany(
+            "INSERT OR IGNORE INTO source_chunks VALUES (?, ?, ?)",
+            [(user_id, source_id, point_id) for point_id in ids],
+        )
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+
+def forget_source(user_id: str, source_id: str) -> None:
+    db = _db()
+    db.execute("DELETE FROM sources WHERE user_id = ? AND source_id = ?", (user_id, source_id))
+    db.execute("DELETE FROM source_chunks WHERE user_id = ? AND source_id = ?", (user_id, source_id))
+
+
+def forget_user(user_id: Optional[str]) -> None:
+    """Drop a user's registry (None: every user's)."""
+    db = _db()
+    for table in ("sources", "source_chunks"):
+        if user_id is None:
+            db.execute(f"DELETE FROM {table}")
+        else:
+            db.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+
+
+def relabel_embedding_model(model: str) -> int:
+    """Mark every source as embedded with `model` (after a re-embedding migration kept its point IDs)."""
+    return _db().execute("UPDATE sources SET embedding_model = ?", (model,)).rowcount
+
+
+class SourceDiff:
+    """
+    Compares a source's new chunks with its indexed points while the chunks stream by.
+
+    `admit(chunk)` assigns the chunk its deterministic point ID and returns it
+    when the chunk must be embedded, or None when an identical chunk is already
+    indexed. After the last chunk, `stale()` lists the points to delete.
+    """
+
+    def __init__(self, user_id: str, source_id: str, kind: str, content_hash: str):
+        self.user_id = user_id
+        self.source_id = source_id
+        self.kind = kind
+        self.content_hash = content_hash
+        record = get_source(user_id, source_id)
+        # Vectors from another embedding model cannot be kept
+        reusable = record is not None and record["embedding_model"] == EMBEDDING_MODEL
+        self.existing = point_ids(user_id, source_id) if reusable else set()
+        self.previous = point_ids(user_id, source_id) if record else set()
+        self.ids: List[str] = []
+        self._occurrences: Counter = Counter()
+        self.kept = 0
+        self.added = 0
+
+    def admit(self, chunk: Document) -> Optional[str]:
+        chunk.metadata["source_id"] = self.source_id
+        digest = chunk_hash(chunk)
+        # Identical chunks within a source get distinct IDs
+        self._occurrences[digest] += 1
+        point_id = str(uuid.uuid5(
+            _POINT_NAMESPACE, f"{self.user_id}\x00{self.source_id}\x00{digest}\x00{self._occurrences[digest]}"
+        ))
+        self.ids.append(point_id)
+        if point_id in self.existing:
+            self.kept += 1
+            return None
+        self.added += 1
+        return point_id
+
+    def stale(self) -> List[str]:
+        return sorted(self.previous - set(self.ids))
+
+    def commit(self) -> None:
+        record_source(self.user_id, self.source_id, self.kind, self.content_hash, self.ids)
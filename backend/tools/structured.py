@@ -0,0 +1,58 @@
+"""
+Schema-constrained generation on a model route, shared by lessons, quizzes
+and cluster outline names.
+
+Invalid answers are repaired locally (tools/json_repair.py) instead of
+regenerated; slow calls are hedged (tools/hedging.py); answers still invalid
+or incomplete are generated again on the route's cascade model.
+"""
+import logging
+
+from tools.hedging import hedged_call
+from tools.json_repair import repair_structured_output
+from tools.metrics import record_tokens, timed
+from tools.model import chat_model, route_metrics, use_route
+
+logger = logging.getLogger(__name__)
+
+
+def _structured_attempt(llm, messages, schema, stage: str):
+    """Schema-constrained generation; invalid responses are repaired locally instead of regenerated."""
+    structured_llm = llm.with_structured_output(schema, method="json_schema", include_raw=True)
+    with timed(stage):
+        result = structured_llm.invoke(messages)
+    record_tokens(stage, result.get("raw"))
+    if result.get("parsed") is not None:
+        return result["parsed"]
+    raw = result.get("raw")
+    raw_text = raw.text if raw is not None else ""
+    logger.warning("structured output did not validate (%s), repairing locally", type(result.get("parsing_error")).__name__)
+    with timed("json_repair"):
+        return repair_structured_output(raw_text, schema)
+
+
+def _is_usable(parsed) -> bool:
+    """A parsed answer counts as valid when every list it has (phases, flashcards) is non-empty."""
+    if parsed is None:
+        return False
+    return all(value for value in parsed.__dict__.values() if isinstance(value, list))
+
+
+def generate_structured(route: str, messages, schema, stage: str, is_complete=_is_usable, fallback=None):
+    """
+    Structured generation on a route. A slow call is hedged with a backup
+    request, `fallback()` when given (tools/hedging.py). Answers that are
+    invalid even after local repair, or that `is_complete` rejects (a lesson
+    missing phases, a quiz short of questions after a truncated answer), are
+    generated again on the route's cascade model when it has one.
+    """
+    with use_route(route) as settings:
+        usable = lambda parsed: parsed is not None and is_complete(parsed)
+        parsed = hedged_call(
+            route, lambda: _structured_attempt(chat_model(route), messages, schema, stage), fallback, usable
+        )
+        if usable(parsed) or not settings.cascade:
+            return parsed
+        logger.warning("route=%s answer invalid or incomplete, cascading to %s", route, settings.cascade)
+        route_metrics.record_cascade(route)
+        return _structured_attempt(chat_model(route, cascade=True), messages, schema, f"{stage}_cascade")
@@ -0,0 +1,156 @@
+"""
+Subtopic index: the chunks each outline subtopic retrieves, looked up once.
+
+Once an outline exists its subtopics are fixed, and every /tutor and /quizes
+request for one of them would otherwise embed the same `topic: X, subtopic: Y`
+text and run the same filtered vector search. Right after the outline is
+created or merged, all of its subtopic queries are embedded in one batch and
+searched in one round trip, and the best point IDs of each are stored with the
+user's corpus version. Requests for a known subtopic then fetch their chunks by
+ID. Entries built against an older corpus are not used; `refresh` rebuilds
+them after sources are added, replaced or removed.
+
+Entries belong to a course: a new outline version replaces that course's
+entries only, so one user's courses don't evict each other. Retrieval is per
+user, so two courses sharing a subtopic text share its chunks.
+"""
+import json
+import logging
+import os
+import time
+from typing import List, Optional
+
+from langchain_core.documents import Document
+from tools.local_db import get_connection, init_schema
+from tools.metrics import SUBTOPIC_INDEX_LOOKUPS
+from tools.single_flight import normalize_text
+from tools.vector_store import corpus_version, get_documents_for_user, search_batch_for_user
+
+logger = logging.getLogger(__name__)
+
+# Point IDs kept per subtopic: /tutor uses 4, a quiz quiz_retrieval_k(n) (8 up to 5 questions)
+SUBTOPIC_INDEX_K = int(os.getenv("SUBTOPIC_INDEX_K", "16"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS course_subtopic_index (
+    user_id TEXT NOT NULL,
+    course_id TEXT NOT NULL,
+    query_key TEXT NOT NULL,
+    query TEXT NOT NULL,
+    point_ids TEXT NOT NULL,
+    corpus_version TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, course_id, query_key)
+);
+CREATE INDEX IF NOT EXISTS course_subtopic_index_query ON course_subtopic_index (user_id, query_key);
+"""
+_schema_ready = False
+
+
+def _db():
+    global _schema_ready
+    if not _schema_ready:
+        init_schema(_SCHEMA)
+        _schema_ready = True
+    return get_connection()
+
+
+def outline_queries(outline) -> List[str]:
+    """The lesson and quiz request texts of an outline, in the format the course pages send."""
+    if hasattr(outline, "model_dump"):
+        outline = outline.model_dump()
+    queries = []
+    for topic in (outline or {}).get("topics", []):
+        title = topic.get("title", "")
+        subtopics = topic.get("subtopics") or []
+        if subtopics:
+            queries.extend(f"topic: {title}, subtopic: {sub}" for sub in subtopics)
+        else:
+            queries.append(f"topic: {title} (cover all subtopics comprehensively)")
+    return queries
+
+
+def _search(user_id: str, queries: List[str]):
+    """(query_key, query, point_ids, corpus_version, created_at) for each query, from one batched search."""
+    version = corpus_version(user_id)
+    results = search_batch_for_user(queries, user_id, SUBTOPIC_INDEX_K) if queries else []
+    now = time.time()
+    return [
+        (normalize_text(query), query, json.dumps([str(d.metadata["_id"]) for d in docs]), version, now)
+        for query, docs in zip(queries, results)
+    ]
+
+
+def _transaction(statements) -> None:
+    db = _db()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for sql, rows in statements:
+            db.executemany(sql, rows)
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+
+def build(user_id: str, course_id: str, outline) -> int:
+    """Index every subtopic of a course's new or merged outline, replacing that course's previous entries."""
+    rows = _search(user_id, list(dict.fromkeys(outline_queries(outline))))
+    _transaction([
+        ("DELETE FROM course_subtopic_index WHERE user_id = ? AND course_id = ?", [(user_id, course_id)]),
+        ("INSERT INTO course_subtopic_index VALUES (?, ?, ?, ?, ?, ?, ?)",
+         [(user_id, course_id, *row) for row in rows]),
+    ])
+    logger.info("indexed subtopics=%d course=%s user=%s", len(rows), course_id, user_id)
+    return len(rows)
+
+
+def forget(user_id: str, course_id: str) -> None:
+    """Drop a deleted course's entries."""
+    _transaction([("DELETE FROM course_subtopic_index WHERE user_id = ? AND course_id = ?", [(user_id, course_id)])])
+
+
+def refresh(user_id: str) -> int:
+    """Re-index the user's subtopics whose entries predate the current corpus."""
+    stale = _db().execute(
+        "SELECT DISTINCT query FROM course_subtopic_index WHERE user_id = ? AND corpus_version != ?",
+        (user_id, corpus_version(user_id)),
+    ).fetchall()
+    if not stale:
+        return 0
+    rows = _search(user_id, [query for (query,) in stale])
+    _transaction([(
+        "UPDATE course_subtopic_index SET point_ids = ?, corpus_version = ?, created_at = ? "
+        "WHERE user_id = ? AND query_key = ?",
+        [(point_ids, version, now, user_id, key) for key, _, point_ids, version, now in rows],
+    )])
+    logger.info("re-indexed subtopics=%d user=%s", len(rows), user_id)
+    return len(rows)
+
+
+def lookup(user_id: str, text: str, k: int) -> Optional[List[Document]]:
+    """
+    The top `k` chunks for an indexed subtopic, fetched by ID, or None when the
+    text is not an indexed subtopic, its entry is stale or holds fewer than
+    `k` IDs, or some of its chunks are gone.
+    """
+    row = _db().execute(
+        "SELECT point_ids, corpus_version FROM course_subtopic_index WHERE user_id = ? AND query_key = ? "
+        "ORDER BY created_at DESC LIMIT 1",
+        (user_id, normalize_text(text)),
+    ).fetchone()
+    if row is None:
+        outcome = "unknown"
+    elif row[1] != corpus_version(user_id):
+        outcome = "stale"
+    else:
+        point_ids = json.loads(row[0])
+        # Fewer IDs than were asked for at build time means the search returned the whole corpus
+        complete = len(point_ids) >= k or len(point_ids) < SUBTOPIC_INDEX_K
+        wanted = point_ids[:k] if complete else []
+        documents = get_documents_for_user(wanted, user_id) if wanted else []
+        outcome = "hit" if documents and len(documents) == len(wanted) else "short"
+    SUBTOPIC_INDEX_LOOKUPS.labels(outcome).inc()
+    logger.debug("subtopic index %s k=%d user=%s", outcome, k, user_id)
+    return documents if outcome == "hit" else None
+
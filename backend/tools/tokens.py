@@ -0,0 +1,3 @@
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars per token), good enough for budgets and metrics."""
+    return max(1, len(text) // 4) if text else 0
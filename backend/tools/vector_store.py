@@ -1,90 +1,219 @@
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, Filter, FieldCondition, MatchValue, PointsSelector, FilterSelector
+from qdrant_client.models import Distance, VectorParams, Filter, FieldCondition, MatchAny, MatchValue, PointsSelector, FilterSelector, PointIdsList, QueryRequest, PayloadSchemaType
+from qdrant_client.models import CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
 from langchain_qdrant import QdrantVectorStore
 from langchain_core.documents import Document
-from tools.embeddings import embeddings
-from typing import List
+from tools.embeddings import embeddings, embedding_size, EMBEDDING_MODEL
+from tools.offline import OFFLINE
+from tools.metrics import timed, record_hits, record_payload
+from tools.local_db import get_connection, init_schema
+from tools import deadline, source_registry
+from typing import List, Optional, Tuple
+import logging
 import os
+import re
+import threading
 import dotenv
 dotenv.load_dotenv()
 
-# Collection name constant
+logger = logging.getLogger(__name__)
+
+# Name the app reads and writes. New deployments create it as an alias of a
+# model-specific collection so a re-embedding migration can switch it atomically.
 COLLECTION_NAME = "test"
 
-# 1. Initialize ONLY the Cloud Client
-client = QdrantClient(
-    url=os.getenv("QdrantClient_url"), 
-    api_key=os.getenv("QdrantClient_api_key")
-)
-
-# 2. Get vector size dynamically
-# Fixed size for Gemini Embeddings - avoids startup API call failure
-vector_size = 768 
-
-# 3. Create or recreate the collection ON THE CLOUD
-# Check if existing collection has wrong dimensions and recreate if needed
-needs_recreate = False
-if client.collection_exists(COLLECTION_NAME):
-    collection_info = client.get_collection(COLLECTION_NAME)
-    existing_size = collection_info.config.params.vectors.size
-    if existing_size != vector_size:
-        print(f"⚠️ Collection has {existing_size} dimensions but embeddings are {vector_size}. Recreating...")
-        needs_recreate = True
-    else:
-        print(f"Collection '{COLLECTION_NAME}' already exists on Cloud.")
-else:
-    needs_recreate = True
-    print(f"Creating collection '{COLLECTION_NAME}' on Cloud...")
-
-if needs_recreate:
-    if client.collection_exists(COLLECTION_NAME):
-        client.delete_collection(COLLECTION_NAME)
-    client.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
+# Payload layout of a stored chunk; passed to QdrantVectorStore so reads and writes agree
+CONTENT_KEY = "page_content"
+METADATA_KEY = "metadata"
+
+# Vector size of the configured embedding model (768 for text-embedding-004)
+vector_size = embedding_size(EMBEDDING_MODEL)
+
+# Per-worker client and store, created by connect() (from the app lifespan, or
+# lazily on first use in scripts) so nothing network-bound is shared across a fork
+_client = None
+_vector_store = None
+_connect_lock = threading.Lock()
+
+
+def _create_client() -> QdrantClient:
+    if os.getenv("QdrantClient_path"):
+        # Embedded on-disk Qdrant (single process: scripts, local development)
+        return QdrantClient(path=os.getenv("QdrantClient_path"))
+    if OFFLINE and not os.getenv("QdrantClient_url"):
+        # In-process Qdrant for offline runs (benchmarks, CI)
+        return QdrantClient(location=":memory:")
+    return QdrantClient(
+        url=os.getenv("QdrantClient_url"), 
+        api_key=os.getenv("QdrantClient_api_key")
     )
-    print(f"✅ Collection '{COLLECTION_NAME}' created with {vector_size} dimensions.")
-
-# 4. Initialize Vector Store using the SAME client
-vector_store = QdrantVectorStore(
-    client=client,
-    collection_name=COLLECTION_NAME,
-    embedding=embeddings,
-)
-
-# 5. Create payload index for user_id filtering (required by Qdrant for filtered searches)
-try:
-    from qdrant_client.models import PayloadSchemaType
-    client.create_payload_index(
-        collection_name=COLLECTION_NAME,
-        field_name="metadata.user_id",
-        field_schema=PayloadSchemaType.KEYWORD,
+
+
+def collection_for_alias(client: QdrantClient, alias: str) -> Optional[str]:
+    """Collection an alias points to, or None when `alias` is not an alias."""
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def physical_collection_name(model: str) -> str:
+    """Collection that holds COLLECTION_NAME's vectors for one embedding model."""
+    return f"{COLLECTION_NAME}__{re.sub(r'[^A-Za-z0-9]+', '_', model.split('/')[-1]).strip('_')}"
+
+
+def create_collection(client: QdrantClient, name: str, size: int):
+    """Create a collection with the payload indexes user/source filtering needs."""
+    client.create_collection(
+        collection_name=name,
+        vectors_config=VectorParams(size=size, distance=Distance.COSINE)
     )
-    print("✅ Created payload index for metadata.user_id")
-except Exception as e:
-    # Index might already exist
-    if "already exists" not in str(e).lower():
-        print(f"⚠️ Payload index warning: {e}")
+    logger.info("Collection '%s' created with %s dimensions.", name, size)
+    create_payload_indexes(client, name)
+
+
+def create_payload_indexes(client: QdrantClient, name: str):
+    # Create payload indexes for user_id/source_id filtering (required by Qdrant for filtered searches)
+    for field_name in ("metadata.user_id", "metadata.source_id"):
+        try:
+            client.create_payload_index(
+                collection_name=name,
+                field_name=field_name,
+                field_schema=PayloadSchemaType.KEYWORD,
+            )
+            logger.info("Created payload index for %s", field_name)
+        except Exception as e:
+            # Index might already exist
+            if "already exists" not in str(e).lower():
+                logger.warning("Payload index warning: %s", e)
+
+
+def switch_alias(client: QdrantClient, alias: str, collection: str):
+    """Point `alias` at `collection` in one atomic alias update."""
+    operations = []
+    if collection_for_alias(client, alias) is not None:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=operations)
 
-print("Vector Store successfully connected to Cloud!")
+
+def _ensure_collection(client: QdrantClient):
+    """Create COLLECTION_NAME on first start; never drop existing vectors."""
+    if client.collection_exists(COLLECTION_NAME):
+        collection_info = client.get_collection(COLLECTION_NAME)
+        existing_size = collection_info.config.params.vectors.size
+        if existing_size != vector_size:
+            # Recreating the collection would silently delete every user's documents
+            raise RuntimeError(
+                f"Collection '{COLLECTION_NAME}' has {existing_size}-dimensional vectors but "
+                f"{EMBEDDING_MODEL} produces {vector_size}. Re-embed it with "
+                f"scripts/migrate_embeddings.py --model {EMBEDDING_MODEL}."
+            )
+        logger.info("Collection '%s' already exists on Cloud.", COLLECTION_NAME)
+        create_payload_indexes(client, collection_for_alias(client, COLLECTION_NAME) or COLLECTION_NAME)
+        return
+    logger.info("Creating collection '%s' on Cloud...", COLLECTION_NAME)
+    physical = physical_collection_name(EMBEDDING_MODEL)
+    if not client.collection_exists(physical):
+        create_collection(client, physical, vector_size)
+    switch_alias(client, COLLECTION_NAME, physical)
+
+
+def connect():
+    """Create this worker's Qdrant client and make sure the collection exists (idempotent)."""
+    global _client, _vector_store
+    with _connect_lock:
+        if _client is not None:
+            return
+        client = _create_client()
+        _ensure_collection(client)
+        # Vector store uses the SAME client
+        _vector_store = QdrantVectorStore(
+            client=client,
+            collection_name=COLLECTION_NAME,
+            embedding=embeddings,
+            content_payload_key=CONTENT_KEY,
+            metadata_payload_key=METADATA_KEY,
+        )
+        _client = client
+        logger.info("Vector Store successfully connected to Cloud!")
+
+
+def close():
+    """Close this worker's Qdrant client (app shutdown)."""
+    global _client, _vector_store
+    with _connect_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _vector_store = None
+
+
+def get_client() -> QdrantClient:
+    connect()
+    return _client
+
+
+def get_vector_store() -> QdrantVectorStore:
+    connect()
+    return _vector_store
 
 
 # ============================================
 # USER-SCOPED VECTOR STORE FUNCTIONS
 # ============================================
 
-def add_documents_for_user(documents: List[Document], user_id: str) -> List[str]:
+# Bumped whenever a user's documents change, so cached/coalesced results
+# computed against an older corpus are never reused. Kept in the local database
+# so every worker process sees the same version; "*" is bumped by clear_collection.
+_CORPUS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS corpus_versions (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+_corpus_schema_ready = False
+
+
+def _corpus_db():
+    global _corpus_schema_ready
+    if not _corpus_schema_ready:
+        init_schema(_CORPUS_SCHEMA)
+        _corpus_schema_ready = True
+    return get_connection()
+
+
+def corpus_version(user_id: str) -> str:
+    """Identity of a user's current corpus (changes on every add/delete)."""
+    rows = dict(_corpus_db().execute(
+        "SELECT user_id, version FROM corpus_versions WHERE user_id IN (?, '*')", (user_id,)
+    ).fetchall())
+    return f"{rows.get('*', 0)}.{rows.get(user_id, 0)}"
+
+
+def _bump_corpus_version(user_id: str):
+    _corpus_db().execute(
+        "INSERT INTO corpus_versions VALUES (?, 1) ON CONFLICT(user_id) DO UPDATE SET version = version + 1",
+        (user_id,),
+    )
+
+def add_documents_for_user(documents: List[Document], user_id: str, ids: Optional[List[str]] = None) -> List[str]:
     """
     Add documents to vector store with user_id in metadata for isolation.
-    Each document's metadata is updated to include the user_id.
+    Each document's metadata is updated to include the user_id. Points with
+    the given `ids` (see tools/source_registry) are overwritten in place.
     """
     for doc in documents:
         if doc.metadata is None:
             doc.metadata = {}
         doc.metadata["user_id"] = user_id
     
-    document_ids = vector_store.add_documents(documents=documents)
-    print(f"✅ Added {len(documents)} documents for user: {user_id}")
+    record_payload("ingest_text", sum(len(doc.page_content) for doc in documents))
+    deadline.check("qdrant_upsert")
+    with timed("embed_upsert"):
+        document_ids = get_vector_store().add_documents(documents=documents, ids=ids)
+    _bump_corpus_version(user_id)
+    logger.info("added documents=%d user=%s", len(documents), user_id)
     return document_ids
 
 
@@ -102,15 +231,117 @@ def search_for_user(query: str, user_id: str, k: int = 4) -> List[Document]:
         ]
     )
     
-    results = vector_store.similarity_search(
-        query=query,
-        k=k,
-        filter=user_filter
+    with timed("embed_query"):
+        vector = embeddings.embed_query(query)
+    with timed("qdrant_search"):
+        results = get_vector_store().similarity_search_by_vector(
+            embedding=vector,
+            k=k,
+            filter=user_filter
+        )
+    record_hits(len(results))
+    logger.debug("search hits=%d k=%d user=%s", len(results), k, user_id)
+    return results
+
+
+def _document_from_point(point) -> Document:
+    """A stored chunk as a Document, with its point ID in metadata["_id"] like the vector store's searches."""
+    payload = point.payload or {}
+    metadata = dict(payload.get(METADATA_KEY) or {})
+    metadata["_id"] = point.id
+    metadata["_collection_name"] = COLLECTION_NAME
+    return Document(page_content=payload.get(CONTENT_KEY) or "", metadata=metadata)
+
+
+def search_batch_for_user(queries: List[str], user_id: str, k: int = 4) -> List[List[Document]]:
+    """
+    Run many user-scoped searches at once: one batched embedding call and
+    one Qdrant query_batch_points round trip instead of a search per query.
+    """
+    if not queries:
+        return []
+    user_filter = Filter(
+        must=[
+            FieldCondition(
+                key="metadata.user_id",
+                match=MatchValue(value=user_id)
+            )
+        ]
     )
-    print(f"🔍 Found {len(results)} documents for user: {user_id}")
+    with timed("embed_query"):
+        vectors = embeddings.embed_documents(queries, task_type="RETRIEVAL_QUERY")
+    with timed("qdrant_search"):
+        responses = get_client().query_batch_points(
+            collection_name=COLLECTION_NAME,
+            requests=[
+                QueryRequest(query=vector, filter=user_filter, limit=k, with_payload=True)
+                for vector in vectors
+            ],
+        )
+    results = [
+        [
+            _document_from_point(point)
+            for point in response.points
+        ]
+        for response in responses
+    ]
+    for r in results:
+        record_hits(len(r))
+    logger.debug("batch search queries=%d hits=%d user=%s", len(queries), sum(len(r) for r in results), user_id)
     return results
 
 
+def get_documents_for_user(point_ids: List[str], user_id: str) -> List[Document]:
+    """Chunks by point ID, in the given order; IDs that no longer exist or belong to another user are skipped."""
+    if not point_ids:
+        return []
+    with timed("qdrant_retrieve"):
+        points = get_client().retrieve(COLLECTION_NAME, ids=point_ids, with_payload=True, with_vectors=False)
+    by_id = {str(point.id): point for point in points}
+    documents = []
+    for point_id in point_ids:
+        point = by_id.get(str(point_id))
+        if point is None or (point.payload.get(METADATA_KEY) or {}).get("user_id") != user_id:
+            continue
+        documents.append(_document_from_point(point))
+    record_hits(len(documents))
+    return documents
+
+
+def scroll_vectors_for_user(
+    user_id: str, source_ids: Optional[List[str]] = None, max_points: int = 0
+) -> Tuple[List[List[float]], List[Document]]:
+    """
+    Stored vectors and chunks of a user's sources (all of them when source_ids
+    is None). With max_points, every n-th point is kept so at most about that
+    many come back, spread evenly over the corpus.
+    """
+    must = [FieldCondition(key="metadata.user_id", match=MatchValue(value=user_id))]
+    if source_ids is not None:
+        must.append(FieldCondition(key="metadata.source_id", match=MatchAny(any=list(source_ids))))
+    user_filter = Filter(must=must)
+    client = get_client()
+    total = client.count(COLLECTION_NAME, count_filter=user_filter, exact=True).count
+    stride = max(1, -(-total // max_points)) if max_points else 1
+    vectors, documents, offset, seen = [], [], None, 0
+    with timed("qdrant_scroll"):
+        while True:
+            points, offset = client.scroll(
+                COLLECTION_NAME, scroll_filter=user_filter, limit=512, offset=offset,
+                with_payload=True, with_vectors=True,
+            )
+            for point in points:
+                if seen % stride == 0:
+                    vector = point.vector
+                    vectors.append(next(iter(vector.values())) if isinstance(vector, dict) else vector)
+                    documents.append(_document_from_point(point))
+                seen += 1
+            if offset is None:
+                break
+    logger.debug("scrolled points=%d kept=%d user=%s", seen, len(documents), user_id)
+    return vectors, documents
+
+
 def delete_user_documents(user_id: str) -> bool:
     """
     Delete all documents belonging to a specific user.
@@ -126,17 +357,50 @@ def delete_user_documents(user_id: str) -> bool:
     )
     
     try:
-        client.delete(
+        get_client().delete(
             collection_name=COLLECTION_NAME,
             points_selector=FilterSelector(filter=user_filter)
         )
-        print(f"🗑️ Deleted all documents for user: {user_id}")
+        source_registry.forget_user(user_id)
+        _bump_corpus_version(user_id)
+        logger.info("Deleted all documents for user: %s", user_id)
         return True
     except Exception as e:
-        print(f"❌ Error deleting documents for user {user_id}: {e}")
+        logger.error("Error deleting documents for user %s: %s", user_id, e)
         return False
 
 
+def delete_points_for_user(point_ids: List[str], user_id: str) -> None:
+    """Delete specific points (e.g. chunks that disappeared from a re-ingested source)."""
+    if not point_ids:
+        return
+    with timed("qdrant_delete"):
+        get_client().delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=PointIdsList(points=point_ids),
+        )
+    _bump_corpus_version(user_id)
+    logger.info("deleted points=%d user=%s", len(point_ids), user_id)
+
+
+def delete_source_documents(user_id: str, source_id: str) -> int:
+    """Delete one source's chunks and its registry entry; returns the number of registered chunks."""
+    registered = source_registry.point_ids(user_id, source_id)
+    source_filter = Filter(
+        must=[
+            FieldCondition(key="metadata.user_id", match=MatchValue(value=user_id)),
+            FieldCondition(key="metadata.source_id", match=MatchValue(value=source_id)),
+        ]
+    )
+    # Every chunk carries its source_id, including any a failed ingest left unregistered
+    with timed("qdrant_delete"):
+        get_client().delete(collection_name=COLLECTION_NAME, points_selector=FilterSelector(filter=source_filter))
+    source_registry.forget_source(user_id, source_id)
+    _bump_corpus_version(user_id)
+    logger.info("Deleted source %s (%d chunks) for user: %s", source_id, len(registered), user_id)
+    return len(registered)
+
+
 def clear_collection() -> bool:
     """
     Delete ALL documents from the collection.
@@ -145,13 +409,16 @@ def clear_collection() -> bool:
     """
     try:
         # Delete and recreate collection to clear all data
-        client.delete_collection(collection_name=COLLECTION_NAME)
-        client.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
-        )
-        print(f"🗑️ Cleared entire collection: {COLLECTION_NAME}")
+        client = get_client()
+        physical = collection_for_alias(client, COLLECTION_NAME) or COLLECTION_NAME
+        client.delete_collection(collection_name=physical)
+        create_collection(client, physical, vector_size)
+        if physical != COLLECTION_NAME:
+            switch_alias(client, COLLECTION_NAME, physical)
+        source_registry.forget_user(None)
+        _bump_corpus_version("*")
+        logger.info("Cleared entire collection: %s", COLLECTION_NAME)
         return True
     except Exception as e:
-        print(f"❌ Error clearing collection: {e}")
+        logger.error("Error clearing collection: %s", e)
         return False
\ No newline at end of file
@@ -15,13 +15,16 @@ export async function POST(request: NextRequest) {
     const urls = formData.get("urls")
     const userId = formData.get("user_id")
     const existingOutline = formData.get("existing_outline")
+    const courseId = formData.get("course_id")
+    const baseVersion = formData.get("base_version")
 
     if (!userId || typeof userId !== "string") {
       return NextResponse.json({ error: "user_id is required" }, { status: 400 })
     }
 
-    if (!existingOutline || typeof existingOutline !== "string") {
-      return NextResponse.json({ error: "existing_outline is required" }, { status: 400 })
+    const hasCourseId = typeof courseId === "string" && courseId !== ""
+    if (!hasCourseId && (!existingOutline || typeof existingOutline !== "string")) {
+      return NextResponse.json({ error: "course_id or existing_outline is required" }, { status: 400 })
     }
 
     const externalFormData = new FormData()
@@ -37,7 +40,14 @@ export async function POST(request: NextRequest) {
       externalFormData.append("urls", urls)
     }
     externalFormData.append("user_id", userId)
-    externalFormData.append("existing_outline", existingOutline)
+    if (hasCourseId) {
+      externalFormData.append("course_id", courseId as string)
+      if (typeof baseVersion === "string" && baseVersion) {
+        externalFormData.append("base_version", baseVersion)
+      }
+    } else {
+      externalFormData.append("existing_outline", existingOutline as string)
+    }
 
     console.log("[v0] Updating outline for user:", userId)
 
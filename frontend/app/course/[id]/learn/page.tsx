@@ -519,6 +519,8 @@ export default function LearnPage() {
                             <img
                               src={src}
                               alt={`Slide image ${idx + 1}`}
+                              loading="lazy"
+                              decoding="async"
                               className="w-full h-full object-contain max-h-48 sm:max-h-64"
                             />
                           </div>
@@ -21,6 +21,8 @@ export function ChatPanel({ initialMessages = [], onMessagesChange, userId }: Ch
   const [input, setInput] = useState("")
   const [isLoading, setIsLoading] = useState(false)
   const scrollRef = useRef<HTMLDivElement>(null)
+  // One server-side conversation per mounted panel
+  const sessionIdRef = useRef<string>(crypto.randomUUID())
 
   useEffect(() => {
     // If we have initial messages, use them.
@@ -67,7 +69,7 @@ export function ChatPanel({ initialMessages = [], onMessagesChange, userId }: Ch
     setIsLoading(true)
 
     try {
-      const response = await sendChatMessage(input.trim(), userId)
+      const response = await sendChatMessage(input.trim(), userId, sessionIdRef.current)
       const assistantMessage: Message = {
         id: (Date.now() + 1).toString(),
         role: "assistant",
@@ -6,6 +6,9 @@ export interface TopicResponse {
     summary: string
     subtopics: string[]
   }[]
+  // Server-side course the outline is stored as, and its version
+  course_id?: string
+  version?: number
 }
 
 export interface TutorResponse {
@@ -17,8 +20,11 @@ export interface TutorResponse {
       board: string
     }[]
     source: string
+    image_ids?: string[]
     images?: string[]
   }[]
+  // Image ID -> backend path, each image listed once for the whole lesson
+  images?: Record<string, string>
 }
 
 export interface QuizResponse {
@@ -88,7 +94,15 @@ export async function updateOutline(
       formData.append("urls", urls.join(","))
     }
     formData.append("user_id", userId)
-    formData.append("existing_outline", JSON.stringify(existingOutline))
+    if (existingOutline.course_id) {
+      // The server merges into its stored copy; the version guards against overwriting a newer one
+      formData.append("course_id", existingOutline.course_id)
+      if (existingOutline.version !== undefined) {
+        formData.append("base_version", existingOutline.version.toString())
+      }
+    } else {
+      formData.append("existing_outline", JSON.stringify(existingOutline))
+    }
 
     const response = await fetch(`${BASE_URL}/update_outline`, {
       method: "POST", // You likely need this
@@ -129,10 +143,24 @@ export async function getTutorContent(
       throw new Error(`Tutor request failed: ${response.statusText}`)
     }
 
-    return response.json()
+    return withImageUrls(await response.json())
   })
 }
 
+// Resolve each phase's image IDs to cacheable backend URLs (older responses inline data URLs per phase)
+function withImageUrls(lesson: TutorResponse): TutorResponse {
+  const images = lesson.images ?? {}
+  return {
+    ...lesson,
+    lesson_phases: lesson.lesson_phases.map((phase) => ({
+      ...phase,
+      images: phase.image_ids
+        ? phase.image_ids.filter((id) => images[id]).map((id) => `${BASE_URL}${images[id]}`)
+        : phase.images,
+    })),
+  }
+}
+
 // Get quiz for a submodule or module - using local API route
 export async function getQuiz(
   moduleTitle: string, 
@@ -176,8 +204,56 @@ export async function getQuiz(
   })
 }
 
-// Chat with AI - using local API route
-export async function sendChatMessage(message: string, userId: string): Promise<string> {
+export interface BatchQuizResult {
+  index: number
+  topic: string
+  status: number
+  quiz?: QuizResponse
+  detail?: string
+}
+
+// Generate quizzes for a whole course in one job - direct to backend (streams NDJSON)
+export async function getCourseQuizzes(
+  outline: TopicResponse,
+  userId: string,
+  onResult: (result: BatchQuizResult) => void,
+  questionCount: number = 5
+): Promise<void> {
+  const response = await fetch(`${BASE_URL}/quizes/batch`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({
+      outline,
+      user_id: userId,
+      question_count: questionCount,
+    }),
+  })
+
+  if (!response.ok || !response.body) {
+    throw new Error(`Batch quiz request failed: ${response.statusText}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffered = ""
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffered += decoder.decode(value, { stream: true })
+    const lines = buffered.split("\n")
+    buffered = lines.pop() ?? ""
+    for (const line of lines) {
+      if (line.trim()) onResult(JSON.parse(line))
+    }
+  }
+  if (buffered.trim()) onResult(JSON.parse(buffered))
+}
+
+// Chat with AI - using local API route. Messages with the same sessionId share
+// server-side history, so only the new message needs to be sent.
+export async function sendChatMessage(message: string, userId: string, sessionId?: string): Promise<string> {
   return withRetry(async () => {
     const response = await fetch("/api/chat", {
       method: "POST",
@@ -187,6 +263,7 @@ export async function sendChatMessage(message: string, userId: string): Promise<
       body: JSON.stringify({
         text: message,
         user_id: userId,
+        session_id: sessionId,
       }),
     })
 
@@ -29,7 +29,7 @@ export interface LessonPhase {
   phase_name: string
   steps: LessonStep[]
   source: string
-  images?: string[] // Optional images (data URLs) attached to the slide
+  images?: string[] // Optional image URLs attached to the slide (data URLs in older lessons)
 }
 
 export interface QuizQuestion {